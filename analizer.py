@@ -7,19 +7,68 @@ from scipy.ndimage import gaussian_filter1d as gf
 from scipy.optimize import curve_fit, fsolve, nnls
 from scipy.signal import savgol_filter as sgf
 
+from configuration import DirBoundary
+
 if sys.platform == "darwin":
     mpl.use("macosx")
 
 
-def i2delta_n(i_values: np.ndarray, config) -> np.ndarray:
+_I2DN_TABLES = {}
+GRID_TOLERANCE = 1e-9
+MAX_TABLE_LEVELS = 1 << 20
+
+
+def _i2delta_n_exact(i_values: np.ndarray, d: float, lambda_: float, i_ref: float) -> np.ndarray:
+    return (lambda_ / (np.pi * d)) * np.arcsin(np.sqrt(i_values / i_ref))
+
+
+def i2delta_n_table(config, step: float, n_levels: int) -> np.ndarray:
+    """
+    Cached birefringence of the intensity levels k * step, k = 0 .. n_levels - 1,
+    keyed on the optics config (d, lambda_, I_ref) and the level step.
+    """
+    key = (config.optics.d, config.optics.lambda_, config.optics.I_ref, step)
+    table = _I2DN_TABLES.get(key)
+    if table is None or len(table) < n_levels:
+        size = 1 << int(np.ceil(np.log2(max(n_levels, 2))))
+        table = _i2delta_n_exact(np.arange(size) * step, *key[:3])
+        _I2DN_TABLES[key] = table
+    return table
+
+
+def i2delta_n(i_values: np.ndarray, config, step=None) -> np.ndarray:
     """
     Convert the intensity signal to birefringence.
+    With the intensity quantisation step known, values on the k * step grid are looked up in
+    a cached table and only off-grid values are computed exactly.
     """
     d = config.optics.d
     lambda_ = config.optics.lambda_
     i_ref = config.optics.I_ref
 
-    return (lambda_ / (np.pi * d)) * np.arcsin(np.sqrt(i_values / i_ref))
+    if step is None or step <= 0 or len(i_values) == 0:
+        return _i2delta_n_exact(i_values, d, lambda_, i_ref)
+
+    levels = i_values * (1.0 / step)
+    np.rint(levels, out=levels)
+    residual = levels * step
+    residual -= i_values
+    tolerance = GRID_TOLERANCE * step
+    on_grid_everywhere = (residual.max() <= tolerance and residual.min() >= -tolerance
+                          and levels.min() >= 0 and levels.max() < MAX_TABLE_LEVELS)
+
+    if on_grid_everywhere:
+        levels = levels.astype(np.intp)
+        return i2delta_n_table(config, step, int(levels.max()) + 1).take(levels)
+
+    on_grid = (np.abs(residual) <= tolerance) & (levels >= 0) & (levels < MAX_TABLE_LEVELS)
+    if not np.any(on_grid):
+        return _i2delta_n_exact(i_values, d, lambda_, i_ref)
+
+    levels = np.where(on_grid, levels, 0).astype(np.intp)
+    dn = i2delta_n_table(config, step, int(levels.max()) + 1).take(levels)
+    dn[~on_grid] = _i2delta_n_exact(i_values[~on_grid], d, lambda_, i_ref)
+    return dn
 
 
 def double_rise(t: np.ndarray, d: float, c1: float, c2: float, p: float) -> np.ndarray:
@@ -103,12 +152,13 @@ def find_consts_fall(s: np.ndarray, t: np.ndarray, config) -> tuple:
     return popt_fall
 
 
-def bg_sub(signal: np.ndarray, config) -> np.ndarray:
+def bg_sub(signal: np.ndarray, config, step=None) -> np.ndarray:
     """
     Standard background subtraction.
+    step is the intensity quantisation step, if known (see i2delta_n).
     """
     dn = signal.copy()
-    dn = i2delta_n(dn, config)
+    dn = i2delta_n(dn, config, step)
     dn -= np.min(dn)
     return dn
 
@@ -150,6 +200,43 @@ def get_scale(s: np.ndarray) -> np.ndarray:
     return s_copy / (max_val - min_val)
 
 
+def field_pulse_edges(field: np.ndarray, min_fill=0.9, lead=0.01):
+    """
+    (st, end) sample indices of the field pulse on CH1: the first and one past the last sample
+    more than half the pulse height away from the baseline, the 1st/99th percentile level closest
+    to the first `lead` of the record (the pre-trigger). None when there is no single pulse inside
+    the record (flat or noisy channel, pulse cut off at either end).
+    """
+    field = np.asarray(field, dtype=np.float64)
+    if len(field) < 3 or not np.all(np.isfinite(field)):
+        return None
+    low, high = np.percentile(field, (1, 99))
+    start_level = np.median(field[:max(1, int(lead * len(field)))])
+    baseline = low if abs(start_level - low) <= abs(start_level - high) else high
+    above = np.flatnonzero(np.abs(field - baseline) > (high - low) / 2)
+    if high == low or len(above) == 0:
+        return None
+    st, end = int(above[0]), int(above[-1]) + 1
+    if st == 0 or end == len(field) or len(above) < min_fill * (end - st):
+        return None
+    return st, end
+
+
+def trace_boundary(config, trace_path: str, field: np.ndarray) -> DirBoundary:
+    """
+    The DirBoundary a trace is processed with: its config entry, or st/end at the edges of the
+    field pulse (field_pulse_edges of the raw CH1 column cut to setup.cut) when it has none.
+    Raises ValueError when there is neither.
+    """
+    boundary = config.directories.boundaries.get(trace_path, None)
+    if boundary is not None:
+        return boundary
+    edges = field_pulse_edges(field)
+    if edges is None:
+        raise ValueError(f"{trace_path}: no DirBoundary and no field pulse found on CH1, add a DirBoundary entry")
+    return DirBoundary(*edges, tr1=None, tr2=None, accept=1)
+
+
 def conver_p(tau, config):
     """
     Converts tau to an aspect ratio.
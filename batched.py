@@ -0,0 +1,180 @@
+import numpy as np
+from scipy.signal import savgol_filter as sgf
+
+from analizer import i2delta_n, trace_boundary
+
+E_SQUARE_SAMPLES = 1000  # field samples before the end of the pulse averaged into e_square
+DN_INFINITY_SKIP = 1000  # last rise samples left out of dn_infinity
+FALL_SMOOTHING = 201  # Savitzky-Golay window of the standard-grid fall passed to the regularisation
+
+
+def stack_columns(traces, cut: int) -> tuple:
+    """
+    Stacks the first `cut` rows of every (N, 3) array or (time, ch1, ch2) tuple into NaN-padded
+    (n_shots, max_len) time, field and intensity arrays. Returns them with the row lengths.
+    """
+    columns = [data if isinstance(data, tuple) else data.T for data in traces]
+    lengths = np.array([min(len(c[0]), cut) for c in columns], dtype=np.intp)
+    stacked = np.full((3, len(columns), lengths.max(initial=0)), np.nan)
+    for i, (c, n) in enumerate(zip(columns, lengths)):
+        for j in range(3):
+            stacked[j, i, :n] = c[j][:n]
+    return stacked[0], stacked[1], stacked[2], lengths
+
+
+def slice_bounds(start, stop, lengths) -> tuple:
+    """Per-row [start, stop) of the Python slice start:stop (ints or None) on rows of the given lengths."""
+    bounds = np.array([slice(a, b).indices(n)[:2] for a, b, n in zip(start, stop, lengths)], dtype=np.intp)
+    bounds = bounds.reshape(-1, 2)
+    return bounds[:, 0], np.maximum(bounds[:, 1], bounds[:, 0])
+
+
+def gather(values: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> tuple:
+    """
+    The row segments values[i, starts[i]:stops[i]], left-aligned in a NaN-padded 2-D array,
+    and their lengths.
+    """
+    lengths = stops - starts
+    segments = np.full((len(values), lengths.max(initial=0)), np.nan)
+    for i, (start, stop) in enumerate(zip(starts, stops)):
+        segments[i, :stop - start] = values[i, start:stop]
+    return segments, lengths
+
+
+def row_values(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """values[i, index[i]] of every row."""
+    return values[np.arange(len(values)), np.minimum(index, values.shape[1] - 1)]
+
+
+def row_means(values: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Mean of the first lengths[i] values of every row (NaN for empty rows, like np.mean)."""
+    valid = np.arange(values.shape[1]) < lengths[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sum(values, axis=1, where=valid) / lengths
+
+
+def shift_to_zero(values: np.ndarray) -> np.ndarray:
+    """Subtracts every row's minimum (NaN padding ignored), in place."""
+    values -= np.fmin.reduce(values, axis=1)[:, None]
+    return values
+
+
+def batch_bg_sub(values: np.ndarray, config, steps) -> np.ndarray:
+    """
+    analizer.bg_sub of every row: i2delta_n over all rows that share a quantisation step in one
+    call, then each row shifted to a zero minimum. The NaN padding goes in as 0, a level of every
+    grid, so it does not keep i2delta_n off its lookup table, and comes back out as NaN.
+    """
+    padding = np.isnan(values)
+    values = np.where(padding, 0.0, values)
+    if len(set(steps)) == 1:
+        dn = i2delta_n(values, config, steps[0])
+    else:
+        dn = np.empty_like(values)
+        for step in dict.fromkeys(steps):
+            rows = [i for i, row_step in enumerate(steps) if row_step == step]
+            dn[rows] = i2delta_n(values[rows], config, step)
+    dn[padding] = np.nan
+    return shift_to_zero(dn)
+
+
+def batch_scale(values: np.ndarray) -> np.ndarray:
+    """analizer.get_scale of every row: scaled to [0, 1], all zeros for a flat row."""
+    low, high = np.fmin.reduce(values, axis=1), np.fmax.reduce(values, axis=1)
+    span = high - low
+    scaled = values - low[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scaled /= span[:, None]
+    scaled[span == 0] = 0.0
+    return scaled
+
+
+def batch_standard(dn: np.ndarray, lengths: np.ndarray, n_std: np.ndarray, hold_last: bool) -> np.ndarray:
+    """
+    standard_rise (hold_last=True: padded with the last value) or standard_fall (padded with
+    zeros) of every row, on per-row grids of n_std points; NaN beyond a row's grid.
+    """
+    std = np.empty((len(dn), n_std.max(initial=0)))
+    for i, (n, n_grid) in enumerate(zip(lengths, n_std)):
+        n_copy = min(n, n_grid)
+        std[i, :n_copy] = dn[i, :n_copy]
+        std[i, n_copy:n_grid] = dn[i, n - 1] if hold_last and n > 0 else 0.0
+        std[i, n_grid:] = np.nan
+    return std
+
+
+def batch_smooth(values: np.ndarray, n_std: np.ndarray, window: int) -> np.ndarray:
+    """Savitzky-Golay smoothing (polyorder 1) of every row, one call per distinct grid length."""
+    smoothed = np.full_like(values, np.nan)
+    for n in np.unique(n_std):
+        rows = np.flatnonzero(n_std == n)
+        smoothed[rows, :n] = sgf(values[rows, :n], window, 1, axis=1)
+    return smoothed
+
+
+def preprocess_group(traces, config, group) -> list:
+    """
+    process_database.preprocess_trace for every shot of a pulse group at once. traces is a list
+    of (dataset, data, time_step, intensity_step). The shots are stacked into padded 2-D arrays
+    with per-row st/end bounds; background subtraction, scaling, standard-grid padding and the
+    reductions are whole-array operations. Returns one preprocess_trace dict per shot whose arrays
+    are views into the stacked results, ready for the per-row fits (fit_preprocessed).
+    """
+    if not traces:
+        return []
+    boundaries = [trace_boundary(config, f'{group}/{dataset}', (data if isinstance(data, tuple) else data.T)[1]
+                                 [:config.setup.cut]) for dataset, data, _, _ in traces]
+    st, end = [b.st for b in boundaries], [b.end for b in boundaries]
+    time_steps = [time_step for _, _, time_step, _ in traces]
+    steps = [intensity_step * config.setup.ch2_multiplier if intensity_step else None
+             for _, _, _, intensity_step in traces]
+
+    time, field, intensity, lengths = stack_columns([data for _, data, _, _ in traces], config.setup.cut)
+    time_origin = time[:, 0].copy()
+    time *= config.setup.time_multiplier
+    field *= config.setup.ch1_multiplier
+    intensity *= config.setup.ch2_multiplier
+
+    mean_steps = row_means(np.diff(time, axis=1), np.maximum(lengths - 1, 0))
+    sample_rate = np.array([time_step * config.setup.time_multiplier if time_step else mean_step
+                            for time_step, mean_step in zip(time_steps, mean_steps)])
+
+    rise_start, rise_stop = slice_bounds(st, end, lengths)
+    fall_start, fall_stop = slice_bounds(end, [None] * len(end), lengths)
+
+    rise, rise_lengths = gather(intensity, rise_start, rise_stop)
+    rise_time = gather(time, rise_start, rise_stop)[0]
+    rise_time -= row_values(time, rise_start)[:, None]
+    relaxation, fall_lengths = gather(intensity, fall_start, fall_stop)
+    relaxation_time = gather(time, fall_start, fall_stop)[0]
+    relaxation_time -= row_values(time, fall_start)[:, None]
+
+    dn_rise = batch_bg_sub(shift_to_zero(rise), config, steps)
+    dn_fall = batch_bg_sub(shift_to_zero(relaxation), config, steps)
+    dn = batch_bg_sub(intensity, config, steps)
+    s_rise, s_fall = batch_scale(dn_rise), batch_scale(dn_fall)
+
+    time_std = [np.arange(0, config.fit.standard_time, rate) for rate in sample_rate]
+    n_std = np.array([len(grid) for grid in time_std], dtype=np.intp)
+    dn_rise_std = batch_standard(dn_rise, rise_lengths, n_std, hold_last=True)
+    dn_fall_std = batch_standard(dn_fall, fall_lengths, n_std, hold_last=False)
+    rise_std_scaled, fall_std_scaled = batch_scale(dn_rise_std), batch_scale(dn_fall_std)
+    fall_std_smoothed = batch_smooth(dn_fall_std, n_std, FALL_SMOOTHING)
+
+    dn_infinity = row_means(dn_rise, np.maximum(rise_lengths - DN_INFINITY_SKIP, 0))
+    field_start, field_stop = slice_bounds([None if e is None else e - E_SQUARE_SAMPLES for e in end], end, lengths)
+    e_square = row_means(*gather(field, field_start, field_stop)) ** 2
+
+    preprocessed = []
+    for i, n in enumerate(lengths):
+        n_rise, n_fall, n_grid = rise_lengths[i], fall_lengths[i], n_std[i]
+        preprocessed.append({
+                "st": st[i], "end": end[i], "time": time[i, :n], "time_origin": time_origin[i],
+                "time_step": time_steps[i], "sample_rate": sample_rate[i], "dn": dn[i, :n],
+                "rise_time": rise_time[i, :n_rise], "dn_rise": dn_rise[i, :n_rise], "s_rise": s_rise[i, :n_rise],
+                "relaxation_time": relaxation_time[i, :n_fall], "dn_fall": dn_fall[i, :n_fall],
+                "s_fall": s_fall[i, :n_fall], "time_std": time_std[i], "dn_rise_std": dn_rise_std[i, :n_grid],
+                "dn_fall_std": dn_fall_std[i, :n_grid], "rise_std_scaled": rise_std_scaled[i, :n_grid],
+                "fall_std_scaled": fall_std_scaled[i, :n_grid], "fall_std_smoothed": fall_std_smoothed[i, :n_grid],
+                "dn_infinity": dn_infinity[i], "e_square": e_square[i]})
+    return preprocessed
@@ -0,0 +1,550 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from batched import preprocess_group
+from configuration import DirBoundary, RawLayoutConfig, get_experiment_config
+from oscilloscope import read_oscilloscope_csv, read_oscilloscope_csv_with_header, read_waveform_with_header
+from process_database import preprocess_trace, read_group_trace
+from quality import QUARANTINE_GROUP
+from raw_db import (encode_raw_trace, layout_kwargs, map_raw_file, map_raw_trace, mappable, read_raw_trace,
+                    stream_raw_trace)
+from stacked_db import build_stacked_database, read_stacked_group, read_stacked_samples
+
+RAW_LAYOUTS = {
+        "contiguous": RawLayoutConfig(None, False, None, None, "float64", False),
+        "chunked": RawLayoutConfig(4096, False, None, None, "float64", False),
+        "shuffle+lzf": RawLayoutConfig(4096, True, "lzf", None, "float64", False),
+        "shuffle+gzip1": RawLayoutConfig(4096, True, "gzip", 1, "float64", False),
+        "shuffle+gzip4": RawLayoutConfig(4096, True, "gzip", 4, "float64", False),
+        "f32+shuffle+lzf": RawLayoutConfig(4096, True, "lzf", None, "float32", False),
+        "f32+shuffle+gzip4": RawLayoutConfig(4096, True, "gzip", 4, "float32", False),
+        "adc": RawLayoutConfig(None, False, None, None, "float64", True),
+        "adc+shuffle+gzip4": RawLayoutConfig(4096, True, "gzip", 4, "float64", True),
+}
+
+
+def legacy_read_oscilloscope_csv(file_path):
+    """
+    Reference implementation of the original two-pass reader (readlines + pandas).
+    """
+    with open(file_path, 'r') as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        if line.strip().startswith("TIME,CH1,CH2"):
+            header_index = i
+            break
+    else:
+        raise ValueError("Could not find the data header in the file.")
+    df = pd.read_csv(file_path, skiprows=header_index, usecols=[0, 1, 2], encoding='latin1')
+    df = df.iloc[:, :3]
+
+    return df.apply(pd.to_numeric, errors='coerce').to_numpy()
+
+
+def write_synthetic_tek_csv(file_path, n_points=20_000, sample_interval=4e-6, seed=0):
+    """
+    Writes a Tektronix-style CSV (metadata header + TIME,CH1,CH2 block) with quantised channels.
+    """
+    rng = np.random.default_rng(seed)
+    time_axis = -0.1 * n_points * sample_interval + np.arange(n_points) * sample_interval
+    ch1 = np.round(rng.normal(0, 12.5, n_points)) * 0.08
+    ch2 = np.round(np.abs(rng.normal(0, 25, n_points))) * 0.0002
+
+    header = [
+            "Model,MDO3024",
+            "Waveform Type,ANALOG,ANALOG",
+            "Horizontal Units,s,s",
+            f"Sample Interval,{sample_interval},{sample_interval}",
+            f"Record Length,{n_points},{n_points}",
+            "Vertical Units,V,V",
+            "Vertical Scale,2,0.005",
+            "Vertical Offset,0,0",
+            "Label,,",
+            "TIME,CH1,CH2",
+    ]
+    with open(file_path, 'w') as f:
+        f.write("\n".join(header) + "\n")
+        for t, c1, c2 in zip(time_axis, ch1, ch2):
+            f.write(f"{t:.6e},{c1:.4g},{c2:.4g}\n")
+
+
+def write_synthetic_isf(file_path, values, sample_interval=4e-6, x_zero=0.0, y_mult=1.5625e-4, y_zero=0.0,
+                        y_off=0.0, byte_order="MSB", channel="CH1"):
+    """
+    Writes one channel as a Tektronix .isf file (binary RI int16 curve + ASCII preamble).
+    Values are quantised to int16 codes with the given preamble scaling.
+    """
+    codes = np.round((np.asarray(values) - y_zero) / y_mult + y_off).astype(np.int16)
+    payload = codes.astype('>i2' if byte_order == "MSB" else '<i2').tobytes()
+    length = str(len(payload))
+    preamble = (f":WFMPRE:BYT_NR 2;BIT_NR 16;ENCDG BIN;BN_FMT RI;BYT_OR {byte_order};NR_PT {len(codes)};"
+                f'WFID "{channel}, DC coupling, 2.0E-1 V/div, 4.0E-2 s/div, {len(codes)} points, Sample mode";'
+                f'PT_FMT Y;XINCR {sample_interval:.4E};PT_OFF 0;XZERO {x_zero:.4E};XUNIT "s";'
+                f'YMULT {y_mult:.4E};YZERO {y_zero:.4E};YOFF {y_off:.4E};YUNIT "V";:CURVE #{len(length)}{length}')
+    with open(file_path, 'wb') as f:
+        f.write(preamble.encode('latin1') + payload + b"\n")
+    return codes
+
+
+def bench_isf_reader(n_points=20_000, n_files=20, tmp_dir=None, repeat=5):
+    """
+    Speed of the .isf reader on synthetic CH1/CH2 pairs against parsing a CSV record of the same
+    length (correctness is covered by tests/test_oscilloscope.py).
+    """
+    rng = np.random.default_rng(0)
+    isf_paths, csv_paths = [], []
+    for i in range(n_files):
+        ch1_path = os.path.join(tmp_dir, f"TEK{i:05d}CH1.ISF")
+        ch2_path = os.path.join(tmp_dir, f"TEK{i:05d}CH2.ISF")
+        write_synthetic_isf(ch1_path, rng.normal(0, 1, n_points), x_zero=-4e-3, y_mult=8e-2, channel="CH1")
+        write_synthetic_isf(ch2_path, np.abs(rng.normal(0, 0.01, n_points)), x_zero=-4e-3, y_mult=4e-4,
+                            y_off=-100.0, byte_order="LSB", channel="CH2")
+
+        csv_path = os.path.join(tmp_dir, f"TEK{i:05d}.CSV")
+        write_synthetic_tek_csv(csv_path, n_points=n_points, seed=i)
+        isf_paths.append(ch1_path)
+        csv_paths.append(csv_path)
+
+    t_csv = _time_per_call(read_oscilloscope_csv, csv_paths, repeat)
+    t_isf = _time_per_call(read_waveform_with_header, isf_paths, repeat)
+    print(f"Records: {n_files} x {n_points} points")
+    print(f"CSV            : {t_csv * 1e3:8.2f} ms/record")
+    print(f"ISF (CH1 + CH2): {t_isf * 1e3:8.2f} ms/record")
+    print(f"speedup        : {t_csv / t_isf:8.2f}x")
+
+
+def _time_per_call(func, paths, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        best = min(best, (time.perf_counter() - start) / len(paths))
+    return best
+
+
+def bench_csv_reader(paths, repeat=5):
+    """
+    Compares the single-pass reader against the legacy pandas reader on the given files.
+    """
+    for path in paths:
+        if not np.array_equal(read_oscilloscope_csv(path), legacy_read_oscilloscope_csv(path), equal_nan=True):
+            raise AssertionError(f"Reader mismatch on {path}")
+
+    t_legacy = _time_per_call(legacy_read_oscilloscope_csv, paths, repeat)
+    t_fast = _time_per_call(read_oscilloscope_csv, paths, repeat)
+
+    print(f"Files: {len(paths)}")
+    print(f"legacy (readlines + pandas): {t_legacy * 1e3:8.2f} ms/file")
+    print(f"single pass                : {t_fast * 1e3:8.2f} ms/file")
+    print(f"speedup                    : {t_legacy / t_fast:8.2f}x")
+
+
+def load_raw_traces(raw_hdf_path):
+    """
+    Loads every accepted raw trace of an experiment_data_pulses.h5 as {'<group>/<dataset>': array}.
+    """
+    traces = {}
+    with h5py.File(raw_hdf_path, 'r') as hdf:
+        hdf.visititems(lambda name, obj: traces.__setitem__(name, read_raw_trace(obj))
+                       if isinstance(obj, h5py.Dataset) and not name.startswith(QUARANTINE_GROUP) else None)
+    return traces
+
+
+def _time_layout_reads(path, group_paths, config, mapped, repeat) -> float:
+    """Best time to read every trace the way process_database does (read_group_trace, setup.cut rows)."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with h5py.File(path, 'r') as hdf:
+            file_map = map_raw_file(hdf) if mapped else None
+            for group_path in group_paths:
+                for dataset in hdf[group_path]:
+                    data, _, _ = read_group_trace(hdf[group_path], dataset, config, file_map)
+                    for column in (data if isinstance(data, tuple) else data.T):
+                        column.sum()  # mapped columns are only loaded when touched
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_raw_layouts(traces, tmp_dir, layouts=None, repeat=3, cut=None):
+    """
+    Writes the traces with each raw layout and reports file size, write and read throughput.
+    Reads follow process_database: every dataset of every group, in group order, the first
+    setup.cut rows (read_group_trace), copied and, for layouts that allow it (raw_db.mappable),
+    memory-mapped. Throughputs are in MB of float64 samples read.
+    """
+    layouts = layouts if layouts is not None else RAW_LAYOUTS
+    config = get_experiment_config()
+    config.setup.cut = cut if cut is not None else config.setup.cut
+    n_bytes = sum(trace.astype(np.float64).nbytes for trace in traces.values())
+    n_read = sum(min(len(trace), config.setup.cut) * 3 * 8 for trace in traces.values())
+    group_paths = sorted({name.rsplit('/', 1)[0] for name in traces})
+
+    print(f"Traces: {len(traces)}, payload: {n_bytes / 2 ** 20:.1f} MiB (float64), "
+          f"read: first {config.setup.cut} rows ({n_read / 2 ** 20:.1f} MiB)")
+    print(f"{'layout':>20} {'size MiB':>10} {'ratio':>7} {'write MB/s':>11} {'read MB/s':>10} {'mmap MB/s':>10}")
+    for name, layout in layouts.items():
+        path = os.path.join(tmp_dir, f"layout_{name}.h5")
+
+        start = time.perf_counter()
+        with h5py.File(path, 'w') as hdf:
+            for dset_path, trace in traces.items():
+                stored, attrs = encode_raw_trace(trace, adc_codes=layout.adc_codes)
+                dset = hdf.create_dataset(dset_path, data=stored, **layout_kwargs(layout, stored.shape, stored.dtype))
+                dset.attrs.update(attrs)
+        t_write = time.perf_counter() - start
+        size = os.path.getsize(path)
+        with h5py.File(path, 'r') as hdf:
+            can_map = all(mappable(hdf[dset_path]) for dset_path in traces)
+
+        t_read = _time_layout_reads(path, group_paths, config, False, repeat)
+        t_mapped = _time_layout_reads(path, group_paths, config, True, repeat) if can_map else None
+        mapped = f"{n_read / t_mapped / 1e6:10.1f}" if t_mapped else f"{'-':>10}"
+        print(f"{name:>20} {size / 2 ** 20:10.2f} {n_bytes / size:7.2f} "
+              f"{n_bytes / t_write / 1e6:11.1f} {n_read / t_read / 1e6:10.1f} {mapped}")
+        os.remove(path)
+
+
+def bench_stacked_layout(traces, tmp_dir, layout=None, repeat=3, window=(1000, 2000)):
+    """
+    Per-file raw layout vs stacked per-group layout: reading every group in full
+    (dataset by dataset vs one call per group) and reading one sample window across all shots.
+    """
+    layout = layout if layout is not None else RawLayoutConfig(4096, True, "lzf", None, "float64", False)
+    group_paths = sorted({name.rsplit('/', 1)[0] for name in traces})
+    raw_path, stacked_path = os.path.join(tmp_dir, "per_file.h5"), os.path.join(tmp_dir, "stacked.h5")
+    with h5py.File(raw_path, 'w') as hdf:
+        for dset_path, trace in traces.items():
+            stored, attrs = encode_raw_trace(trace)
+            hdf.create_dataset(dset_path, data=stored, **layout_kwargs(layout, stored.shape, stored.dtype))
+            hdf[dset_path].attrs.update(attrs)
+    build_stacked_database(raw_path, stacked_path, group_paths, layout)
+
+    def per_file_groups():
+        with h5py.File(raw_path, 'r') as hdf:
+            for group_path in group_paths:
+                np.stack([read_raw_trace(hdf[group_path][dataset]) for dataset in hdf[group_path]])
+
+    def stacked_groups():
+        with h5py.File(stacked_path, 'r') as hdf:
+            for group_path in group_paths:
+                read_stacked_group(hdf[group_path])
+
+    def per_file_window():
+        with h5py.File(raw_path, 'r') as hdf:
+            for group_path in group_paths:
+                np.stack([read_raw_trace(hdf[group_path][dataset])[window[0]:window[1]]
+                          for dataset in hdf[group_path]])
+
+    def stacked_window():
+        with h5py.File(stacked_path, 'r') as hdf:
+            for group_path in group_paths:
+                read_stacked_samples(hdf[group_path], *window)
+
+    print(f"Traces: {len(traces)} in {len(group_paths)} groups, window {window[0]}:{window[1]}")
+    for name, func in (("groups, per-file", per_file_groups), ("groups, stacked", stacked_groups),
+                       ("window, per-file", per_file_window), ("window, stacked", stacked_window)):
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>18}: {best * 1e3:8.2f} ms")
+
+
+def _peak_traced_mb(func, *args):
+    """Runs func(*args) under tracemalloc and returns (result, peak allocated MB)."""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def _rss_peak_mb(func, *args, interval=1e-3):
+    """
+    Runs func(*args) while a thread samples _rss_mb and returns (result, peak growth of the private
+    resident memory in MB). Unlike tracemalloc this sees HDF5 chunk caches and filter buffers.
+    """
+    start, peak, done = _rss_mb()[0], [0.0], threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _rss_mb()[0] - start)
+            time.sleep(interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = func(*args)
+    finally:
+        done.set()
+        sampler.join()
+    return result, max(peak[0], _rss_mb()[0] - start)
+
+
+def _stream_to_file(csv_path, hdf_path, layout, chunk_rows):
+    with h5py.File(hdf_path, 'w') as hdf:
+        stream_raw_trace(hdf, "TEK00000", csv_path, {}, layout, chunk_rows)
+
+
+def _streamed_peak(csv_path, hdf_path, layout, chunk_rows) -> float:
+    return _rss_peak_mb(_stream_to_file, csv_path, hdf_path, layout, chunk_rows)[1]
+
+
+def _whole_file_peak(csv_path) -> float:
+    return _rss_peak_mb(read_oscilloscope_csv_with_header, csv_path)[1]
+
+
+def bench_streaming_memory(lengths=(1_000_000, 4_000_000), chunk_rows=1 << 16, ceiling_mb=48.0, tmp_dir=None):
+    """
+    Memory-ceiling check of the streaming ingest: records of each length are streamed into a chunked
+    dataset and the peak resident-memory growth (_rss_peak_mb) must stay below ceiling_mb and must
+    not grow with the record length (by more than a quarter of the ceiling). Every measurement runs
+    in a fresh interpreter so memory kept from earlier runs cannot hide growth. The whole-file
+    reader is measured for comparison and used to verify the content.
+    """
+    layout = RawLayoutConfig(None, True, "lzf", None, "float64", False)
+    context = multiprocessing.get_context("spawn")
+    print(f"Chunk {chunk_rows} rows, ceiling {ceiling_mb:.0f} MB")
+    print(f"{'points':>10} {'CSV MB':>8} {'whole-file MB':>14} {'streamed MB':>12}")
+    peaks = []
+    for n_points in lengths:
+        csv_path, hdf_path = os.path.join(tmp_dir, "TEK00000.CSV"), os.path.join(tmp_dir, "stream.h5")
+        write_synthetic_tek_csv(csv_path, n_points=n_points, sample_interval=1e-6)  # uniform in %.6e below 10 s
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            peak_stream = pool.apply(_streamed_peak, (csv_path, hdf_path, layout, chunk_rows))
+            peak_whole = pool.apply(_whole_file_peak, (csv_path,))
+
+        with h5py.File(hdf_path, 'r') as hdf:
+            streamed = read_raw_trace(hdf["TEK00000"])
+        data = read_oscilloscope_csv(csv_path)
+        if not (np.array_equal(streamed[:, 1:], data[:, 1:])
+                and np.allclose(streamed[:, 0], data[:, 0], rtol=0, atol=0.01 * (data[1, 0] - data[0, 0]))):
+            raise AssertionError("Streamed trace differs from the whole-file parse")
+        print(f"{n_points:>10} {os.path.getsize(csv_path) / 2 ** 20:8.1f} {peak_whole:14.1f} {peak_stream:12.1f}")
+        peaks.append(peak_stream)
+        os.remove(csv_path)
+        os.remove(hdf_path)
+
+    if max(peaks) > ceiling_mb:
+        raise AssertionError(f"Streaming peak {max(peaks):.1f} MB exceeds the {ceiling_mb:.0f} MB ceiling")
+    if max(peaks) - peaks[0] > ceiling_mb / 4:
+        raise AssertionError(f"Streaming peak grows with the record length: {', '.join(f'{p:.1f}' for p in peaks)} MB")
+
+
+def _rss_mb() -> np.ndarray:
+    """Current private (RssAnon) and file-backed (RssFile) resident memory in MB, NaN where unavailable."""
+    rss = {"RssAnon:": np.nan, "RssFile:": np.nan}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, *value = line.split()
+                if key in rss:
+                    rss[key] = int(value[0]) / 1024
+    except OSError:
+        pass
+    return np.array(list(rss.values()))
+
+
+def bench_mapped_read(traces, tmp_dir, cut=17000, window=(640, 9600), repeat=5):
+    """
+    Copying read (read_raw_trace) vs memory-mapped zero-copy read (map_raw_trace) of a contiguous
+    float64 raw database: per-trace latency of taking the [:cut], [st:end] and [end:] slices
+    that interpret_dataset uses, peak Python/numpy allocation and resident-set growth of one pass,
+    split into private memory and file-backed pages (mapped pages are clean page cache the kernel
+    can drop). The first pass of each path is the one measured for memory.
+    """
+    st, end = window
+    path = os.path.join(tmp_dir, "contiguous.h5")
+    with h5py.File(path, 'w') as hdf:
+        for dset_path, trace in traces.items():
+            stored, attrs = encode_raw_trace(trace)
+            hdf.create_dataset(dset_path, data=stored).attrs.update(attrs)
+        if not all(mappable(hdf[name]) for name in traces):
+            raise AssertionError("Contiguous float64 datasets should be mappable")
+
+    def touch(columns):
+        _, _, intensity = columns
+        return intensity[st:end].min() + intensity[end:].min()
+
+    print(f"Traces: {len(traces)}, cut {cut}, slices {st}:{end} and {end}:")
+    print(f"{'read':>8} {'ms/trace':>9} {'peak alloc MB':>14} {'RSS anon MB':>12} {'RSS file MB':>12}")
+    columns = {}
+    for label in ("copy", "mmap"):
+        with h5py.File(path, 'r') as hdf:
+            if label == "copy":
+                def read(dset):
+                    return tuple(read_raw_trace(dset, cut).T)
+            else:
+                file_map = map_raw_file(hdf)
+
+                def read(dset):
+                    return map_raw_trace(dset, file_map, cut)
+
+            def one_pass():
+                return sum(touch(read(hdf[name])) for name in traces)
+
+            rss = _rss_mb()
+            _, peak = _peak_traced_mb(one_pass)
+            rss = _rss_mb() - rss
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                one_pass()
+                best = min(best, time.perf_counter() - start)
+            print(f"{label:>8} {best / len(traces) * 1e3:9.3f} {peak:14.2f} {rss[0]:12.2f} {rss[1]:12.2f}")
+            columns[label] = {name: [np.array(column) for column in read(hdf[name])] for name in traces}
+
+    if not all(np.array_equal(a, b, equal_nan=True) for name in traces
+               for a, b in zip(columns["copy"][name], columns["mmap"][name])):
+        raise AssertionError("Mapped reads differ from the copying reads")
+    os.remove(path)
+
+
+def bench_batched_preprocess(traces, repeat=3):
+    """
+    Per-trace preprocess_trace vs preprocess_group on whole pulse groups (the preprocessing half
+    of interpret_dataset, before the fits), with st/end at 1/30 and 1/2 of every record.
+    Checks that both give the same arrays.
+    """
+    config = get_experiment_config()
+    config.setup.cut = max(len(trace) for trace in traces.values())
+    groups = {}
+    for dset_path, trace in traces.items():
+        group_path, dataset = dset_path.rsplit('/', 1)
+        config.directories.boundaries[dset_path] = DirBoundary(st=len(trace) // 30, end=len(trace) // 2,
+                                                               tr1=None, tr2=None, accept=1)
+        groups.setdefault(group_path, []).append((dataset, trace, None, None))
+
+    def per_trace():
+        return [preprocess_trace(trace, config, group_path, dataset, time_step, intensity_step)
+                for group_path, entries in groups.items()
+                for dataset, trace, time_step, intensity_step in entries]
+
+    def per_group():
+        return [pre for group_path, entries in groups.items() for pre in preprocess_group(entries, config, group_path)]
+
+    print(f"Traces: {len(traces)} in {len(groups)} groups")
+    outputs = {}
+    for name, func in (("per trace", per_trace), ("per group", per_group)):
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = func()
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>10}: {best * 1e3:8.2f} ms ({best / len(traces) * 1e3:.3f} ms/trace)")
+
+    worst = 0.0
+    for a, b in zip(outputs["per trace"], outputs["per group"]):
+        for key, value in a.items():
+            value, other = np.asarray(value, dtype=float), np.asarray(b[key], dtype=float)
+            if value.shape != other.shape:
+                raise AssertionError(f"Batched {key} has shape {other.shape}, expected {value.shape}")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                error = np.nan_to_num(np.abs(value - other) / np.abs(value), nan=0.0, posinf=0.0)
+            worst = max(worst, float(error.max(initial=0.0)))
+    print(f"Largest relative difference: {worst:.1e}")
+    if worst > 1e-12:
+        raise AssertionError("Batched preprocessing differs from the per-trace path")
+
+
+def _synthetic_traces(n_traces, tmp_dir, n_points=20_000):
+    traces = {}
+    for i in range(n_traces):
+        path = os.path.join(tmp_dir, f"TEK{i:05d}.CSV")
+        write_synthetic_tek_csv(path, n_points=n_points, seed=i)
+        traces[f"00000/0/{100 * (1 + i % 4)}/TEK{i:05d}"] = read_oscilloscope_csv(path)
+        os.remove(path)
+    return traces
+
+
+def _collect_paths(directory, n_synthetic, tmp_dir):
+    if directory:
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith('.csv'))
+    paths = []
+    for i in range(n_synthetic):
+        path = os.path.join(tmp_dir, f"TEK{i:05d}.CSV")
+        write_synthetic_tek_csv(path, seed=i)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the raw data path.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reader = subparsers.add_parser("reader", help="CSV reader: single pass vs legacy pandas")
+    reader.add_argument("--dir", default=None, help="Directory with TEK*.CSV files (synthetic if omitted)")
+    reader.add_argument("--n-files", type=int, default=20)
+    reader.add_argument("--repeat", type=int, default=5)
+
+    layouts = subparsers.add_parser("layouts", help="Raw DB storage layouts: size and throughput")
+    layouts.add_argument("--raw", default=None, help="experiment_data_pulses.h5 to replay (synthetic if omitted)")
+    layouts.add_argument("--n-traces", type=int, default=40)
+    layouts.add_argument("--n-points", type=int, default=20_000)
+    layouts.add_argument("--cut", type=int, default=None, help="Rows read per trace (default: config setup.cut)")
+    layouts.add_argument("--repeat", type=int, default=3)
+
+    isf = subparsers.add_parser("isf", help="Binary .isf reader: speed vs CSV")
+    isf.add_argument("--n-points", type=int, default=20_000)
+    isf.add_argument("--n-files", type=int, default=20)
+    isf.add_argument("--repeat", type=int, default=5)
+
+    stacked = subparsers.add_parser("stacked", help="Per-file vs stacked per-group raw layout reads")
+    stacked.add_argument("--raw", default=None, help="experiment_data_pulses.h5 to replay (synthetic if omitted)")
+    stacked.add_argument("--n-traces", type=int, default=80)
+    stacked.add_argument("--repeat", type=int, default=3)
+
+    mapped = subparsers.add_parser("mmap", help="Copying vs memory-mapped zero-copy raw trace reads")
+    mapped.add_argument("--n-traces", type=int, default=40)
+    mapped.add_argument("--n-points", type=int, default=20_000)
+    mapped.add_argument("--repeat", type=int, default=5)
+
+    memory = subparsers.add_parser("memory", help="Streaming ingest: peak memory against a ceiling")
+    memory.add_argument("--n-points", type=int, nargs="+", default=[1_000_000, 4_000_000],
+                        help="Record lengths to stream (the peak must not grow with them)")
+    memory.add_argument("--chunk-rows", type=int, default=1 << 16)
+    memory.add_argument("--ceiling-mb", type=float, default=48.0)
+
+    batched = subparsers.add_parser("batched", help="Per-trace vs batched per-group preprocessing")
+    batched.add_argument("--n-traces", type=int, default=40)
+    batched.add_argument("--n-points", type=int, default=20_000)
+    batched.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.command == "reader":
+            bench_csv_reader(_collect_paths(args.dir, args.n_files, tmp_dir), repeat=args.repeat)
+        elif args.command == "layouts":
+            traces = load_raw_traces(args.raw) if args.raw else _synthetic_traces(args.n_traces, tmp_dir,
+                                                                                    args.n_points)
+            bench_raw_layouts(traces, tmp_dir, repeat=args.repeat, cut=args.cut)
+        elif args.command == "isf":
+            bench_isf_reader(args.n_points, args.n_files, tmp_dir, repeat=args.repeat)
+        elif args.command == "stacked":
+            traces = load_raw_traces(args.raw) if args.raw else _synthetic_traces(args.n_traces, tmp_dir)
+            bench_stacked_layout(traces, tmp_dir, repeat=args.repeat)
+        elif args.command == "mmap":
+            bench_mapped_read(_synthetic_traces(args.n_traces, tmp_dir, args.n_points), tmp_dir,
+                              cut=args.n_points, window=(args.n_points // 30, args.n_points // 2), repeat=args.repeat)
+        elif args.command == "memory":
+            bench_streaming_memory(args.n_points, args.chunk_rows, args.ceiling_mb, tmp_dir)
+        elif args.command == "batched":
+            bench_batched_preprocess(_synthetic_traces(args.n_traces, tmp_dir, args.n_points), repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
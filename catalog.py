@@ -0,0 +1,165 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from configuration import get_experiment_config
+from reordering import get_folder_index
+
+TEK_PATTERN = re.compile(r"TEK(\d+)\.[A-Z]+$", re.IGNORECASE)
+RAW_EXTENSIONS = ('.csv', '.isf')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tek_number INTEGER,
+    conc TEXT,
+    flow TEXT,
+    pulse TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_group ON files (conc, flow, pulse);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+"""
+
+
+def default_catalog_path(config) -> str:
+    return os.path.join(config.base_dirs.database, "raw_catalog.sqlite")
+
+
+@contextmanager
+def open_catalog(catalog_path):
+    """
+    Opens (and if needed creates) the catalog database; commits on success and closes on exit.
+    """
+    connection = sqlite3.connect(catalog_path)
+    try:
+        connection.executescript(SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def scan_tree(raw_root, extensions=RAW_EXTENSIONS) -> list:
+    """
+    Recursively lists raw acquisition files under raw_root with os.scandir.
+    """
+    found = []
+    stack = [raw_root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, PermissionError):
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(extensions):
+                found.append(entry.path)
+    return found
+
+
+def describe_file(raw_root, path) -> tuple:
+    """
+    Stats one file and derives TEK number and <conc>/<flow>/<pulse> from its location.
+    Returns None when the file cannot be stated (deleted or renamed since the scan).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    relative = os.path.relpath(path, raw_root).split(os.sep)
+    conc, flow, pulse = relative[:3] if len(relative) == 4 else (None, None, None)
+    match = TEK_PATTERN.match(os.path.basename(path))
+    tek_number = int(match.group(1)) if match else None
+    return (os.path.abspath(path), os.path.dirname(os.path.abspath(path)), os.path.basename(path),
+            tek_number, conc, flow, pulse, stat.st_size, stat.st_mtime_ns)
+
+
+def build_catalog(raw_root, catalog_path, workers=16) -> dict:
+    """
+    Indexes the raw tree into the SQLite catalog. stat calls run on a thread pool,
+    which hides the per-file latency of network-mounted archives.
+    Rows of files that disappeared are removed, including files that vanished between the scan
+    and their stat (counted as "vanished"). Returns counts of the refresh.
+    """
+    start = time.perf_counter()
+    paths = scan_tree(raw_root)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = [row for row in pool.map(lambda path: describe_file(raw_root, path), paths) if row is not None]
+
+    indexed_at = time.time()
+    with open_catalog(catalog_path) as connection:
+        root_prefix = os.path.join(os.path.abspath(raw_root), '')
+        known = {path for path, in connection.execute(
+                "SELECT path FROM files WHERE substr(path, 1, length(?)) = ?", (root_prefix, root_prefix))}
+        current = {row[0] for row in rows}
+        connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row + (indexed_at,) for row in rows])
+        connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in known - current])
+
+    counts = {"files": len(rows), "new": len(current - known), "removed": len(known - current),
+              "vanished": len(paths) - len(rows), "seconds": time.perf_counter() - start}
+    vanished = f", {counts['vanished']} vanished during the scan" if counts["vanished"] else ""
+    print(f"📇 Catalogued {counts['files']} files ({counts['new']} new, {counts['removed']} removed{vanished}) "
+          f"in {counts['seconds']:.2f} s")
+    return counts
+
+
+def group_files(catalog_path, conc, flow, pulse) -> list:
+    """
+    Lists the files of one <conc>/<flow>/<pulse> folder, sorted by path.
+    """
+    with open_catalog(catalog_path) as connection:
+        return [path for path, in connection.execute(
+                "SELECT path FROM files WHERE conc = ? AND flow = ? AND pulse = ? ORDER BY path",
+                (str(conc), str(flow), str(pulse)))]
+
+
+def group_by_folder_index(catalog_path, directory) -> dict:
+    """
+    The organize_csv_files grouping as a query: maps folder index (1-6) to the TEK files
+    directly in `directory`, without moving anything.
+    """
+    groups = {}
+    with open_catalog(catalog_path) as connection:
+        rows = connection.execute(
+                "SELECT tek_number, path FROM files WHERE directory = ? AND tek_number IS NOT NULL "
+                "ORDER BY tek_number", (os.path.abspath(directory),))
+        for tek_number, path in rows:
+            groups.setdefault(get_folder_index(tek_number), []).append(path)
+    return groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite catalog of the raw acquisition files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index (or refresh) the raw tree")
+    build_parser.add_argument("--raw-root", default=None, help="Raw folder (default: config raw_folder)")
+    build_parser.add_argument("--catalog", default=None, help="Catalog file (default: <database>/raw_catalog.sqlite)")
+    build_parser.add_argument("--workers", type=int, default=16, help="Threads used for stat calls")
+
+    groups_parser = subparsers.add_parser("groups", help="organize_csv_files-style grouping of a directory")
+    groups_parser.add_argument("directory")
+    groups_parser.add_argument("--catalog", default=None)
+
+    args = parser.parse_args()
+    config = get_experiment_config()
+    catalog_path = args.catalog if args.catalog else default_catalog_path(config)
+
+    if args.command == "build":
+        build_catalog(args.raw_root if args.raw_root else config.base_dirs.raw_folder, catalog_path, args.workers)
+    elif args.command == "groups":
+        for folder_index, paths in sorted(group_by_folder_index(catalog_path, args.directory).items()):
+            print(f"{folder_index}: {len(paths)} files")
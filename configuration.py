@@ -88,6 +88,50 @@ class BaseDirsConfig:
     raw_folder_damage: str
 
 
+@dataclass
+class RawLayoutConfig:
+    chunk_rows: int  # rows per chunk, None for contiguous storage
+    shuffle: bool
+    compression: str  # "gzip", "lzf" or None
+    compression_opts: int  # gzip level, ignored for lzf
+    dtype: str  # "float64" or "float32"
+    adc_codes: bool  # store quantised channels as lossless int16 codes
+
+
+@dataclass
+class IngestConfig:
+    default_format: str  # "csv" or "isf"
+    formats: Dict[str, str]  # "<conc>/<flow>/<pulse>" -> format, overrides default_format
+    stream_threshold_mb: float  # CSV records at least this large are streamed chunk by chunk
+    stream_chunk_rows: int  # rows parsed and written per chunk when streaming
+
+
+@dataclass
+class QualityConfig:
+    enabled: bool  # run the ingestion quality gate
+    max_nan_fraction: float  # per column
+    max_clipped_fraction: float  # samples saturated at a channel's full-scale rails (from the record header)
+    min_channel_range: float  # peak-to-peak at or below this marks a flat (dead) channel
+
+
+@dataclass
+class OutputConfig:
+    packed: bool  # processed DB: pack per-trace arrays into one dataset per kind and group
+    derived_columns: bool  # do not write arrays that derived_columns.py recomputes exactly
+    swmr: bool  # write the processed DB in SWMR mode (packed layout) so it can be read during the run
+    flush_seconds: float  # SWMR: longest time between flushes
+    versioned: bool  # write each run to <database>/runs/<id>.h5 instead of overwriting the processed DB
+    lossy_abs_error: float  # None: lossless; else lossy_keys are scale-offset stored to this absolute error
+    lossy_keys: list  # result arrays that may be stored lossily
+    lod_factors: list  # min/max pyramid levels of dn, Rise and Fall for plotting (see lod.py), [] for none
+
+
+@dataclass
+class CacheConfig:
+    enabled: bool  # reuse interpret_dataset results for unchanged traces and fit settings
+    max_mb: float  # size bound of <database>/fit_cache, least recently used entries are evicted
+
+
 @dataclass
 class ExperimentConfig:
     optics: OpticsConfig
@@ -99,6 +143,11 @@ class ExperimentConfig:
     potentials: FieldsConfig
     base_dirs: BaseDirsConfig
     directories: DirectoryConfig  # added field for directory boundaries
+    raw_layout: RawLayoutConfig
+    ingest: IngestConfig
+    quality: QualityConfig
+    output: OutputConfig
+    cache: CacheConfig
 
 
 def get_experiment_config() -> ExperimentConfig:
@@ -328,6 +377,40 @@ def get_experiment_config() -> ExperimentConfig:
                             "00625/0/100/TEK00005": DirBoundary(st=643, end=3316, tr1=None, tr2=None, accept=1),
                     }
             ),
+            raw_layout=RawLayoutConfig(
+                    chunk_rows=None,
+                    shuffle=False,
+                    compression=None,
+                    compression_opts=None,
+                    dtype="float64",
+                    adc_codes=False,
+            ),
+            ingest=IngestConfig(
+                    default_format="csv",
+                    formats={},
+                    stream_threshold_mb=64.0,
+                    stream_chunk_rows=1 << 16,
+            ),
+            quality=QualityConfig(
+                    enabled=True,
+                    max_nan_fraction=0.01,
+                    max_clipped_fraction=0.05,
+                    min_channel_range=0.0,
+            ),
+            output=OutputConfig(
+                    packed=False,
+                    derived_columns=True,
+                    swmr=False,
+                    flush_seconds=5.0,
+                    versioned=False,
+                    lossy_abs_error=None,
+                    lossy_keys=["dn", "Rise", "Fall", "s_rise_fit", "s_fall_fit"],
+                    lod_factors=[4, 16, 64],
+            ),
+            cache=CacheConfig(
+                    enabled=True,
+                    max_mb=2048.0,
+            ),
     )
 
 
@@ -1,6 +1,5 @@
 import sys
 
-import h5py
 import numpy as np
 import plotly.graph_objects as go
 import sympy as sp
@@ -9,6 +8,8 @@ from pylab import mpl
 from tabulate import tabulate
 from configuration import get_experiment_config
 from analizer import compute_induced_dipole, conver_p
+from scalar_table import load_group_scalars
+from live_db import open_processed
 
 if sys.platform == "darwin":
     mpl.use("macosx")
@@ -47,36 +48,11 @@ def compute_delta_alpha_mu(c1, K):
 
 
 def load_group_data(group):
-    e_squared, dn_infinity = [], []
-    rise_c1, rise_c2, rise_d, fall_c1, fall_d = [], [], [], [], []
-
-    for filename in group:
-        dataset = group[filename]
-        if "e_square" in dataset:
-            e_squared.append(np.array(dataset["e_square"]))
-        if "dn_infinity" in dataset:
-            dn_infinity.append(np.array(dataset["dn_infinity"]))
-        if "Rise_c1" in dataset:
-            rise_c1.append(np.array(dataset["Rise_c1"]))
-        if "Rise_c2" in dataset:
-            rise_c2.append(np.array(dataset["Rise_c2"]))
-        if "Rise_D" in dataset:
-            rise_d.append(np.array(dataset["Rise_D"]))
-        if "Fall_c1" in dataset:
-            fall_c1.append(np.array(dataset["Fall_c1"]))
-        if "Fall_D" in dataset:
-            fall_d.append(np.array(dataset["Fall_D"]))
-
-    if not e_squared or not dn_infinity:
-        return None, None, None, None, None, None, None, None, None
-
-    e_squared = np.array(e_squared).flatten()
-    dn_infinity = np.array(dn_infinity).flatten()
-    rise_c1 = np.array(rise_c1).flatten()
-    rise_c2 = np.array(rise_c2).flatten()
-    rise_d = np.array(rise_d).flatten()
-    fall_c1 = np.array(fall_c1).flatten()
-    fall_d = np.array(fall_d).flatten()
+    scalars = load_group_scalars(group, ("e_square", "dn_infinity", "Rise_c1", "Rise_c2", "Rise_D",
+                                         "Fall_c1", "Fall_D"))
+    e_squared, dn_infinity = scalars["e_square"], scalars["dn_infinity"]
+    rise_c1, rise_c2, rise_d = scalars["Rise_c1"], scalars["Rise_c2"], scalars["Rise_D"]
+    fall_c1, fall_d = scalars["Fall_c1"], scalars["Fall_D"]
 
     if e_squared.size == 0 or dn_infinity.size == 0:
         return None, None, None, None, None, None, None, None, None
@@ -92,7 +68,7 @@ def plot_all_kerr_data(concentrations, pulses):
     processed_hdf_path = '/Users/alisher/IdeaProjects/TEB_REMAKE/databases/processed_experiment_data.h5'
     data = {conc: {} for conc in concentrations}
 
-    with h5py.File(processed_hdf_path, 'r') as hdf_file:
+    with open_processed(processed_hdf_path) as hdf_file:
         for conc in concentrations:
             for pulse in pulses:
                 group_path = f"{conc}/0/{pulse}"
@@ -1,29 +1,20 @@
+import argparse
 import os
+from multiprocessing import Pool
 
 import h5py
-import pandas as pd
+import numpy as np
 from tqdm import tqdm
 
+from catalog import default_catalog_path, group_files
 from configuration import get_experiment_config
-
-
-def read_oscilloscope_csv(file_path):
-    """
-    Reads an oscilloscope CSV file.
-    Skips the header and returns the data as a numpy array.
-    """
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
-    for i, line in enumerate(lines):
-        if line.strip().startswith("TIME,CH1,CH2"):
-            header_index = i
-            break
-    else:
-        raise ValueError("Could not find the data header in the file.")
-    df = pd.read_csv(file_path, skiprows=header_index, usecols=[0, 1, 2], encoding='latin1')
-    df = df.iloc[:, :3]
-
-    return df.apply(pd.to_numeric, errors='coerce').to_numpy()
+from oscilloscope import (is_record_file, read_oscilloscope_csv_header, read_waveform_with_header, record_name,
+                          waveform_format)
+from quality import (QUARANTINE_GROUP, combine_trace_stats, quality_reasons, quarantine_attrs, quarantine_path,
+                     trace_stats)
+from raw_db import (read_manifest, source_fingerprint, stat_matches, stored_hash, stream_raw_trace,
+                    update_manifest, write_raw_trace)
+from stacked_db import STACKED_FILENAME, build_stacked_database, pulse_group_paths
 
 
 def collect_csv_files(directory, recursive=False):
@@ -49,45 +40,314 @@ def collect_csv_files(directory, recursive=False):
     return csv_files
 
 
-def create_hdf_database():
+def collect_record_files(directory, fmt="csv"):
+    """
+    Collects the raw records of one format in the given directory:
+    every CSV file, or the CH1 file of each .isf pair.
+    """
+    if fmt == "csv":
+        return collect_csv_files(directory, recursive=False)
+    if not os.path.exists(directory):
+        print(f"Directory does not exist: {directory}")
+        return []
+    return [os.path.join(directory, filename) for filename in os.listdir(directory)
+            if is_record_file(filename, fmt) and os.path.isfile(os.path.join(directory, filename))]
+
+
+def dataset_name(raw_file):
+    """Raw dataset name of a source file (file name without extension or channel suffix)."""
+    return record_name(raw_file)
+
+
+def parse_record_job(job):
+    """
+    Worker entry point: fingerprints and parses one (group_path, raw_file, known_sha1) job
+    with the reader matching the file format (CSV or .isf).
+    Returns (group_path, raw_file, data, header, source, error). When the content hash
+    equals known_sha1 the file is not parsed and data is None. source is kept when only
+    the parsing failed, so unreadable files can be quarantined.
+    """
+    group_path, raw_file, known_sha1 = job
+    source = None
+    try:
+        source = source_fingerprint(raw_file)
+        if source["source_sha1"] == known_sha1:
+            return group_path, raw_file, None, None, source, None
+        data, header = read_waveform_with_header(raw_file)
+        return group_path, raw_file, data, header, source, None
+    except Exception as e:
+        return group_path, raw_file, None, None, source, str(e)
+
+
+def parse_record_jobs(jobs, workers=1):
+    """
+    Parses the jobs serially or on a process pool.
+    Results are yielded in job order so the single writer stays deterministic.
+    """
+    if workers <= 1:
+        yield from map(parse_record_job, jobs)
+        return
+
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with Pool(processes=workers) as pool:
+        yield from pool.imap(parse_record_job, jobs, chunksize=chunksize)
+
+
+def collect_ingest_jobs(config, hdf, catalog_path=None):
+    """
+    Creates the <conc>/<flow>/<pulse> groups and lists the raw records to ingest, in a fixed order.
+    The file format of each folder comes from config.ingest (CSV unless overridden).
+    With a catalog_path the files are looked up in the SQLite catalog instead of listing directories.
+    Returns a list of (group_path, raw_file) pairs.
+    """
+    jobs = []
+    for conc in config.potentials.concentrations:
+        for flow in config.potentials.flows:
+            for pulse in config.potentials.pulse_width:
+                group_path = f"{conc}/{flow}/{pulse}"
+                hdf.require_group(group_path)
+                dir_path = os.path.join(config.base_dirs.raw_folder, conc, str(flow), str(pulse))
+                fmt = config.ingest.formats.get(group_path, config.ingest.default_format)
+                if catalog_path:
+                    raw_files = [path for path in group_files(catalog_path, conc, flow, pulse)
+                                 if is_record_file(path, fmt)]
+                else:
+                    raw_files = sorted(collect_record_files(dir_path, fmt))
+
+                if not raw_files:
+                    tqdm.write(f"⚠️ No {fmt.upper()} files found in {dir_path}")
+                jobs.extend((group_path, raw_file) for raw_file in raw_files)
+    return jobs
+
+
+def find_raw_dataset(hdf, group_path, dset_name):
+    """
+    Returns the raw dataset of a record from its pulse group or from the quarantine group, or None.
+    """
+    for path in (group_path, quarantine_path(group_path)):
+        if path in hdf and dset_name in hdf[path]:
+            return hdf[path][dset_name]
+    return None
+
+
+def route_trace(hdf, group_path, dset_name, reasons, stats=None):
+    """
+    Applies the quality verdict to a freshly written trace in its pulse group: failing traces are
+    moved to quarantine/<group_path> with their reasons, passing ones replace any stale quarantine entry.
+    """
+    key = f"{quarantine_path(group_path)}/{dset_name}"
+    if key in hdf:
+        del hdf[key]
+    if not reasons:
+        return
+    hdf.require_group(quarantine_path(group_path))
+    hdf.move(f"{group_path}/{dset_name}", key)
+    hdf[key].attrs.update(quarantine_attrs(reasons, stats))
+
+
+def write_checked_trace(hdf, group_path, dset_name, data, header, source, config) -> list:
+    """
+    Writes a parsed record and runs the ingestion quality gate on it (config.quality).
+    Returns the quarantine reasons, empty if the trace was accepted.
+    """
+    write_raw_trace(hdf.require_group(group_path), dset_name, data, source, config.raw_layout, header)
+    stats = trace_stats(data) if config.quality.enabled else None
+    reasons = quality_reasons(stats, header, config) if stats is not None else []
+    route_trace(hdf, group_path, dset_name, reasons, stats)
+    return reasons
+
+
+def quarantine_unreadable(hdf, group_path, dset_name, source, error) -> None:
+    """
+    Records a file that could not be parsed as an empty dataset in the quarantine group,
+    with reason 'unreadable' and the parser error.
+    """
+    group = hdf.require_group(group_path)
+    if dset_name in group:
+        del group[dset_name]
+    quarantine_group = hdf.require_group(quarantine_path(group_path))
+    if dset_name in quarantine_group:
+        del quarantine_group[dset_name]
+    dset = quarantine_group.create_dataset(dset_name, shape=(0, 3), dtype=np.float64)
+    dset.attrs.update(quarantine_attrs(["unreadable"]))
+    dset.attrs["quarantine_error"] = error
+    dset.attrs.update(source)
+
+
+def is_streamed(raw_file, config):
+    """
+    True for CSV records large enough to be streamed into the database instead of parsed whole.
+    """
+    return (waveform_format(raw_file) == "csv"
+            and os.path.getsize(raw_file) >= config.ingest.stream_threshold_mb * 2 ** 20)
+
+
+def stream_record_job(hdf, job, config):
+    """
+    Writer-side counterpart of parse_record_job for large CSV records: fingerprints the file
+    and streams it chunk by chunk into its dataset. Returns the quarantine reasons of the
+    (re)written trace, or None if the content was unchanged.
+    """
+    group_path, raw_file, known_sha1 = job
+    dset_name = dataset_name(raw_file)
+    source = source_fingerprint(raw_file)
+    if source["source_sha1"] == known_sha1:
+        update_manifest(find_raw_dataset(hdf, group_path, dset_name), source)
+        return None
+    return stream_checked_trace(hdf, group_path, dset_name, raw_file, source, config)
+
+
+def stream_checked_trace(hdf, group_path, dset_name, raw_file, source, config) -> list:
+    """
+    Streams a large CSV record into its pulse group, collecting the quality stats chunk by chunk,
+    and quarantines it afterwards if it fails the gate. Returns the quarantine reasons.
+    """
+    chunk_stats = []
+    group = hdf.require_group(group_path)
+    try:
+        stream_raw_trace(group, dset_name, raw_file, source, config.raw_layout, config.ingest.stream_chunk_rows,
+                         (lambda chunk: chunk_stats.append(trace_stats(chunk))) if config.quality.enabled else None)
+    except Exception:
+        if dset_name in group:
+            del group[dset_name]  # do not leave a partially streamed trace behind
+        raise
+    if not chunk_stats:
+        route_trace(hdf, group_path, dset_name, [])
+        return []
+    stats = combine_trace_stats(chunk_stats)
+    reasons = quality_reasons(stats, read_oscilloscope_csv_header(raw_file), config)
+    route_trace(hdf, group_path, dset_name, reasons, stats)
+    return reasons
+
+
+def select_changed_jobs(hdf, jobs):
+    """
+    Drops the files whose size and mtime match the manifest stored in the raw database.
+    Files that need a look are paired with their recorded hash, so a touched but
+    unchanged file is hashed but not re-parsed.
+    """
+    changed, n_unchanged = [], 0
+    for group_path, raw_file in jobs:
+        dset = find_raw_dataset(hdf, group_path, dataset_name(raw_file))
+        if dset is not None and stat_matches(dset, raw_file):
+            n_unchanged += 1
+            continue
+        changed.append((group_path, raw_file, None if dset is None else stored_hash(hdf, dset.name)))
+    return changed, n_unchanged
+
+
+def report_missing_sources(hdf, jobs):
+    """
+    Reports raw datasets whose recorded source file is no longer part of the raw tree.
+    """
+    group_paths = sorted({group_path for group_path, _ in jobs} | set(hdf_pulse_groups(hdf)))
+    current = {f"{group_path}/{dataset_name(raw_file)}" for group_path, raw_file in jobs}
+    missing = [(key, path) for key, path in read_manifest(hdf, group_paths).items() if key not in current]
+    for key, path in missing:
+        tqdm.write(f"🗑️ Source of {key} no longer exists: {path}")
+    return missing
+
+
+def hdf_pulse_groups(hdf):
+    """Lists the <conc>/<flow>/<pulse> group paths present in the raw database (quarantine excluded)."""
+    return [f"{conc}/{flow}/{pulse}" for conc in hdf if conc != QUARANTINE_GROUP
+            for flow in hdf[conc] for pulse in hdf[conc][flow]]
+
+
+def create_hdf_database(workers=1, incremental=False, catalog_path=None):
+    """
+    Parses every raw record (CSV or .isf, see config.ingest) into experiment_data_pulses.h5.
+    With workers > 1 the parsing runs on a process pool while this process is the only writer.
+    With incremental=True the existing database is kept and only new or changed files
+    (according to the per-dataset source manifest) are parsed.
+    With a catalog_path, file discovery is a query against the raw file catalog (see catalog.py).
+    CSV records above config.ingest.stream_threshold_mb are streamed by this process in
+    bounded memory instead of being parsed whole by the workers.
+    """
     config = get_experiment_config()
     hdf_filename = os.path.join(config.base_dirs.database, "experiment_data_pulses.h5")
-    raw_data_base = config.base_dirs.raw_folder
 
-    with h5py.File(hdf_filename, 'w') as hdf:
+    with h5py.File(hdf_filename, 'a' if incremental else 'w') as hdf:
+        jobs = collect_ingest_jobs(config, hdf, catalog_path)
+        n_unchanged, n_missing = 0, 0
+        if incremental:
+            n_missing = len(report_missing_sources(hdf, jobs))
+            jobs, n_unchanged = select_changed_jobs(hdf, jobs)
+        else:
+            jobs = [(group_path, raw_file, None) for group_path, raw_file in jobs]
+        stream_jobs = [job for job in jobs if is_streamed(job[1], config)]
+        jobs = [job for job in jobs if not is_streamed(job[1], config)]
 
-        pbar = tqdm(config.potentials.concentrations,
-                    desc="Concentrations",
+        pbar = tqdm(parse_record_jobs(jobs, workers),
+                    total=len(jobs),
+                    desc="Files",
                     leave=True,
                     dynamic_ncols=True)
 
-        for conc in pbar:
-            pbar.set_description(f"Processing: {conc:>10}")  # Keeps the description inline
-            conc_group = hdf.create_group(conc)
-
-            for flow in config.potentials.flows:
-                flow_group = conc_group.create_group(str(flow))
-                for pulse in config.potentials.pulse_width:
-                    pulse_group = flow_group.create_group(str(pulse))
-                    dir_path = os.path.join(raw_data_base, conc, str(flow), str(pulse))
-                    csv_files = collect_csv_files(dir_path, recursive=False)
-
-                    if not csv_files:
-                        tqdm.write(f"⚠️ No CSV files found in {dir_path}")
-                    for csv_file in csv_files:
-                        try:
-                            data = read_oscilloscope_csv(csv_file)
-                        except Exception as e:
-                            tqdm.write(f"❌ Skipping {csv_file} due to error: {e}")
-                            continue
-
-                        dset_name = os.path.splitext(os.path.basename(csv_file))[0]
-                        pulse_group.create_dataset(dset_name, data=data)
+        n_written, n_quarantined = 0, 0
+        for group_path, raw_file, data, header, source, error in pbar:
+            pbar.set_description(f"Processing: {group_path:>14}")  # Keeps the description inline
+            dset_name = dataset_name(raw_file)
+            if error is not None:
+                tqdm.write(f"❌ Skipping {raw_file} due to error: {error}")
+                if source is not None:
+                    quarantine_unreadable(hdf, group_path, dset_name, source, error)
+                    n_quarantined += 1
+                continue
+
+            if data is None:
+                update_manifest(find_raw_dataset(hdf, group_path, dset_name), source)
+                n_unchanged += 1
+                continue
+
+            reasons = write_checked_trace(hdf, group_path, dset_name, data, header, source, config)
+            if reasons:
+                tqdm.write(f"🚫 Quarantined {group_path}/{dset_name}: {', '.join(reasons)}")
+                n_quarantined += 1
+            n_written += 1
 
         pbar.close()
 
+        for job in tqdm(stream_jobs, desc="Streaming", leave=True, dynamic_ncols=True, disable=not stream_jobs):
+            try:
+                reasons = stream_record_job(hdf, job, config)
+            except Exception as e:
+                tqdm.write(f"❌ Skipping {job[1]} due to error: {e}")
+                continue
+            if reasons is None:
+                n_unchanged += 1
+                continue
+            if reasons:
+                tqdm.write(f"🚫 Quarantined {job[0]}/{dataset_name(job[1])}: {', '.join(reasons)}")
+                n_quarantined += 1
+            n_written += 1
+
+    if incremental:
+        print(f"Written: {n_written}, unchanged: {n_unchanged}, missing sources: {n_missing}")
+    if n_quarantined:
+        print(f"🚫 {n_quarantined} traces quarantined (see quality.py for the report)")
     print("✅ HDF5 database creation complete.")
 
 
 if __name__ == '__main__':
-    create_hdf_database()
+    parser = argparse.ArgumentParser(description="Build the raw HDF5 database from the oscilloscope CSV or .isf files.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of parser processes (default: 1, serial)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep the existing database and ingest only new or changed files")
+    parser.add_argument("--catalog", nargs='?', const="", default=None,
+                        help="Discover files through the SQLite catalog (default path if no value is given)")
+    parser.add_argument("--stacked", action="store_true",
+                        help=f"Also write the stacked per-group layout ({STACKED_FILENAME})")
+    args = parser.parse_args()
+
+    experiment_config = get_experiment_config()
+    catalog_path = args.catalog
+    if catalog_path == "":
+        catalog_path = default_catalog_path(experiment_config)
+    create_hdf_database(workers=args.workers, incremental=args.incremental, catalog_path=catalog_path)
+    if args.stacked:
+        database = experiment_config.base_dirs.database
+        build_stacked_database(os.path.join(database, "experiment_data_pulses.h5"),
+                               os.path.join(database, STACKED_FILENAME),
+                               pulse_group_paths(experiment_config), experiment_config.raw_layout)
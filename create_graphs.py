@@ -1,13 +1,13 @@
 import os
 from pathlib import Path
 
-import h5py
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 
 from configuration import get_experiment_config
+from live_db import open_processed
 from plot_utilities import KerrPlotConfig
 
 def plot_all_kerr_data(concs: list, pulses: list):
@@ -21,7 +21,7 @@ def plot_all_kerr_data(concs: list, pulses: list):
     color_index = 0
     for conc in concs:
         for pulse in pulses:
-            with h5py.File(processed_hdf_filename, 'r') as processed_hdf:
+            with open_processed(processed_hdf_filename) as processed_hdf:
                 group_path = f"{conc}/0/{pulse}"
                 if group_path not in processed_hdf:
                     print(f"❌ Group {group_path} not found in the database.")
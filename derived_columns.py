@@ -0,0 +1,150 @@
+from collections.abc import Mapping
+from types import SimpleNamespace
+
+import numpy as np
+
+from analizer import double_fall, double_rise, get_scale
+
+
+def standard_rise(dn_rise: np.ndarray, n_std: int) -> np.ndarray:
+    """Rise transient on the standard time grid: truncated, or padded with its last value."""
+    dn_rise_std = np.zeros(n_std)
+    if len(dn_rise) <= n_std:
+        dn_rise_std[:len(dn_rise)] = dn_rise
+        dn_rise_std[len(dn_rise):] = dn_rise[-1] if len(dn_rise) > 0 else 0
+    else:
+        dn_rise_std = dn_rise[:n_std]
+    return dn_rise_std
+
+
+def standard_fall(dn_fall: np.ndarray, n_std: int) -> np.ndarray:
+    """Fall transient on the standard time grid: truncated, or padded with zeros."""
+    dn_fall_std = np.zeros(n_std)
+    if len(dn_fall) <= n_std:
+        dn_fall_std[:len(dn_fall)] = dn_fall
+    else:
+        dn_fall_std[:n_std] = dn_fall[:n_std]
+    return dn_fall_std
+
+
+def _scalar(view, key):
+    value = float(np.asarray(view[key]))
+    if not np.isfinite(value):
+        raise KeyError(key)
+    return value
+
+
+def _time(view):
+    n_samples = int(_scalar(view, "n_samples"))
+    time = _scalar(view, "time_origin") + _scalar(view, "time_step") * np.arange(n_samples)
+    time *= _scalar(view, "time_multiplier")
+    return time
+
+
+def _rise_time(view):
+    time, st, end = view["time"], int(_scalar(view, "Rise_start")), int(_scalar(view, "Rise_end"))
+    return time[st:end] - time[st]
+
+
+def _fall_time(view):
+    time, end = view["time"], int(_scalar(view, "Rise_end"))
+    return time[end:] - time[end]
+
+
+def _time_std(view):
+    return np.arange(0, _scalar(view, "standard_time"), _scalar(view, "Sample_rate"))
+
+
+def _s_rise_fit(view):
+    fit = double_rise(np.asarray(view["Rise_time"]), _scalar(view, "Rise_D"), _scalar(view, "Rise_c1"),
+                      _scalar(view, "Rise_c2"), _scalar(view, "Rise_p"))
+    return fit / np.max(fit)
+
+
+def _s_fall_fit(view):
+    fit_config = SimpleNamespace(fit=SimpleNamespace(exp_smoothing_factor=_scalar(view, "exp_smoothing_factor")))
+    fit = double_fall(np.asarray(view["Fall_time"]), _scalar(view, "Fall_D"), _scalar(view, "Fall_c1"),
+                      _scalar(view, "Fall_delay"), _scalar(view, "Fall_b"), fit_config)
+    return fit / np.max(fit)
+
+
+def _rise_scaled(view):
+    return get_scale(standard_rise(np.asarray(view["Rise"]), len(view["Rise_time_std"])))
+
+
+def _fall_scaled(view):
+    return get_scale(standard_fall(np.asarray(view["Fall"]), len(view["Fall_time_std"])))
+
+
+# key -> (function of a result view, keys it reads)
+DERIVED_COLUMNS = {
+        "time": (_time, ("time_origin", "time_step", "time_multiplier", "n_samples")),
+        "Rise_time": (_rise_time, ("time", "Rise_start", "Rise_end")),
+        "Fall_time": (_fall_time, ("time", "Rise_end")),
+        "Rise_time_std": (_time_std, ("standard_time", "Sample_rate")),
+        "Fall_time_std": (_time_std, ("standard_time", "Sample_rate")),
+        "s_rise_fit": (_s_rise_fit, ("Rise_time", "Rise_D", "Rise_c1", "Rise_c2", "Rise_p")),
+        "s_fall_fit": (_s_fall_fit, ("Fall_time", "Fall_D", "Fall_c1", "Fall_delay", "Fall_b",
+                                     "exp_smoothing_factor")),
+        "Rise_scaled": (_rise_scaled, ("Rise", "Rise_time_std")),
+        "Fall_scaled": (_fall_scaled, ("Fall", "Fall_time_std")),
+}
+
+
+def required_keys(keys) -> list:
+    """The keys plus everything the derived ones among them are computed from."""
+    found = list(dict.fromkeys(keys))
+    for key in found:
+        found.extend(dep for dep in DERIVED_COLUMNS.get(key, ((), ()))[1] if dep not in found)
+    return found
+
+
+class ResultView(Mapping):
+    """
+    Read-only view of one processed trace (an h5py trace group or a dict of loaded results).
+    Stored keys are returned as they are; derived keys that were not written are computed
+    on first access from the stored parameters and cached.
+    """
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.cache = {}
+
+    def __getitem__(self, key):
+        if key in self.stored:
+            return self.stored[key]
+        if key not in DERIVED_COLUMNS:
+            raise KeyError(key)
+        if key not in self.cache:
+            self.cache[key] = DERIVED_COLUMNS[key][0](self)
+        return self.cache[key]
+
+    def __contains__(self, key):
+        return key in self.stored or (key in DERIVED_COLUMNS
+                                      and all(dep in self for dep in DERIVED_COLUMNS[key][1]))
+
+    def __iter__(self):
+        yield from self.stored
+        yield from (key for key in DERIVED_COLUMNS if key not in self.stored and key in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def persisted_results(results: dict) -> dict:
+    """
+    Drops the derived keys that the registry regenerates bit-for-bit from the remaining results,
+    so only non-recomputable data is written. Keys that do not round-trip exactly are kept.
+    """
+    kept = dict(results)
+    for key in reversed(list(DERIVED_COLUMNS)):
+        if key not in kept:
+            continue
+        candidate = {k: v for k, v in kept.items() if k != key}
+        try:
+            regenerated = ResultView(candidate)[key]
+        except (KeyError, ValueError, TypeError):
+            continue
+        if np.array_equal(np.asarray(regenerated), np.asarray(results[key]), equal_nan=True):
+            kept = candidate
+    return kept
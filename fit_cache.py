@@ -0,0 +1,185 @@
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from analizer import trace_boundary
+from configuration import get_experiment_config
+from derived_columns import ResultView, persisted_results
+
+CACHE_VERSION = 1  # bump when interpret_dataset changes what it computes
+CACHE_DIRNAME = "fit_cache"
+CONFIG_FIELDS = {  # the settings interpret_dataset reads (preprocess_trace, fit_preprocessed, analizer.py)
+        "optics": ("d", "lambda_", "I_ref"),
+        "material": ("eta", "diameter"),
+        "electric": ("k_b", "T"),
+        "setup": ("time_multiplier", "ch1_multiplier", "ch2_multiplier", "cut"),
+        "reg": ("lambda_reg", "n_tau"),
+        "fit": ("gradient_threshold", "gradient_award", "sgf_window", "exp_smoothing_factor", "d_fall_guess",
+                "standard_time"),
+}
+
+
+def config_json(config) -> str:
+    """
+    The config fields that change interpret_dataset results (CONFIG_FIELDS) as JSON, so edits to
+    settings it does not read (plotting, rotation, ...) keep the fingerprint.
+    """
+    fields = {section: {name: getattr(getattr(config, section), name, None) for name in names}
+              for section, names in CONFIG_FIELDS.items()}
+    return json.dumps(fields, sort_keys=True, default=repr)
+
+
+def config_fingerprint(config) -> str:
+    """Hash of config_json."""
+    return hashlib.sha1(config_json(config).encode()).hexdigest()
+
+
+def trace_key(data, config, trace_path: str, time_step=None, intensity_step=None, fingerprint=None) -> str:
+    """
+    Cache key of one interpret_dataset call: a hash of the raw samples it sees (the first
+    setup.cut rows), the stored time/intensity steps, the DirBoundary it is processed with
+    (analizer.trace_boundary, so boundaries derived from the field pulse count too) and the config
+    fingerprint. data is an (N, 3) array or a (time, ch1, ch2) tuple of columns.
+    """
+    digest = hashlib.sha1(f"{CACHE_VERSION}|{fingerprint or config_fingerprint(config)}".encode())
+    columns = data if isinstance(data, tuple) else data.T
+    boundary = trace_boundary(config, trace_path, columns[1][:config.setup.cut])
+    digest.update(repr((time_step, intensity_step, dataclasses.astuple(boundary))).encode())
+    for column in columns:
+        digest.update(np.ascontiguousarray(column[:config.setup.cut], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def cache_entry_path(directory, key: str) -> str:
+    return os.path.join(directory, f"{key}.npz")
+
+
+def load_cache_entry(path):
+    """The results stored in one cache file, derived columns recomputed, or None if it cannot be read."""
+    try:
+        with np.load(path) as stored:
+            view = ResultView({name: stored[name][()] if stored[name].ndim == 0 else stored[name]
+                               for name in stored.files})
+            return {name: view[name] for name in view}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class FitCache:
+    """
+    Persistent cache of interpret_dataset results, one .npz per key in a directory.
+    Hits refresh the file's mtime, and when the directory grows beyond max_mb the least
+    recently used entries are evicted down to 90% of it. fingerprint is the config_fingerprint
+    of the run, computed once and passed to trace_key.
+    """
+
+    def __init__(self, directory, max_mb: float, fingerprint=None):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.max_bytes = max_mb * 2 ** 20
+        self.hits = self.misses = self.evicted = 0
+        os.makedirs(directory, exist_ok=True)
+        self.entries = {entry.name[:-4]: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                        for entry in os.scandir(directory) if entry.name.endswith(".npz")}
+        self.size = sum(size for _, size in self.entries.values())
+        if self.size > self.max_bytes:
+            self.evict(0.9 * self.max_bytes)
+
+    def _path(self, key: str) -> str:
+        return cache_entry_path(self.directory, key)
+
+    def get(self, key: str):
+        """The cached results of key, or None on a miss."""
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        results = load_cache_entry(self._path(key))
+        if results is None:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._touch(key)
+        self.hits += 1
+        return results
+
+    def _touch(self, key: str) -> None:
+        os.utime(self._path(key))
+        self.entries[key] = (os.stat(self._path(key)).st_mtime_ns, self.entries[key][1])
+
+    def record(self, key: str, results: dict, hit: bool) -> None:
+        """
+        Bookkeeping of a lookup a worker process did itself with load_cache_entry: a hit
+        refreshes the entry, a miss stores the results the worker computed.
+        """
+        if hit and key in self.entries:
+            self._touch(key)
+            self.hits += 1
+            return
+        self.misses += 1
+        self.put(key, results)
+
+    def put(self, key: str, results: dict) -> None:
+        """
+        Stores results under key (written to a temporary file first) and evicts if over budget.
+        Derived columns are left out and recomputed on get (see derived_columns.py).
+        """
+        path = self._path(key)
+        with open(f"{path}.tmp", 'wb') as f:
+            np.savez(f, **persisted_results(results))
+        os.replace(f"{path}.tmp", path)
+        stat = os.stat(path)
+        if key in self.entries:
+            self.size -= self.entries[key][1]
+        self.entries[key] = (stat.st_mtime_ns, stat.st_size)
+        self.size += stat.st_size
+        if self.size > self.max_bytes:
+            self.evict(0.9 * self.max_bytes)
+
+    def _remove(self, key: str) -> None:
+        _, size = self.entries.pop(key)
+        self.size -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, target_bytes: float) -> None:
+        """Removes least recently used entries until the cache holds at most target_bytes."""
+        for key in sorted(self.entries, key=lambda k: self.entries[k][0]):
+            if self.size <= target_bytes:
+                break
+            self._remove(key)
+            self.evicted += 1
+
+    def clear(self) -> None:
+        self.evict(0)
+
+    def report(self) -> str:
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return (f"🗃️ Fit cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{self.evicted} evicted, {len(self.entries)} entries, {self.size / 2 ** 20:.1f} MB")
+
+
+def open_fit_cache(config):
+    """The FitCache of config.cache (under <database>/fit_cache), or None when disabled."""
+    if not config.cache.enabled:
+        return None
+    return FitCache(os.path.join(config.base_dirs.database, CACHE_DIRNAME), config.cache.max_mb,
+                    config_fingerprint(config))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the interpret_dataset result cache.")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached result")
+    args = parser.parse_args()
+
+    config = get_experiment_config()
+    cache = FitCache(os.path.join(config.base_dirs.database, CACHE_DIRNAME), config.cache.max_mb)
+    if args.clear:
+        cache.clear()
+    print(cache.report())
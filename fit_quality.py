@@ -1,12 +1,14 @@
 from dataclasses import dataclass, field
 from pathlib import Path
 
-import h5py
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 
+from live_db import open_processed
+from lod import load_plot_results, lod_factor, plot_points
+
 @dataclass
 class PlotConfig:
     plot_title: str = ""
@@ -104,8 +106,9 @@ def plot_dn_values(hdf_filename, conc_selection=None, pulse_selection=None):
 
     fig = go.Figure()
     data_list = []
+    pixel_width = plot_config.get_layout()["width"]
 
-    with h5py.File(hdf_filename, 'r') as processed_hdf:
+    with open_processed(hdf_filename) as processed_hdf:
         for conc in conc_selection:
             for pulse in pulse_selection:
                 for flow in processed_hdf.get(conc, {}):
@@ -113,21 +116,22 @@ def plot_dn_values(hdf_filename, conc_selection=None, pulse_selection=None):
                     if group_path not in processed_hdf:
                         continue
 
-                    for dataset_name in processed_hdf[group_path]:
-                        dataset = processed_hdf[group_path][dataset_name]
+                    group_results = load_plot_results(processed_hdf[group_path], "Rise",
+                                                      ("e_square", "s_rise_fit", "Rise_time"))
+                    for dataset_name, dataset in group_results.items():
                         voltage = np.sqrt(np.array(dataset["e_square"]))
-                        dn_values = dataset['Rise'][:]
-                        dn_values /= np.max(dn_values)
-                        s_fit = dataset['s_rise_fit'][:]
-                        time_values = dataset['Rise_time'][:]
-                        data_list.append((voltage, time_values, dn_values, s_fit, group_path))
+                        time_values, dn_values = plot_points(dataset, "Rise", "Rise_time", pixel_width)
+                        dn_values = dn_values / np.max(dn_values)
+                        factor = lod_factor(dataset, "Rise", pixel_width)
+                        fit_time, s_fit = dataset['Rise_time'][::factor], dataset['s_rise_fit'][::factor]
+                        data_list.append((voltage, time_values, dn_values, fit_time, s_fit, group_path))
 
     data_list.sort(key=lambda x: x[0], reverse=True)
 
-    for idx, (voltage, time_values, dn_values, s_fit, group_path) in enumerate(data_list):
+    for idx, (voltage, time_values, dn_values, fit_time, s_fit, group_path) in enumerate(data_list):
         color = plot_config.color_scale[idx % len(plot_config.color_scale)]
         fig.add_trace(go.Scatter(
-                x=time_values,
+                x=fit_time,
                 y=s_fit,
                 mode='lines',
                 name=rf'$\Huge{{E_{{{idx + 1}}}}}$',
@@ -0,0 +1,90 @@
+import hashlib
+import json
+
+import h5py
+import numpy as np
+
+from packed_results import is_packed, packed_traces, remove_packed_trace
+from scalar_table import TRACE_NAME, store_scalar_table, table_path
+
+FINGERPRINTS_GROUP = "fingerprints"
+FINGERPRINT = "S40"  # hex sha1 of fit_cache.trace_key
+OUTPUT_FIELDS = ("packed", "derived_columns", "lossy_abs_error", "lossy_keys", "lod_factors")
+
+
+def fingerprint_path(group_path: str) -> str:
+    """'<conc>/<flow>/<pulse>' -> 'fingerprints/<conc>/<flow>/<pulse>'."""
+    return f"{FINGERPRINTS_GROUP}/{group_path.strip('/')}"
+
+
+def read_fingerprints(processed_hdf: h5py.File, group_path: str) -> dict:
+    """{trace: fingerprint} recorded for a pulse group, empty for files written without them."""
+    path = fingerprint_path(group_path)
+    if path not in processed_hdf:
+        return {}
+    return {row["trace"].decode(): row["fingerprint"].decode() for row in processed_hdf[path][()]}
+
+
+def store_fingerprints(processed_hdf: h5py.File, group_path: str, fingerprints: dict) -> None:
+    """
+    Writes (or replaces) the fingerprints table of one pulse group: per trace, the trace_key of
+    the inputs its stored results were computed from (raw samples, DirBoundary, fit settings).
+    """
+    path = fingerprint_path(group_path)
+    if path in processed_hdf:
+        del processed_hdf[path]
+    if fingerprints:
+        table = np.array([(trace.encode(), fingerprints[trace].encode()) for trace in sorted(fingerprints)],
+                         dtype=[("trace", TRACE_NAME), ("fingerprint", FINGERPRINT)])
+        processed_hdf.create_dataset(path, data=table)
+
+
+def output_fingerprint(config, packed: bool) -> str:
+    """
+    Hash of the OutputConfig fields that decide how results are stored (not what they are), with
+    packed the layout actually written. A file stored differently cannot be updated in place.
+    """
+    fields = {name: getattr(config.output, name) for name in OUTPUT_FIELDS}
+    fields["packed"] = packed
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def processed_trace_names(group: h5py.Group) -> list:
+    """Traces stored in a processed pulse group, whichever layout it was written in."""
+    return packed_traces(group) if is_packed(group) else list(group)
+
+
+def remove_processed_trace(group: h5py.Group, trace: str) -> None:
+    """Drops one trace's arrays from a processed pulse group (legacy or packed)."""
+    if is_packed(group):
+        remove_packed_trace(group, trace)
+    elif trace in group:
+        del group[trace]
+
+
+def read_scalar_rows(processed_hdf: h5py.File, group_path: str) -> dict:
+    """The scalars table of a pulse group as {trace: {scalar: value}} (the input of store_scalar_table)."""
+    path = table_path(group_path)
+    if path not in processed_hdf:
+        return {}
+    table = processed_hdf[path][()]
+    return {row["trace"].decode(): {name: float(row[name]) for name in table.dtype.names[1:]} for row in table}
+
+
+def update_group(processed_hdf: h5py.File, group_path: str, scalar_rows: dict, fingerprints: dict,
+                 removed=()) -> None:
+    """
+    Merges the rows of re-interpreted traces into the scalars and fingerprints tables of a pulse
+    group and drops the removed traces from both and from the stored arrays. Rows of all other
+    traces are kept as they were.
+    """
+    rows, stored = read_scalar_rows(processed_hdf, group_path), read_fingerprints(processed_hdf, group_path)
+    for trace in removed:
+        remove_processed_trace(processed_hdf[group_path], trace)
+        rows.pop(trace, None)
+        stored.pop(trace, None)
+    rows.update(scalar_rows)
+    stored.update(fingerprints)
+    store_scalar_table(processed_hdf, group_path, rows)
+    store_fingerprints(processed_hdf, group_path, stored)
+
@@ -1,12 +1,14 @@
 from dataclasses import dataclass, field
 from pathlib import Path
 
-import h5py
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
 
+from live_db import open_processed
+from scalar_table import load_group_scalars
+
 
 # Define the main Configuration class
 @dataclass
@@ -115,19 +117,8 @@ def generate_ellipse(center, a, b, angle_deg, num_points=100):
 
 
 def load_group_data(group):
-    e_squared, dn_infinity = [], []
-    for filename in group:
-        dataset = group[filename]
-        if "e_square" in dataset:
-            e_squared.append(np.array(dataset["e_square"]))
-        if "dn_infinity" in dataset:
-            dn_infinity.append(np.array(dataset["dn_infinity"]))
-
-    if not e_squared or not dn_infinity:
-        return None, None
-
-    e_squared = np.array(e_squared).flatten()
-    dn_infinity = np.array(dn_infinity).flatten()
+    scalars = load_group_scalars(group, ("e_square", "dn_infinity"))
+    e_squared, dn_infinity = scalars["e_square"], scalars["dn_infinity"]
 
     if e_squared.size == 0 or dn_infinity.size == 0:
         return None, None
@@ -149,7 +140,7 @@ def plot_all_kerr_data(config: Configuration,
     data = {conc: {} for conc in concentrations}
     ellipse_points = {conc: [] for conc in concentrations}
 
-    with h5py.File(processed_hdf_path, 'r') as hdf_file:
+    with open_processed(processed_hdf_path) as hdf_file:
         for conc in concentrations:
             for pulse in pulses:
                 group_path = f"{conc}/0/{pulse}"
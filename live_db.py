@@ -0,0 +1,125 @@
+import argparse
+import os
+import time
+
+import h5py
+import numpy as np
+
+from configuration import get_experiment_config
+from packed_results import append_packed_results, create_packed_group, packed_traces
+from scalar_table import TRACE_NAME, read_scalar_table, scalar_results, table_path
+
+
+def open_processed(filename) -> h5py.File:
+    """
+    Opens the processed database for reading. Files written in SWMR mode are opened as SWMR
+    readers, so they can be read (and refreshed) while process_database is still writing them,
+    or after a crashed run; other files open as usual.
+    """
+    try:
+        return h5py.File(filename, 'r', libver='latest', swmr=True)
+    except OSError:
+        return h5py.File(filename, 'r')
+
+
+def refresh(obj) -> None:
+    """
+    Makes an SWMR reader see everything the writer has flushed since the file (or group) was
+    opened or last refreshed: refreshes every dataset below obj.
+    """
+    if isinstance(obj, h5py.Dataset):
+        obj.refresh()
+        return
+    obj.visititems(lambda _, item: item.refresh() if isinstance(item, h5py.Dataset) else None)
+
+
+class LiveWriter:
+    """
+    Writes processed results in single-writer/multiple-reader mode. SWMR forbids creating
+    objects once it is on, so the first result fixes the layout: every pulse group gets the
+    packed datasets (packed_results.py) of all its array kinds and an empty resizable scalars
+    table, then SWMR is switched on and each trace is only appended. The file is flushed
+    every flush_seconds and at the end of every pulse group, and stays readable if the run dies.
+    """
+
+    def __init__(self, processed_hdf: h5py.File, group_paths, flush_seconds: float):
+        self.hdf = processed_hdf
+        self.group_paths = list(group_paths)
+        self.flush_seconds = flush_seconds
+        self.last_flush = time.monotonic()
+
+    @property
+    def started(self) -> bool:
+        return self.hdf.swmr_mode
+
+    def start(self, results: dict) -> None:
+        """Creates the append-only layout of all pulse groups from one full result and enables SWMR."""
+        columns = list(scalar_results(results))
+        keys = [key for key in results if key not in columns]
+        for group_path in self.group_paths:
+            create_packed_group(self.hdf.require_group(group_path), keys)
+            self.hdf.create_dataset(table_path(group_path), shape=(0,), maxshape=(None,), chunks=(256,),
+                                    dtype=[("trace", TRACE_NAME)] + [(column, np.float64) for column in columns])
+        self.hdf.swmr_mode = True
+
+    def append(self, group_path: str, trace: str, results: dict, stored: dict) -> None:
+        """
+        Appends one trace: stored (the results to persist) to the packed arrays, the scalars of
+        results to the table. The table row goes last, so readers never see scalars without arrays.
+        """
+        if not self.started:
+            self.start(results)
+        append_packed_results(self.hdf[group_path], trace, stored)
+
+        table = self.hdf[table_path(group_path)]
+        scalars = scalar_results(results)
+        row = np.zeros(1, dtype=table.dtype)
+        row["trace"] = trace.encode()
+        for column in table.dtype.names[1:]:
+            row[column] = scalars.get(column, np.nan)
+        table.resize(table.shape[0] + 1, axis=0)
+        table[-1:] = row
+
+        if time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        self.hdf.flush()
+        self.last_flush = time.monotonic()
+
+
+def completed_traces(processed_hdf: h5py.File, group_paths) -> dict:
+    """Number of fully written traces per pulse group (rows of its scalars table)."""
+    counts = {}
+    for group_path in group_paths:
+        if group_path not in processed_hdf:
+            continue
+        group = processed_hdf[group_path]
+        table = read_scalar_table(group)
+        counts[group_path] = len(table) if table is not None else len(packed_traces(group))
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Follow a processed database while process_database writes it.")
+    parser.add_argument("--processed", default=None,
+                        help="Processed database (default: <database>/processed_experiment_data.h5)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between refreshes")
+    args = parser.parse_args()
+
+    config = get_experiment_config()
+    processed_hdf_filename = args.processed if args.processed else os.path.join(config.base_dirs.database,
+                                                                                "processed_experiment_data.h5")
+    with open_processed(processed_hdf_filename) as processed_hdf:
+        group_paths = []
+        processed_hdf.visititems(lambda name, obj: group_paths.append(name)
+                                 if isinstance(obj, h5py.Group) and obj.attrs.get("packed", False) else None)
+        try:
+            while True:
+                refresh(processed_hdf)
+                counts = completed_traces(processed_hdf, group_paths)
+                print(f"🔄 {sum(counts.values())} traces: "
+                      + ", ".join(f"{group_path} {n}" for group_path, n in counts.items()))
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,119 @@
+import re
+
+import numpy as np
+from scipy.signal import savgol_filter as sgf
+
+from packed_results import VALUES, is_packed, load_group_results
+
+LOD_FACTORS = (4, 16, 64)
+LOD_KEYS = ("dn", "Rise", "Fall")
+
+
+def lod_key(key: str, factor: int) -> str:
+    """Result key of one pyramid level, e.g. 'dn_lod16'."""
+    return f"{key}_lod{factor}"
+
+
+def lod_keys(key: str, factors=LOD_FACTORS) -> list:
+    """Result keys of all pyramid levels of key (to request with load_group_results)."""
+    return [lod_key(key, factor) for factor in factors]
+
+
+def stored_factors(names, key: str) -> tuple:
+    """Factors of the pyramid levels of key among the result names, e.g. (4, 16, 64) from 'dn_lod4', ..."""
+    pattern = re.compile(rf"{re.escape(key)}_lod(\d+)")
+    return tuple(sorted({int(match[1]) for match in map(pattern.fullmatch, names) if match}))
+
+
+def group_factors(group, key: str) -> tuple:
+    """
+    Factors of the pyramid levels of key stored in a processed pulse group, whichever layout and
+    whichever output.lod_factors it was written with.
+    """
+    if is_packed(group):
+        return stored_factors(group[VALUES], key) if VALUES in group else ()
+    return tuple(sorted({factor for trace in group.values() for factor in stored_factors(trace, key)}))
+
+
+def minmax_level(values: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Min/max decimation: an (ceil(n / factor), 2) array with the minimum and maximum of every
+    block of factor samples, so peaks and spikes survive downsampling. NaNs are ignored.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_buckets = -(-len(values) // factor)
+    padded = np.full(n_buckets * factor, np.nan)
+    padded[:len(values)] = values
+    blocks = padded.reshape(n_buckets, factor)
+    return np.column_stack((np.fmin.reduce(blocks, axis=1), np.fmax.reduce(blocks, axis=1)))
+
+
+def lod_pyramid(results: dict, factors=LOD_FACTORS, keys=LOD_KEYS) -> dict:
+    """The min/max pyramid levels of the given result arrays, as extra result keys."""
+    return {lod_key(key, factor): minmax_level(results[key], factor)
+            for key in keys if key in results for factor in factors}
+
+
+def lod_factor(results, key: str, pixel_width: int, factors=None) -> int:
+    """
+    Coarsest stored level of key that still has at least pixel_width buckets (one per pixel).
+    Falls back to 1, the full-resolution array, when no level is fine enough, or to the finest
+    level when only levels were loaded. factors defaults to the levels present in results.
+    """
+    factors = stored_factors(results, key) if factors is None else factors
+    available = [factor for factor in sorted(factors, reverse=True) if lod_key(key, factor) in results]
+    for factor in available:
+        level = results[lod_key(key, factor)]
+        if len(level) // (2 if np.ndim(level) == 1 else 1) >= pixel_width:
+            return factor
+    return 1 if key in results or not available else available[-1]
+
+
+def load_plot_results(group, key: str, keys=(), factors=None) -> dict:
+    """
+    load_group_results for plotting key: the given keys plus the pyramid levels of key instead of
+    the full array. Traces written without a pyramid get the full-resolution key. factors defaults
+    to the levels stored in the group (see group_factors).
+    """
+    levels = lod_keys(key, group_factors(group, key) if factors is None else factors)
+    results = load_group_results(group, (*keys, *levels))
+    missing = [trace for trace, values in results.items() if not any(level in values for level in levels)]
+    if missing:
+        full = load_group_results(group, (key,))
+        for trace in missing:
+            if key in full[trace]:
+                results[trace][key] = full[trace][key]
+    return results
+
+
+def _level(results, key: str, factor: int) -> np.ndarray:
+    return np.asarray(results[lod_key(key, factor)][()]).reshape(-1, 2)  # packed layouts store it flattened
+
+
+def plot_points(results, key: str, x_key: str, pixel_width: int, factors=None) -> tuple:
+    """
+    (x, y) for drawing key against x_key at about pixel_width horizontal resolution: the chosen
+    level's min and max interleaved at each bucket's first x, or the full arrays at factor 1.
+    results is a trace's result mapping (ResultView, h5py trace group or load_group_results entry).
+    """
+    factor = lod_factor(results, key, pixel_width, factors)
+    x = np.asarray(results[x_key][()])
+    if factor == 1:
+        return x, np.asarray(results[key][()])
+    level = _level(results, key, factor)
+    return np.repeat(x[::factor][:len(level)], 2), level.ravel()
+
+
+def smoothed_points(results, key: str, x_key: str, pixel_width: int, window: int, factors=None) -> tuple:
+    """
+    (x, y) of a Savitzky-Golay smoothed curve of key (window in full-resolution samples),
+    computed on the mid-range of the chosen pyramid level with the window scaled down to it.
+    """
+    factor = lod_factor(results, key, pixel_width, factors)
+    x = np.asarray(results[x_key][()])
+    if factor == 1:
+        return x, sgf(np.asarray(results[key][()]), window, 1)
+    level = _level(results, key, factor)
+    middle = level.mean(axis=1)
+    scaled = max(3, (window // factor) | 1)
+    return x[::factor][:len(level)], sgf(middle, scaled, 1) if len(middle) > scaled else middle
@@ -0,0 +1,126 @@
+import math
+
+import h5py
+import numpy as np
+
+MAX_SCALED_RANGE = 2.0 ** 52  # scaled integers must stay exact in float64
+ABS_ERROR_ATTR = "lossy_abs_error"  # configured bound, stored on every lossy dataset
+
+
+def scaleoffset_digits(abs_error: float) -> int:
+    """
+    Decimal digits the HDF5 scale-offset filter keeps so that its rounding error,
+    0.5 * 10**-digits, stays within abs_error.
+    """
+    return max(0, math.ceil(-math.log10(2.0 * abs_error)))
+
+
+def lossy_kwargs(values: np.ndarray, abs_error: float):
+    """
+    create_dataset arguments storing values with the scale-offset filter to within abs_error,
+    or None when the array cannot be stored that way: empty, not finite (scale-offset has no
+    NaN support) or too wide a range for the requested digits.
+    """
+    values = np.asarray(values)
+    if values.size == 0 or values.dtype.kind != "f" or not np.all(np.isfinite(values)):
+        return None
+    digits = scaleoffset_digits(abs_error)
+    if np.ptp(values) * 10.0 ** digits >= MAX_SCALED_RANGE:
+        return None
+    return {"scaleoffset": digits}
+
+
+def quantise(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    values rounded to the absolute grid k * 10**-digits. The scale-offset filter stores grid values
+    exactly whatever the minimum of their chunk, so rewriting a partly filled chunk on append does
+    not round the earlier values a second time.
+    """
+    scale = 10.0 ** digits
+    return np.round(np.asarray(values, dtype=np.float64) * scale) / scale
+
+
+def _check_error(name: str, values: np.ndarray, quantised: np.ndarray, abs_error: float) -> None:
+    error = float(np.max(np.abs(quantised - values), initial=0.0))
+    if not error <= abs_error:
+        raise ValueError(f"{name}: lossy storage error {error:.3g} exceeds the bound {abs_error:.3g}")
+
+
+def stored_values(dset: h5py.Dataset, start: int = 0) -> np.ndarray:
+    """
+    dset[start:] as it is stored in the file. Reading the dataset would be answered from the chunk
+    cache, which holds the values before the filters ran, so its chunks are flushed, copied raw into
+    a dataset with the same creation properties in an in-memory file and decoded from there.
+    """
+    dset.flush()
+    with h5py.File(f"stored-{id(dset)}", "w", driver="core", backing_store=False) as scratch:
+        copy = h5py.h5d.create(scratch.id, b"stored", dset.id.get_type(), dset.id.get_space(),
+                               dset.id.get_create_plist())
+        for i in range(dset.id.get_num_chunks()):
+            offset = dset.id.get_chunk_info(i).chunk_offset
+            if offset[0] + dset.chunks[0] > start:
+                mask, chunk = dset.id.read_direct_chunk(offset)
+                copy.write_direct_chunk(offset, chunk, mask)
+        return h5py.Dataset(copy)[start:]
+
+
+def verify_lossy(dset: h5py.Dataset, values: np.ndarray, abs_error: float, start: int = 0) -> None:
+    """
+    Reads back the rows written at start from the file (see stored_values) and raises ValueError
+    when they differ from the original values by more than abs_error.
+    """
+    _check_error(dset.name, np.asarray(values), stored_values(dset, start), abs_error)
+
+
+def lossy_bound(dset: h5py.Dataset) -> float:
+    """The configured absolute error bound of a scale-offset dataset (10**-digits for files written without it)."""
+    return float(dset.attrs.get(ABS_ERROR_ATTR, 10.0 ** -dset.scaleoffset))
+
+
+def on_storage_grid(dset: h5py.Dataset, values: np.ndarray) -> np.ndarray:
+    """
+    values to (re)write into dset: quantised to its digits for scale-offset datasets. Values read
+    back from one are min + j * 10**-digits in floating point, not exactly on the grid, and can
+    lose a step when the filter encodes them again.
+    """
+    return values if dset.scaleoffset is None else quantise(values, dset.scaleoffset)
+
+
+def lossy_append_values(dset: h5py.Dataset, values: np.ndarray) -> np.ndarray:
+    """
+    The values to append to a dataset: unchanged for lossless datasets, quantised to the digits of
+    a scale-offset dataset (whose filter is fixed). Raises ValueError, before anything is written,
+    for non-finite values, a range too wide for the digits (together with the rows already in the
+    last chunk) or an error above the dataset's bound.
+    """
+    if dset.scaleoffset is None or not len(values):
+        return values
+    if not np.all(np.isfinite(values)):
+        raise ValueError(f"{dset.name}: non-finite values cannot be appended to lossy storage")
+    n_rows = dset.shape[0]
+    tail = dset[n_rows - n_rows % dset.chunks[0]:n_rows]
+    low, high = min(values.min(), tail.min(initial=np.inf)), max(values.max(), tail.max(initial=-np.inf))
+    if (high - low) * 10.0 ** dset.scaleoffset >= MAX_SCALED_RANGE:
+        raise ValueError(f"{dset.name}: appended values span too wide a range for its lossy storage")
+    quantised = on_storage_grid(dset, values)
+    _check_error(dset.name, values, quantised, lossy_bound(dset))
+    return quantised
+
+
+def create_result_dataset(group: h5py.Group, name: str, values, output=None, **kwargs) -> h5py.Dataset:
+    """
+    Creates a processed result array. When output (an OutputConfig) sets lossy_abs_error and the
+    array is one of lossy_keys, it is quantised, checked against the bound, written with the
+    scale-offset filter (the bound stored as an attribute) and verified as read back from the file;
+    otherwise it is written losslessly with kwargs.
+    """
+    abs_error = output.lossy_abs_error if output is not None else None
+    lossy = lossy_kwargs(values, abs_error) if abs_error and name in output.lossy_keys else None
+    if lossy is None:
+        return group.create_dataset(name, data=values, **kwargs)
+    quantised = quantise(values, lossy["scaleoffset"])
+    _check_error(f"{group.name}/{name}", np.asarray(values), quantised, abs_error)
+    dset = group.create_dataset(name, data=quantised, **kwargs, **lossy)
+    dset.attrs[ABS_ERROR_ATTR] = abs_error
+    verify_lossy(dset, values, abs_error)
+    return dset
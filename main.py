@@ -2,37 +2,16 @@ import os
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 from scipy.stats import linregress
 
 from analizer import *
 from configuration import get_experiment_config
+from oscilloscope import read_oscilloscope_csv
 
 if sys.platform == "darwin":
     mpl.use("macosx")
 
 
-def read_oscilloscope_csv(file_path: str) -> np.ndarray:
-    """
-    Reads an oscilloscope CSV file.
-    Skips the header and returns the data as a numpy array.
-    """
-
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
-    for i, line in enumerate(lines):
-        if line.strip().startswith("TIME,CH1,CH2"):
-            header_index = i
-            break
-    else:
-        raise ValueError("Could not find the data header in the file.")
-    df = pd.read_csv(file_path, skiprows=header_index, usecols=[0, 1, 2], encoding='latin1')
-    df = df.iloc[:, :3]
-    # df.columns = ['TIME', 'CH1', 'CH2']
-
-    return df.apply(pd.to_numeric, errors='coerce').to_numpy()
-
-
 # def process_directory_math(directory):
 #     """
 #     Reads all CSV files in the given directory, extracts data, and plots:
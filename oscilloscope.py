@@ -0,0 +1,291 @@
+import os
+import re
+from itertools import islice
+
+import numpy as np
+
+DATA_HEADER = "TIME,CH1,CH2"
+N_COLUMNS = 3
+STREAM_CHUNK_ROWS = 1 << 16
+
+WAVEFORM_FORMATS = {"csv": ".csv", "isf": ".isf"}
+ISF_CHANNEL_PATTERN = re.compile(r"^(?P<record>.*?)(?P<channel>CH[12])\.ISF$", re.IGNORECASE)
+
+# Preamble keywords may be abbreviated (NR_PT / NR_Pt / NR_P): map the shortest form to the long one.
+ISF_KEYWORDS = {
+        "BYT_N": "BYT_NR", "BIT_N": "BIT_NR", "ENC": "ENCDG", "BN_F": "BN_FMT", "BYT_O": "BYT_OR",
+        "NR_P": "NR_PT", "PT_F": "PT_FMT", "XIN": "XINCR", "XZE": "XZERO", "PT_O": "PT_OFF",
+        "XUN": "XUNIT", "YMU": "YMULT", "YZE": "YZERO", "YOF": "YOFF", "YUN": "YUNIT", "WFI": "WFID",
+}
+
+
+def _to_float(token: str) -> float:
+    """
+    Converts a single CSV cell to float, mapping anything non-numeric to NaN
+    (same result as pd.to_numeric(errors='coerce')).
+    """
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
+
+
+def parse_numeric_block(lines: list) -> np.ndarray:
+    """
+    Parses the TIME,CH1,CH2 rows into a preallocated (N, 3) float array.
+    Blank lines are skipped, missing or malformed cells become NaN.
+    """
+    data = np.full((len(lines), N_COLUMNS), np.nan)
+    n_rows = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        cells = line.split(',', N_COLUMNS)[:N_COLUMNS]
+        for j, cell in enumerate(cells):
+            data[n_rows, j] = _to_float(cell)
+        n_rows += 1
+
+    return data[:n_rows]
+
+
+def _header_key(name: str) -> str:
+    """'Sample Interval' -> 'sample_interval'."""
+    return "_".join(name.strip().lower().split())
+
+
+def parse_header(lines: list) -> dict:
+    """
+    Parses the 'Key,value[,value]' rows above the data header.
+    Numeric cells become floats, a single value is returned as a scalar, several as a list.
+    """
+    header = {}
+    for line in lines:
+        name, *cells = line.rstrip("\r\n").split(',')
+        values = [cell.strip() for cell in cells if cell.strip()]
+        if not name.strip() or not values:
+            continue
+        parsed = [_to_float(value) for value in values]
+        if not any(np.isnan(parsed)):
+            values = parsed
+        header[_header_key(name)] = values[0] if len(values) == 1 else values
+    return header
+
+
+def _skip_csv_header(f) -> list:
+    """
+    Advances an open CSV file past the TIME,CH1,CH2 line and returns the metadata lines above it.
+    """
+    header_lines = []
+    for line in iter(f.readline, ''):
+        if line.strip().startswith(DATA_HEADER):
+            return header_lines
+        header_lines.append(line)
+    raise ValueError("Could not find the data header in the file.")
+
+
+def parse_data_lines(lines: list) -> np.ndarray:
+    """
+    Parses TIME,CH1,CH2 rows with np.loadtxt, falling back to the coercing parser
+    for empty or non-numeric cells.
+    """
+    try:
+        return np.loadtxt(lines, delimiter=',', usecols=range(N_COLUMNS), comments=None, ndmin=2)
+    except ValueError:
+        return parse_numeric_block(lines)
+
+
+def _iter_data_chunks(f, chunk_rows: int):
+    """Parses the rest of an open CSV file as (<= chunk_rows, 3) float arrays, one chunk of lines at a time."""
+    while True:
+        lines = list(islice(f, chunk_rows))
+        if not lines:
+            return
+        data = parse_data_lines(lines)
+        if len(data):
+            yield data
+
+
+def read_oscilloscope_csv_with_header(file_path: str) -> tuple:
+    """
+    Reads a Tektronix oscilloscope CSV file in a single pass: np.loadtxt parses the data block
+    straight from the open file, without holding its text in memory. Files with empty or
+    non-numeric cells are re-read chunk by chunk with the coercing parser.
+    Returns the TIME, CH1, CH2 columns as a float array and the parsed header fields.
+    """
+    with open(file_path, 'r', encoding='latin1') as f:
+        header_lines = _skip_csv_header(f)
+        data_start = f.tell()
+        try:
+            data = np.loadtxt(f, delimiter=',', usecols=range(N_COLUMNS), comments=None, ndmin=2)
+        except ValueError:
+            f.seek(data_start)
+            chunks = list(_iter_data_chunks(f, STREAM_CHUNK_ROWS))
+            data = np.concatenate(chunks) if chunks else np.empty((0, N_COLUMNS))
+
+    return data, parse_header(header_lines)
+
+
+def read_oscilloscope_csv_header(file_path: str) -> dict:
+    """
+    Parses only the metadata header of a Tektronix CSV file.
+    """
+    with open(file_path, 'r', encoding='latin1') as f:
+        return parse_header(_skip_csv_header(f))
+
+
+def iter_oscilloscope_csv_chunks(file_path: str, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """
+    Yields the TIME, CH1, CH2 block of a Tektronix CSV file as (<= chunk_rows, 3) float arrays.
+    Only one chunk of lines is held in memory at a time.
+    """
+    with open(file_path, 'r', encoding='latin1') as f:
+        _skip_csv_header(f)
+        yield from _iter_data_chunks(f, chunk_rows)
+
+
+def read_oscilloscope_csv(file_path: str) -> np.ndarray:
+    """
+    Reads a Tektronix oscilloscope CSV file in a single pass.
+    Skips the header and returns the TIME, CH1, CH2 columns as a float array.
+    """
+    return read_oscilloscope_csv_with_header(file_path)[0]
+
+
+def _isf_keyword(token: str) -> str:
+    keyword = token.rsplit(':', 1)[-1].upper()
+    for short, canonical in ISF_KEYWORDS.items():
+        if keyword.startswith(short):
+            return canonical
+    return keyword
+
+
+def parse_isf(blob: bytes) -> tuple:
+    """
+    Decodes one Tektronix .isf waveform (ASCII preamble + ':CURVE #<n><length><binary>').
+    Returns (time, values, preamble) with the preamble scaling applied:
+    value = (code - YOFF) * YMULT + YZERO, time = XZERO + XINCR * (i - PT_OFF).
+    """
+    curve = re.search(rb":?CURV[E]?\s*#(\d)", blob, re.IGNORECASE)
+    if curve is None:
+        raise ValueError("Could not find the CURVE block in the ISF file.")
+
+    preamble = {}
+    for item in blob[:curve.start()].decode('latin1').split(';'):
+        token, _, value = item.strip().partition(' ')
+        if token:
+            value = value.strip().strip('"')
+            number = _to_float(value)
+            preamble[_isf_keyword(token)] = value if np.isnan(number) else number
+
+    if str(preamble.get("ENCDG", "BIN")).upper() not in ("BIN", "BINARY"):
+        raise ValueError(f"Unsupported ISF encoding: {preamble.get('ENCDG')}")
+
+    n_digits = int(curve.group(1))
+    length_start = curve.end()
+    n_bytes = int(blob[length_start:length_start + n_digits])
+    payload = blob[length_start + n_digits:length_start + n_digits + n_bytes]
+
+    byte_order = '>' if str(preamble.get("BYT_OR", "MSB")).upper() == "MSB" else '<'
+    kind = 'u' if str(preamble.get("BN_FMT", "RI")).upper() == "RP" else 'i'
+    codes = np.frombuffer(payload, dtype=f"{byte_order}{kind}{int(preamble.get('BYT_NR', 2))}")
+
+    values = (codes.astype(np.float64) - preamble.get("YOFF", 0.0)) * preamble.get("YMULT", 1.0) \
+        + preamble.get("YZERO", 0.0)
+    time = preamble.get("XZERO", 0.0) + preamble.get("XINCR", 1.0) * (np.arange(len(codes)) - preamble.get("PT_OFF", 0.0))
+    return time, values, preamble
+
+
+def isf_channel_paths(file_path: str) -> tuple:
+    """
+    Returns the (CH1, CH2) .isf files of the record that file_path belongs to.
+    """
+    match = ISF_CHANNEL_PATTERN.match(os.path.basename(file_path))
+    if match is None:
+        raise ValueError(f"ISF file name does not end with CH1/CH2: {file_path}")
+    directory = os.path.dirname(file_path)
+    record, channel, extension = match.group("record"), match.group("channel"), file_path[-4:]
+    ch1, ch2 = ("CH1", "CH2") if channel.isupper() else ("ch1", "ch2")
+    return (os.path.join(directory, f"{record}{ch1}{extension}"),
+            os.path.join(directory, f"{record}{ch2}{extension}"))
+
+
+def read_isf_record_with_header(file_path: str) -> tuple:
+    """
+    Reads the CH1 and CH2 .isf files of a record into the (N, 3) TIME, CH1, CH2 layout
+    produced by read_oscilloscope_csv, plus a header with the per-channel preambles.
+    """
+    channels = []
+    for path in isf_channel_paths(file_path):
+        with open(path, 'rb') as f:
+            channels.append(parse_isf(f.read()))
+    (time, ch1, pre1), (_, ch2, pre2) = channels
+    if len(ch1) != len(ch2):
+        raise ValueError(f"CH1 and CH2 record lengths differ: {len(ch1)} vs {len(ch2)}")
+
+    header = {key.lower(): [pre1[key], pre2.get(key, "")] for key in pre1 if pre1[key] != pre2.get(key)}
+    header.update({key.lower(): value for key, value in pre1.items() if value == pre2.get(key)})
+    header["sample_interval"] = pre1.get("XINCR")
+    header["record_length"] = len(ch1)
+    return np.column_stack((time, ch1, ch2)), header
+
+
+def waveform_format(file_path: str) -> str:
+    """Format key ('csv', 'isf') of a raw acquisition file, from its extension."""
+    extension = os.path.splitext(file_path)[1].lower()
+    for fmt, fmt_extension in WAVEFORM_FORMATS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f"Unsupported waveform file: {file_path}")
+
+
+def is_record_file(file_path: str, fmt: str) -> bool:
+    """
+    True for the file that stands for a whole record: every CSV, and the CH1 file of an .isf pair.
+    """
+    if not file_path.lower().endswith(WAVEFORM_FORMATS[fmt]):
+        return False
+    if fmt == "isf":
+        match = ISF_CHANNEL_PATTERN.match(os.path.basename(file_path))
+        return match is not None and match.group("channel").upper() == "CH1"
+    return True
+
+
+def record_files(file_path: str) -> tuple:
+    """All files that make up the record of file_path (both channels for .isf)."""
+    return isf_channel_paths(file_path) if waveform_format(file_path) == "isf" else (file_path,)
+
+
+def record_name(file_path: str) -> str:
+    """Dataset name of a record: file name without extension (and without the channel suffix for .isf)."""
+    if waveform_format(file_path) == "isf":
+        return ISF_CHANNEL_PATTERN.match(os.path.basename(file_path)).group("record")
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def read_waveform_with_header(file_path: str) -> tuple:
+    """
+    Reads a raw record of any supported format as ((N, 3) TIME, CH1, CH2 array, header).
+    """
+    if waveform_format(file_path) == "isf":
+        return read_isf_record_with_header(file_path)
+    return read_oscilloscope_csv_with_header(file_path)
+
+
+def uniform_time_axis(time: np.ndarray, sample_interval=None, tolerance=0.01) -> tuple:
+    """
+    Returns (t0, dt) if the time column is uniformly sampled to within tolerance * dt,
+    otherwise None. dt defaults to the end-to-end average when the header has no sample interval.
+    """
+    if len(time) < 2 or not np.all(np.isfinite(time)):
+        return None
+    t0 = float(time[0])
+    dt = float(sample_interval) if sample_interval else float(time[-1] - time[0]) / (len(time) - 1)
+    if dt <= 0:
+        return None
+    if np.max(np.abs(time - (t0 + dt * np.arange(len(time))))) > tolerance * dt:
+        return None
+    return t0, dt
+
+
+if __name__ == "__main__":
+    pass
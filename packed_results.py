@@ -0,0 +1,175 @@
+import h5py
+import numpy as np
+
+from derived_columns import DERIVED_COLUMNS, ResultView, required_keys
+from lossy import create_result_dataset, lossy_append_values, lossy_bound, on_storage_grid, verify_lossy
+from scalar_table import TRACE_NAME, read_scalar_table
+
+TRACES = "traces"
+VALUES = "values"
+INDEX = "index"
+PACKED_CHUNK = 1 << 14
+
+
+def is_packed(group: h5py.Group) -> bool:
+    """True for a processed pulse group written in the packed layout."""
+    return bool(group.attrs.get("packed", False))
+
+
+def packed_traces(group: h5py.Group) -> list:
+    """Trace names of a packed group, in storage order."""
+    return [name.decode() for name in group[TRACES][()]] if TRACES in group else []
+
+
+def _append(dset: h5py.Dataset, rows: np.ndarray) -> None:
+    n_rows = dset.shape[0]
+    dset.resize(n_rows + len(rows), axis=0)
+    dset[n_rows:] = rows
+
+
+def _require_key(group: h5py.Group, key: str, n_traces: int) -> None:
+    """Creates the values/index pair of an array kind; earlier traces get zero-length entries."""
+    if key in group[VALUES]:
+        return
+    group[VALUES].create_dataset(key, shape=(0,), maxshape=(None,), dtype=np.float64,
+                                 chunks=(PACKED_CHUNK,), compression="gzip")
+    group[INDEX].create_dataset(key, data=np.zeros((n_traces, 2), dtype=np.int64), maxshape=(None, 2),
+                                chunks=(1024, 2))
+
+
+def _result_arrays(results: dict) -> dict:
+    """The array entries of an interpret_dataset result as flat float64 arrays."""
+    return {key: np.asarray(value, dtype=np.float64).ravel() for key, value in results.items()
+            if not isinstance(value, (int, float, np.generic))}
+
+
+def create_packed_group(group: h5py.Group, keys=()) -> None:
+    """Creates the empty packed layout in a pulse group, with values/index pairs for the given array kinds."""
+    group.attrs["packed"] = True
+    group.create_dataset(TRACES, shape=(0,), maxshape=(None,), dtype=TRACE_NAME)
+    group.create_group(VALUES)
+    group.create_group(INDEX)
+    for key in keys:
+        _require_key(group, key, 0)
+
+
+def write_packed_group(group: h5py.Group, rows: dict, output=None) -> None:
+    """
+    Writes the array results of a whole pulse group, {trace: results}, in the packed layout
+    with one write per array kind (see append_packed_results for the layout).
+    output (an OutputConfig) selects lossy storage of some kinds (see lossy.py).
+    """
+    group.attrs["packed"] = True
+    traces = list(rows)
+    group.create_dataset(TRACES, data=np.array([trace.encode() for trace in traces], dtype=TRACE_NAME),
+                         maxshape=(None,))
+    arrays = {trace: _result_arrays(results) for trace, results in rows.items()}
+    keys = list(dict.fromkeys(key for trace in traces for key in arrays[trace]))
+    values_group, index_group = group.create_group(VALUES), group.create_group(INDEX)
+    for key in keys:
+        parts = [arrays[trace].get(key, np.empty(0)) for trace in traces]
+        lengths = np.array([len(part) for part in parts], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        values = np.concatenate(parts) if parts else np.empty(0)
+        create_result_dataset(values_group, key, values, output, maxshape=(None,),
+                              chunks=(max(1, min(len(values), PACKED_CHUNK)),), compression="gzip")
+        index_group.create_dataset(key, data=np.column_stack((offsets, lengths)), maxshape=(None, 2))
+
+
+def remove_packed_trace(group: h5py.Group, trace: str) -> None:
+    """
+    Drops one trace from a packed group by rewriting each array kind without its slice.
+    """
+    names = packed_traces(group)
+    if trace not in names:
+        return
+    i = names.index(trace)
+    for key in group[VALUES]:
+        values, index = group[VALUES][key][()], group[INDEX][key][()]
+        offset, length = index[i]
+        values = np.delete(values, np.s_[offset:offset + length])
+        index = np.delete(index, i, axis=0)
+        index[i:, 0] -= length
+        group[VALUES][key].resize(len(values), axis=0)
+        group[VALUES][key][:] = on_storage_grid(group[VALUES][key], values)
+        group[INDEX][key].resize(len(index), axis=0)
+        group[INDEX][key][:] = index
+    keep = np.array([name.encode() for name in names if name != trace], dtype=TRACE_NAME)
+    group[TRACES].resize(len(keep), axis=0)
+    group[TRACES][:] = keep
+
+
+def append_packed_results(group: h5py.Group, trace: str, results: dict) -> None:
+    """
+    Appends the array results of one trace to a packed pulse group: every array kind is one
+    chunked 1-D dataset under values/<key> with an (offset, length) row per trace under index/<key>.
+    Scalars are not stored here, they live in the scalars table (see scalar_table.py).
+    A trace that is already present is replaced. Values are appended before their index rows and
+    the trace name last, so a concurrent SWMR reader only ever sees complete traces. Arrays that
+    lossy datasets cannot hold are rejected before anything is written (see lossy_append_values),
+    and a trace whose lossy arrays do not read back from the file within their bound is removed again.
+    """
+    arrays = _result_arrays(results)
+    originals = {}
+    if VALUES in group:
+        for key in arrays.keys() & group[VALUES].keys():
+            if group[VALUES][key].scaleoffset is not None:
+                originals[key] = arrays[key]
+            arrays[key] = lossy_append_values(group[VALUES][key], arrays[key])
+    if TRACES not in group:
+        create_packed_group(group)
+    remove_packed_trace(group, trace)
+
+    n_traces = group[TRACES].shape[0]
+    for key in arrays:
+        _require_key(group, key, n_traces)
+    for key in group[VALUES]:
+        values = arrays.get(key, np.empty(0))
+        offset = group[VALUES][key].shape[0]
+        if len(values):
+            _append(group[VALUES][key], values)
+        _append(group[INDEX][key], np.array([[offset, len(values)]], dtype=np.int64))
+    _append(group[TRACES], np.array([trace.encode()], dtype=TRACE_NAME))
+    try:
+        for key, values in originals.items():
+            dset = group[VALUES][key]
+            verify_lossy(dset, values, lossy_bound(dset), int(group[INDEX][key][n_traces, 0]))
+    except ValueError:
+        remove_packed_trace(group, trace)
+        raise
+
+
+def read_packed(group: h5py.Group, key: str) -> dict:
+    """
+    Reads one array kind of a packed group in a single call and returns {trace: view}
+    (numpy views into the concatenated values, no per-trace copies).
+    """
+    values, index = group[VALUES][key][()], group[INDEX][key][()]
+    return {trace: values[offset:offset + length] for trace, (offset, length) in zip(packed_traces(group), index)}
+
+
+def load_group_results(group: h5py.Group, keys) -> dict:
+    """
+    Returns {trace: {key: value}} for the requested result keys of a processed pulse group,
+    whichever layout it was written in. Arrays come back as numpy arrays, scalars as floats
+    (NaN where a trace lacks them). Keys that were not written because they are derived
+    (see derived_columns.py) are recomputed.
+    """
+    if not is_packed(group):
+        views = {trace: ResultView(group[trace]) for trace in group}
+        return {trace: {key: view[key][()] for key in keys if key in view} for trace, view in views.items()}
+
+    traces = packed_traces(group)
+    stored = {trace: {} for trace in traces}
+    table = read_scalar_table(group)
+    for key in required_keys(keys):
+        if key in group[VALUES]:
+            for trace, view in read_packed(group, key).items():
+                if len(view) or key not in DERIVED_COLUMNS:  # zero-length: not stored for this trace
+                    stored[trace][key] = view
+        elif table is not None and key in table.dtype.names:
+            column = dict(zip((name.decode() for name in table["trace"]), table[key]))
+            for trace in traces:
+                stored[trace][key] = float(column.get(trace, np.nan))
+    views = {trace: ResultView(values) for trace, values in stored.items()}
+    return {trace: {key: view[key] for key in keys if key in view} for trace, view in views.items()}
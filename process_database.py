@@ -1,11 +1,30 @@
+import argparse
+import itertools
 import os
+import time
+from contextlib import nullcontext
+from multiprocessing import Pool
 
 import h5py
 import pywt
 from tqdm import tqdm
 
 from analizer import *
+from batched import preprocess_group
 from configuration import get_experiment_config
+from derived_columns import persisted_results, standard_fall, standard_rise
+from fit_cache import cache_entry_path, config_fingerprint, load_cache_entry, open_fit_cache, trace_key
+from incremental import (output_fingerprint, processed_trace_names, read_fingerprints, store_fingerprints,
+                         update_group)
+from live_db import LiveWriter
+from lod import lod_pyramid
+from lossy import create_result_dataset
+from packed_results import append_packed_results, is_packed, write_packed_group
+from raw_db import map_raw_file, map_raw_trace, mappable, raw_channel_step, raw_time_step, read_raw_trace
+from runs import PROCESSED_FILENAME, finish_run, new_run_path, run_provenance
+from scalar_table import scalar_results, store_scalar_table
+from stacked_db import (STACKED_FILENAME, read_stacked_group, read_stacked_shot, stacked_channel_steps, stacked_shots,
+                        stacked_time_steps)
 from scipy.signal import savgol_filter as sgf
 
 if sys.platform == "darwin":
@@ -53,23 +72,29 @@ def generate_group_paths(config,
     return group_paths
 
 
-def interpret_dataset(data,
-                      config,
-                      group,
-                      dataset):
+def preprocess_trace(data,
+                     config,
+                     group,
+                     dataset,
+                     time_step=None,
+                     intensity_step=None) -> dict:
     """
-    Interprets the dataset and returns the processed data.
+    The preprocessing half of interpret_dataset (everything before the fits): scaled axes, the
+    background-subtracted rise and fall transients, their scaled versions, their standard-grid
+    versions and the field/level reductions. batched.py builds the same dict for a whole group.
     """
 
-    st, end, _, _, _ = (lambda b: (b.st, b.end, b.tr1, b.tr2, b.accept))(
-            config.directories.boundaries.get(f'{group}/{dataset}', None))
-
-    time, field, intensity = data[:config.setup.cut, :].T
-    time *= config.setup.time_multiplier
-    field *= config.setup.ch1_multiplier
-    intensity *= config.setup.ch2_multiplier
+    columns = data if isinstance(data, tuple) else data.T
+    time, field, intensity = (column[:config.setup.cut] for column in columns)
+    boundary = trace_boundary(config, f'{group}/{dataset}', field)
+    st, end = boundary.st, boundary.end
+    time_origin = time[0]
+    time = time * config.setup.time_multiplier
+    field = field * config.setup.ch1_multiplier
+    intensity = intensity * config.setup.ch2_multiplier
 
-    sample_rate = np.mean(np.diff(time))
+    step = intensity_step * config.setup.ch2_multiplier if intensity_step else None
+    sample_rate = time_step * config.setup.time_multiplier if time_step else np.mean(np.diff(time))
 
     relaxation = intensity[end:] - np.min(intensity[end:])
     relaxation_time = time[end:] - time[end]
@@ -77,42 +102,40 @@ def interpret_dataset(data,
     rise = intensity[st:end] - np.min(intensity[st:end])
     rise_time = time[st:end] - time[st]
 
-    dn_rise = bg_sub(rise, config)
-    dn_fall = bg_sub(relaxation, config)
+    dn_rise = bg_sub(rise, config, step)
+    dn_fall = bg_sub(relaxation, config, step)
 
-    s_rise = get_scale(dn_rise)
-    s_fall = get_scale(dn_fall)
+    time_std = np.arange(0, config.fit.standard_time, sample_rate)
+    dn_rise_std = standard_rise(dn_rise, len(time_std))
+    dn_fall_std = standard_fall(dn_fall, len(time_std))
 
-    d_rise, c1_rise, c2_rise, p = find_consts_double_rise(s_rise, rise_time, config)
-    d_fall, c1_fall, delay, b = find_consts_fall(s_fall, relaxation_time, config)
+    return {"st": st, "end": end, "time": time, "time_origin": time_origin, "time_step": time_step,
+            "sample_rate": sample_rate, "dn": bg_sub(intensity, config, step),
+            "rise_time": rise_time, "dn_rise": dn_rise, "s_rise": get_scale(dn_rise),
+            "relaxation_time": relaxation_time, "dn_fall": dn_fall, "s_fall": get_scale(dn_fall),
+            "time_std": time_std, "dn_rise_std": dn_rise_std, "dn_fall_std": dn_fall_std,
+            "rise_std_scaled": get_scale(dn_rise_std), "fall_std_scaled": get_scale(dn_fall_std),
+            "fall_std_smoothed": sgf(dn_fall_std, 201, 1),
+            "dn_infinity": np.mean(dn_rise[:-1000]), "e_square": np.mean(field[end - 1000:end])**2}
 
-    s_rise_fit = double_rise(rise_time, d_rise, c1_rise, c2_rise, p)
-    s_rise_fit /= np.max(s_rise_fit)
-    s_fall_fit = double_fall(relaxation_time, d_fall, c1_fall, delay, b, config)
-    s_fall_fit /= np.max(s_fall_fit)
-
-    time_rise_std = np.arange(0, config.fit.standard_time, sample_rate)
-    time_fall_std = np.arange(0, config.fit.standard_time, sample_rate)
 
-    dn_rise_std = np.zeros_like(time_rise_std)
-    dn_fall_std = np.zeros_like(time_fall_std)
+def fit_preprocessed(pre, config) -> dict:
+    """
+    The fitting half of interpret_dataset: fits the rise and fall of one preprocessed trace
+    (preprocess_trace or batched.preprocess_group), regularises the fall and assembles the results.
+    """
+    d_rise, c1_rise, c2_rise, p = find_consts_double_rise(pre["s_rise"], pre["rise_time"], config)
+    d_fall, c1_fall, delay, b = find_consts_fall(pre["s_fall"], pre["relaxation_time"], config)
 
-    if len(dn_rise) <= len(dn_rise_std):
-        dn_rise_std[: len(dn_rise)] = dn_rise
-        dn_rise_std[len(dn_rise):] = dn_rise[-1] if len(dn_rise) > 0 else 0
-    else:
-        dn_rise_std = dn_rise[: len(dn_rise_std)]
-    if len(dn_fall) <= len(dn_fall_std):
-        dn_fall_std[: len(dn_fall)] = dn_fall
-        dn_fall_std[len(dn_fall):] = 0
-    else:
-        dn_fall_std[: len(dn_fall_std)] = dn_fall[: len(dn_fall_std)]
+    s_rise_fit = double_rise(pre["rise_time"], d_rise, c1_rise, c2_rise, p)
+    s_rise_fit /= np.max(s_rise_fit)
+    s_fall_fit = double_fall(pre["relaxation_time"], d_fall, c1_fall, delay, b, config)
+    s_fall_fit /= np.max(s_fall_fit)
 
-    reg_times, reg_values = regularization(time_fall_std, sgf(dn_fall_std,201,1), config)
+    reg_times, reg_values = regularization(pre["time_std"], pre["fall_std_smoothed"], config)
 
     aspect_ratio = conver_p(1 / (6 * d_fall), config)
-    dn_infinity = np.mean(dn_rise[:-1000])
-    e_square = np.mean(field[end - 1000:end])**2
+    time_step = pre["time_step"]
 
     keys = ["Rise", "Rise_scaled", "s_rise_fit", "Rise_time", 'Rise_time_std',
             "Fall", "Fall_scaled", "s_fall_fit", "Fall_time", 'Fall_time_std',
@@ -121,30 +144,370 @@ def interpret_dataset(data,
             'dn', 'time',
             'e_square', 'dn_infinity',
             'aspect_ratio',
-            'reg_times', 'reg_values']
+            'reg_times', 'reg_values',
+            'Rise_p', 'Fall_delay', 'Fall_b', 'Rise_start', 'Rise_end',
+            'time_origin', 'time_step', 'time_multiplier', 'n_samples', 'standard_time', 'exp_smoothing_factor']
 
     # intensity[end + 100:] = sgf(intensity[end + 100:], window_length=551, polyorder=1)
-    results = [dn_rise, get_scale(dn_rise_std), s_rise_fit, rise_time, time_rise_std,
-               dn_fall, get_scale(dn_fall_std), s_fall_fit, relaxation_time, time_fall_std,
+    results = [pre["dn_rise"], pre["rise_std_scaled"], s_rise_fit, pre["rise_time"], pre["time_std"],
+               pre["dn_fall"], pre["fall_std_scaled"], s_fall_fit, pre["relaxation_time"], pre["time_std"],
                c1_rise, c2_rise, d_rise, c1_fall, d_fall,
-               sample_rate,
-               bg_sub(intensity, config), time,
-               e_square, dn_infinity,
+               pre["sample_rate"],
+               pre["dn"], pre["time"],
+               pre["e_square"], pre["dn_infinity"],
                aspect_ratio,
-               reg_times, reg_values]
+               reg_times, reg_values,
+               p, delay, b, pre["st"], pre["end"],
+               pre["time_origin"], time_step if time_step else np.nan, config.setup.time_multiplier,
+               len(pre["time"]), config.fit.standard_time, config.fit.exp_smoothing_factor]
 
     return dict(zip(keys, results))
 
 
+def interpret_dataset(data,
+                      config,
+                      group,
+                      dataset,
+                      time_step=None,
+                      intensity_step=None):
+    """
+    Interprets the dataset and returns the processed data.
+    data is an (N, 3) TIME, CH1, CH2 array or a (time, ch1, ch2) tuple of columns; it is not modified,
+    so read-only memory-mapped views can be passed.
+    time_step is the stored sample interval of the raw trace (seconds) and intensity_step
+    the CH2 quantisation step (volts), if known. The fit parameters and time-axis scalars
+    returned alongside let derived_columns.py regenerate the time axes and fit curves.
+    """
+    return fit_preprocessed(preprocess_trace(data, config, group, dataset, time_step, intensity_step), config)
+
+
+def store_results(processed_group,
+                  dataset,
+                  results,
+                  output=None) -> None:
+    """
+    Writes the results of interpret_dataset as a trace group, replacing an existing one.
+    output (an OutputConfig) selects lossy storage of some arrays (see lossy.py).
+    """
+    if dataset in processed_group:
+        del processed_group[dataset]
+    dataset_group = processed_group.create_group(dataset)
+    for key, value in results.items():
+        if isinstance(value, (int, float, np.generic)):
+            dataset_group.create_dataset(key, data=value)
+        else:
+            create_result_dataset(dataset_group, key, value, output, compression="gzip")
+
+
+def interpret_cached(cache, data, config, group, dataset, time_step=None, intensity_step=None, key=None):
+    """
+    interpret_dataset through the fit cache (see fit_cache.py): unchanged traces with unchanged
+    fit settings return their stored results. Without a cache it simply calls interpret_dataset.
+    key is the trace's trace_key when the caller already computed it.
+    """
+    if cache is None:
+        return interpret_dataset(data, config, group, dataset, time_step, intensity_step)
+    if key is None:
+        key = trace_key(data, config, f'{group}/{dataset}', time_step, intensity_step, cache.fingerprint)
+    results = cache.get(key)
+    if results is None:
+        results = interpret_dataset(data, config, group, dataset, time_step, intensity_step)
+        cache.put(key, results)
+    return results
+
+
+def read_group_trace(raw_group, dataset, config, file_map=None):
+    """
+    Reads one trace of a raw group as (data, time_step, intensity_step). With a file_map
+    (raw_db.map_raw_file) contiguous float64 traces are zero-copy column views into the mapped file.
+    """
+    raw_dataset = raw_group[dataset]
+    if file_map is not None and mappable(raw_dataset):
+        data = map_raw_trace(raw_dataset, file_map, config.setup.cut)
+    else:
+        data = read_raw_trace(raw_dataset, config.setup.cut)
+    return data, raw_time_step(raw_dataset), raw_channel_step(raw_dataset, 1)
+
+
+def iter_group_traces(raw_group, config, stacked=False, file_map=None):
+    """
+    Yields (dataset, data, time_step, intensity_step) for every trace of a raw group.
+    With stacked=True the group comes from the stacked database and is read in one I/O call.
+    With a file_map (raw_db.map_raw_file) contiguous float64 traces are yielded as zero-copy
+    column views into the mapped file; other traces are read as usual.
+    """
+    if not stacked:
+        for dataset in raw_group:
+            yield (dataset, *read_group_trace(raw_group, dataset, config, file_map))
+        return
+
+    shots, data = read_stacked_group(raw_group, config.setup.cut)
+    n_samples = raw_group["n_samples"][()]
+    for i, (dataset, time_step, intensity_step) in enumerate(zip(shots, stacked_time_steps(raw_group),
+                                                                 stacked_channel_steps(raw_group, 1))):
+        yield dataset, data[i, :min(n_samples[i], data.shape[1])], time_step, intensity_step
+
+
+def accepted(config, group, dataset) -> bool:
+    """False for traces rejected in the directory boundaries (accept == 0)."""
+    boundary = config.directories.boundaries.get(f'{group}/{dataset}', None)
+    return boundary is None or boundary.accept != 0
+
+
+def group_jobs(raw_group, group, config, stacked=False, fingerprints=None) -> list:
+    """
+    The accepted traces of a raw group as worker jobs, in processing order:
+    [(group, dataset, index, fingerprint), ...], index being the shot's row in a stacked group and
+    fingerprint the one recorded for the trace's stored results (None if there are none).
+    """
+    names = stacked_shots(raw_group) if stacked else list(raw_group)
+    fingerprints = fingerprints or {}
+    return [(group, dataset, i, fingerprints.get(dataset)) for i, dataset in enumerate(names)
+            if accepted(config, group, dataset)]
+
+
+_worker = {}
+
+
+def init_trace_worker(raw_hdf_filename, config, stacked, mapped, cache_dir, fingerprint) -> None:
+    """
+    Pool initializer: every worker opens the raw database (and its memory map) once.
+    fingerprint is the config_fingerprint of the run, cache_dir the fit cache (None without one).
+    """
+    raw_hdf = h5py.File(raw_hdf_filename, 'r')
+    _worker.update(raw_hdf=raw_hdf, config=config, stacked=stacked, cache_dir=cache_dir, fingerprint=fingerprint,
+                   file_map=map_raw_file(raw_hdf) if mapped and not stacked else None)
+
+
+def interpret_trace_job(job):
+    """
+    Worker entry point: reads one (group, dataset, index, fingerprint) trace and interprets it,
+    looking it up in the fit cache first (the parent process records hits and stores misses).
+    Returns (group, dataset, results, key, hit, seconds, error), key being the trace_key. Traces
+    whose key equals the recorded fingerprint are not interpreted: results and error are None.
+    On failure results is None and error the exception, so one bad trace does not stop the run.
+    """
+    group, dataset, index, fingerprint = job
+    config = _worker["config"]
+    start = time.perf_counter()
+    key, hit = None, False
+    try:
+        raw_group = _worker["raw_hdf"][group]
+        if _worker["stacked"]:
+            data = read_stacked_shot(raw_group, index, config.setup.cut)
+            time_step = stacked_time_steps(raw_group)[index]
+            intensity_step = stacked_channel_steps(raw_group, 1)[index]
+        else:
+            data, time_step, intensity_step = read_group_trace(raw_group, dataset, config, _worker["file_map"])
+        results = None
+        key = trace_key(data, config, f'{group}/{dataset}', time_step, intensity_step, _worker["fingerprint"])
+        if key == fingerprint:
+            return group, dataset, None, key, False, time.perf_counter() - start, None
+        if _worker["cache_dir"] is not None:
+            results = load_cache_entry(cache_entry_path(_worker["cache_dir"], key))
+            hit = results is not None
+        if results is None:
+            results = interpret_dataset(data, config, group, dataset, time_step, intensity_step)
+    except Exception as e:
+        return group, dataset, None, key, False, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return group, dataset, results, key, hit, time.perf_counter() - start, None
+
+
+class Throughput:
+    """
+    Traces interpreted, failures, unchanged traces that were skipped and time spent fitting
+    (summed over workers) during a run.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.started = time.perf_counter()
+        self.traces = self.failed = self.unchanged = 0
+        self.fit_seconds = 0.0
+        self.errors = []
+
+    def add(self, seconds: float, error=None, trace=None) -> None:
+        self.fit_seconds += seconds
+        if error is None:
+            self.traces += 1
+        else:
+            self.failed += 1
+            self.errors.append((trace, error))
+
+    def report(self) -> str:
+        wall = time.perf_counter() - self.started
+        return (f"⚡ {self.traces} traces in {wall:.1f} s ({self.traces / wall:.2f} traces/s) on "
+                f"{self.workers} worker{'s' if self.workers > 1 else ''}, {self.fit_seconds:.1f} s of per-trace work "
+                f"({self.fit_seconds / wall:.1f}x the wall time), {self.failed} failed"
+                + (f", {self.unchanged} unchanged" if self.unchanged else ""))
+
+
+def interpret_pooled(pool, jobs: list, workers: int):
+    """Submits the jobs of all groups to the pool at once; the outcomes come back in job order."""
+    chunksize = max(1, len(jobs) // (workers * 8))
+    return pool.imap(interpret_trace_job, jobs, chunksize=chunksize)
+
+
+def pooled_traces(outcomes, n_jobs: int, fit_cache, throughput):
+    """
+    Yields (dataset, results, fingerprint) of the next n_jobs pool outcomes (one group), in job
+    order, so the single writer produces the same file as a serial run. Failed traces are reported
+    and skipped, unchanged ones only counted.
+    """
+    for group, dataset, results, key, hit, seconds, error in itertools.islice(outcomes, n_jobs):
+        if results is None and error is None:
+            throughput.unchanged += 1
+            continue
+        throughput.add(seconds, error, f'{group}/{dataset}')
+        if error is not None:
+            tqdm.write(f"❌ Skipping {group}/{dataset} due to error: {error}")
+            continue
+        if fit_cache is not None:
+            fit_cache.record(key, results, hit)
+        yield dataset, results, key
+
+
+def skip_failed(throughput, seconds, error, trace) -> None:
+    """Records a trace whose interpretation raised, as pooled_traces does for its workers' errors."""
+    error = f"{type(error).__name__}: {error}"
+    throughput.add(seconds, error, trace)
+    tqdm.write(f"❌ Skipping {trace} due to error: {error}")
+
+
+def serial_traces(raw_group, group, config, stacked, file_map, fit_cache, throughput, fingerprints=None):
+    """
+    Reads and interprets the accepted traces of one group in this process, yielding
+    (dataset, results, fingerprint). Traces whose fingerprint equals the recorded one are skipped,
+    traces whose interpretation raises are reported and skipped (see skip_failed).
+    """
+    fingerprints = fingerprints or {}
+    config_key = fit_cache.fingerprint if fit_cache is not None else config_fingerprint(config)
+    for dataset, data, time_step, intensity_step in iter_group_traces(raw_group, config, stacked, file_map):
+        if not accepted(config, group, dataset):
+            continue
+        start = time.perf_counter()
+        try:
+            key = trace_key(data, config, f'{group}/{dataset}', time_step, intensity_step, config_key)
+            if fingerprints.get(dataset) == key:
+                throughput.unchanged += 1
+                continue
+            results = interpret_cached(fit_cache, data, config, group, dataset, time_step, intensity_step, key)
+        except Exception as e:
+            skip_failed(throughput, time.perf_counter() - start, e, f'{group}/{dataset}')
+            continue
+        throughput.add(time.perf_counter() - start)
+        yield dataset, results, key
+
+
+def batched_traces(raw_group, group, config, stacked, file_map, fit_cache, throughput, fingerprints=None):
+    """
+    serial_traces with the preprocessing of the group's traces done at once (batched.py): reads
+    every accepted trace, skips unchanged ones and fit cache hits, preprocesses the rest as padded
+    2-D arrays and fits them row by row. Yields (dataset, results, fingerprint) in trace order.
+    """
+    fingerprints = fingerprints or {}
+    config_key = fit_cache.fingerprint if fit_cache is not None else config_fingerprint(config)
+    entries, misses = [], []
+    for dataset, data, time_step, intensity_step in iter_group_traces(raw_group, config, stacked, file_map):
+        if not accepted(config, group, dataset):
+            continue
+        start = time.perf_counter()
+        try:
+            key = trace_key(data, config, f'{group}/{dataset}', time_step, intensity_step, config_key)
+        except Exception as e:
+            skip_failed(throughput, time.perf_counter() - start, e, f'{group}/{dataset}')
+            continue
+        if fingerprints.get(dataset) == key:
+            throughput.unchanged += 1
+            continue
+        results = fit_cache.get(key) if fit_cache is not None else None
+        entries.append((dataset, key, results))
+        if results is None:
+            misses.append((dataset, data, time_step, intensity_step))
+
+    start = time.perf_counter()
+    try:
+        preprocessed = preprocess_group(misses, config, group)
+    except Exception:  # redone trace by trace below, so only the bad traces are skipped
+        preprocessed = [None] * len(misses)
+    batch_seconds = (time.perf_counter() - start) / max(len(misses), 1)
+    preprocessed = iter(zip(misses, preprocessed))
+    for dataset, key, results in entries:
+        start = time.perf_counter()
+        if results is None:
+            (_, data, time_step, intensity_step), pre = next(preprocessed)
+            try:
+                if pre is None:
+                    pre = preprocess_trace(data, config, group, dataset, time_step, intensity_step)
+                results = fit_preprocessed(pre, config)
+            except Exception as e:
+                skip_failed(throughput, time.perf_counter() - start + batch_seconds, e, f'{group}/{dataset}')
+                continue
+            if fit_cache is not None:
+                fit_cache.put(key, results)
+        throughput.add(time.perf_counter() - start + batch_seconds)
+        yield dataset, results, key
+
+
 def process_database(pulse_selection=None,
-                     conc_selection=None) -> None:
+                     conc_selection=None,
+                     stacked=False,
+                     packed=None,
+                     mapped=False,
+                     swmr=None,
+                     cache=None,
+                     versioned=None,
+                     label=None,
+                     workers=1,
+                     incremental=False,
+                     batched=False) -> None:
     """
     Processes selected groups and stores computed results in a new HDF5 database.
+    Besides the per-trace groups, the fit scalars of every pulse group are written as one
+    compound table under scalars/<conc>/<flow>/<pulse> (see scalar_table.py).
+    With stacked=True the traces are read from the stacked raw database (see stacked_db.py).
+    With mapped=True uncompressed contiguous raw traces are memory-mapped instead of copied.
+    With swmr=True the file is written in single-writer/multiple-reader mode (packed layout,
+    see live_db.py), so plots can read completed traces while the run is going.
+    Every trace also gets min/max pyramid levels of dn, Rise and Fall for plotting (lod.py).
+    Results of traces whose raw samples and fit settings did not change come from the fit
+    cache (fit_cache.py) unless cache=False or config.cache.enabled is off.
+    The file carries the run's provenance (config fingerprint, code version, timestamps) as root
+    attributes; with versioned=True it is a new run under <database>/runs instead (see runs.py).
+    With workers > 1 the traces are read and interpreted on a process pool while this process is
+    the only writer and stores them in the serial order, so the output is the same; a trace that
+    fails is reported and skipped instead of stopping the run.
+    Every trace's fingerprint (its fit_cache.trace_key: raw samples, DirBoundary and fit settings)
+    is recorded under fingerprints/<conc>/<flow>/<pulse> (see incremental.py). With
+    incremental=True the existing file is updated in place: only traces whose fingerprint changed
+    are interpreted and replaced, traces no longer in the raw database or no longer accepted are
+    removed, and everything else is left untouched.
+    With batched=True (in-process runs, workers=1) the preprocessing of each pulse group runs on
+    padded 2-D arrays of all its traces and only the fits are done per trace (see batched.py).
     """
+    if batched and workers > 1:
+        raise ValueError("Batched preprocessing runs in this process, "
+                         "it cannot be combined with workers > 1")
 
     config = get_experiment_config()
-    raw_hdf_filename = os.path.join(config.base_dirs.database, "experiment_data_pulses.h5")
-    processed_hdf_filename = os.path.join(config.base_dirs.database, "processed_experiment_data.h5")
+    fit_cache = open_fit_cache(config) if cache is not False else None
+    swmr = config.output.swmr if swmr is None else swmr
+    packed = swmr or (config.output.packed if packed is None else packed)
+    raw_hdf_filename = os.path.join(config.base_dirs.database,
+                                    STACKED_FILENAME if stacked else "experiment_data_pulses.h5")
+    versioned = config.output.versioned if versioned is None else versioned
+    processed_hdf_filename = new_run_path(config, label) if versioned else \
+        os.path.join(config.base_dirs.database, PROCESSED_FILENAME)
+
+    if incremental and (swmr or versioned):
+        raise ValueError("Incremental processing updates the processed file in place, "
+                         "it cannot be combined with SWMR or versioned runs")
+    stored_as = output_fingerprint(config, packed)
+    if incremental and os.path.exists(processed_hdf_filename):
+        with h5py.File(processed_hdf_filename, 'r') as processed_hdf:
+            if processed_hdf.attrs.get("output_fingerprint") != stored_as:
+                print("⚠️ Output settings changed since the last run, reprocessing everything")
+                incremental = False
 
     pulse_selection = ['100', '150', '200', '300']
     conc_selection = ["00156", "00312", "00625"]
@@ -156,35 +519,107 @@ def process_database(pulse_selection=None,
         print("❌ No matching groups found in the database.")
         return
 
-    with h5py.File(raw_hdf_filename, 'r') as raw_hdf, h5py.File(processed_hdf_filename, 'w') as processed_hdf:
+    worker_args = (raw_hdf_filename, config, stacked, mapped, fit_cache.directory if fit_cache is not None else None,
+                   config_fingerprint(config))
+    throughput = Throughput(workers)
+    live_fingerprints = {}
+    # The pool forks before any HDF5 file is opened here; every worker opens the raw database itself.
+    with (Pool(workers, init_trace_worker, worker_args) if workers > 1 else nullcontext()) as pool, \
+            h5py.File(raw_hdf_filename, 'r') as raw_hdf, \
+            h5py.File(processed_hdf_filename, 'a' if incremental else 'w',
+                      libver='latest' if swmr else None) as processed_hdf:
+        processed_hdf.attrs.update(run_provenance(config, label))
+        processed_hdf.attrs["output_fingerprint"] = stored_as
+        file_map = map_raw_file(raw_hdf) if mapped and not stacked and pool is None else None
+        live = LiveWriter(processed_hdf, existing_groups, config.output.flush_seconds) if swmr else None
+        recorded = {group: read_fingerprints(processed_hdf, group) if incremental else {} for group in existing_groups}
+        jobs = {group: group_jobs(raw_hdf[group], group, config, stacked, recorded[group]) for group in existing_groups}
+        if pool is not None:
+            outcomes = interpret_pooled(pool, [job for group in existing_groups for job in jobs[group]], workers)
         pbar = tqdm(existing_groups, desc="Processing Groups", leave=True, dynamic_ncols=True)
 
         for group in pbar:
             pbar.set_description(f"Processing: {group}")  # Inline update without new lines
-            processed_group = processed_hdf.create_group(group)
-
-            for dataset in raw_hdf[group]:
-
-                st, end, _, _, accept = (lambda b: (b.st, b.end, b.tr1, b.tr2, b.accept))(
-                        config.directories.boundaries.get(f'{group}/{dataset}', None))
-                if accept == 0:
+            in_place = incremental and group in processed_hdf and (not packed or is_packed(processed_hdf[group]))
+            if incremental and not in_place and group in processed_hdf:
+                del processed_hdf[group]
+            processed_group = processed_hdf.require_group(group)
+            scalar_rows, packed_rows, fingerprints = {}, {}, {}
+            if pool is not None:
+                traces = pooled_traces(outcomes, len(jobs[group]), fit_cache, throughput)
+            else:
+                traces = (batched_traces if batched else serial_traces)(raw_hdf[group], group, config, stacked,
+                                                                         file_map, fit_cache, throughput,
+                                                                         recorded[group])
+
+            for dataset, results, fingerprint in traces:
+                results.update(lod_pyramid(results, config.output.lod_factors))
+                stored = persisted_results(results) if config.output.derived_columns else results
+                fingerprints[dataset] = fingerprint
+                if live is not None:
+                    live.append(group, dataset, results, stored)
                     continue
-
-                results = interpret_dataset(np.array(raw_hdf[group][dataset][:]), config, group, dataset)
-
-                dataset_group = processed_group.create_group(dataset)
-                for key, value in results.items():
-                    if isinstance(value, (int, float, np.generic)):
-                        dataset_group.create_dataset(key, data=value)
-                    else:
-                        dataset_group.create_dataset(key, data=value, compression="gzip")
+                if packed and in_place:
+                    append_packed_results(processed_group, dataset, stored)
+                elif packed:
+                    packed_rows[dataset] = stored
+                else:
+                    store_results(processed_group, dataset, stored, config.output)
+                scalar_rows[dataset] = scalar_results(results)
+
+            if live is not None:
+                live.flush()
+                live_fingerprints[group] = fingerprints
+                continue
+            if in_place:
+                removed = set(processed_trace_names(processed_group)) - {job[1] for job in jobs[group]}
+                if scalar_rows or removed:
+                    update_group(processed_hdf, group, scalar_rows, fingerprints, sorted(removed))
+                continue
+            if packed:
+                write_packed_group(processed_group, packed_rows, config.output)
+            store_scalar_table(processed_hdf, group, scalar_rows)
+            store_fingerprints(processed_hdf, group, fingerprints)
 
         pbar.close()
-        print("✅ Processing & storage complete.")
+    if live_fingerprints:
+        with h5py.File(processed_hdf_filename, 'a') as processed_hdf:
+            for group, fingerprints in live_fingerprints.items():
+                store_fingerprints(processed_hdf, group, fingerprints)
+    finish_run(processed_hdf_filename)
+    print(f"✅ Processing & storage complete: {processed_hdf_filename}")
+    print(throughput.report())
+    if throughput.errors:
+        print(f"❌ {throughput.failed} traces failed: " + ", ".join(trace for trace, _ in throughput.errors))
+    if fit_cache is not None:
+        print(fit_cache.report())
 
 
 if __name__ == '__main__':
-    process_database()
+    parser = argparse.ArgumentParser(description="Process the raw database into processed_experiment_data.h5.")
+    parser.add_argument("--stacked", action="store_true", help="Read the stacked raw database (stacked_db.py)")
+    parser.add_argument("--packed", action="store_true", default=None,
+                        help="Write the packed output layout (packed_results.py)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Memory-map contiguous float64 raw traces instead of copying them")
+    parser.add_argument("--swmr", action="store_true", default=None,
+                        help="Write in SWMR mode so the results can be read during the run (live_db.py)")
+    parser.add_argument("--no-cache", action="store_true", help="Refit every trace, bypassing the fit cache")
+    parser.add_argument("--versioned", action="store_true", default=None,
+                        help="Write a new run under <database>/runs instead of overwriting (runs.py)")
+    parser.add_argument("--label", default=None, help="Label appended to the run id of a versioned run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes reading and interpreting traces (default: 1, serial)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update the processed file in place, re-interpreting only changed traces")
+    parser.add_argument("--batched", action="store_true",
+                        help="Preprocess each pulse group as 2-D arrays, fitting trace by trace (batched.py, "
+                             "workers=1 only)")
+    args = parser.parse_args()
+    process_database(stacked=args.stacked, packed=args.packed, mapped=args.mmap, swmr=args.swmr,
+                     cache=False if args.no_cache else None, versioned=args.versioned, label=args.label,
+                     workers=args.workers, incremental=args.incremental,
+                     batched=args.batched)
     # plt.plot(rise_time, s_rise)
     # plt.plot(rise_time, s_rise_fit)
     # plt.plot(relaxation_time, s_relaxation)
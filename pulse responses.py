@@ -1,12 +1,13 @@
 import os
 import sys
 
-import h5py
 import matplotlib.pyplot as plt
 import numpy as np
 from pylab import mpl
 
 from configuration import get_experiment_config
+from live_db import open_processed
+from lod import load_plot_results, lod_factor, plot_points
 
 if sys.platform == "darwin":
     mpl.use("macosx")
@@ -36,9 +37,10 @@ def plot_dn_values(conc_selection=None, pulse_selection=None):
             for pulse in pulse_selection:
                 group_paths.append(f"{conc}/{flow}/{pulse}")
 
-    plt.figure()
+    figure = plt.figure()
+    pixel_width = int(figure.get_size_inches()[0] * figure.dpi)
 
-    with h5py.File(processed_hdf_filename, 'r') as processed_hdf:
+    with open_processed(processed_hdf_filename) as processed_hdf:
         for group_path in group_paths:
             # Check if group exists in the file
             if group_path not in processed_hdf:
@@ -46,14 +48,14 @@ def plot_dn_values(conc_selection=None, pulse_selection=None):
 
             conc, flow, pulse = group_path.split('/')
 
-            # Iterate through datasets in the group
-            for dataset_name in processed_hdf[group_path]:
+            # Iterate through the traces of the group (legacy, packed and SWMR layouts)
+            group_results = load_plot_results(processed_hdf[group_path], "Rise", ("s_rise_fit", "Rise_time"))
+            for dataset_name, dataset in group_results.items():
 
-                dataset = processed_hdf[group_path][dataset_name]
                 st, end, _, _, accept = (lambda b: (b.st, b.end, b.tr1, b.tr2, b.accept))(
                         config.directories.boundaries.get(f'{group_path}/{dataset_name}', None))
                 print(st, end)
-                if 'dn' not in dataset or 'time' not in dataset:
+                if 'Rise_time' not in dataset or 's_rise_fit' not in dataset:
                     continue
 
                 # dn_values = dataset['dn'][:]
@@ -61,15 +63,10 @@ def plot_dn_values(conc_selection=None, pulse_selection=None):
 
                 # dn_values = dataset['s_rise_fit'][:]
 
-                dn_values = dataset['Fall'][:]
-                dn_values /= np.max(dataset['Fall'][:])
-                dn_scatter = dataset['s_fall_fit'][:]
-                time_values = dataset['Fall_time'][:]
-
-                dn_values = dataset['Rise'][:]
-                dn_values /= np.max(dataset['Rise'][:])
-                dn_scatter = dataset['s_rise_fit'][:]
-                time_values = dataset['Rise_time'][:]
+                time_values, dn_values = plot_points(dataset, 'Rise', 'Rise_time', pixel_width)
+                dn_values = dn_values / np.max(dn_values)
+                factor = lod_factor(dataset, 'Rise', pixel_width)
+                fit_time, dn_scatter = dataset['Rise_time'][::factor], dataset['s_rise_fit'][::factor]
 
                 # dn_values = dataset['dn'][:]
                 # dn_values = dataset['reg_values'][:]
@@ -79,7 +76,7 @@ def plot_dn_values(conc_selection=None, pulse_selection=None):
                 # dn_values[time_values > 150] = 0
 
                 label = f"{group_path}"
-                plt.plot(time_values, dn_scatter, label=label)
+                plt.plot(fit_time, dn_scatter, label=label)
                 plt.scatter(time_values, dn_values, label=label, s=5)
 
                 # plt.plot( dn_values, label=label)
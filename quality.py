@@ -0,0 +1,183 @@
+import argparse
+import os
+from functools import reduce
+
+import h5py
+import numpy as np
+
+from configuration import get_experiment_config
+
+QUARANTINE_GROUP = "quarantine"
+CHANNELS = ("CH1", "CH2")
+SCREEN_DIVISIONS = 10  # vertical divisions of the Tektronix screen; the CSV export saturates at its edges
+
+
+def quarantine_path(group_path: str) -> str:
+    """'<conc>/<flow>/<pulse>' -> 'quarantine/<conc>/<flow>/<pulse>'."""
+    return f"{QUARANTINE_GROUP}/{group_path}"
+
+
+def trace_stats(data: np.ndarray) -> dict:
+    """
+    Vectorised per-column statistics of a parsed (N, 3) TIME, CH1, CH2 block.
+    Partial results of consecutive chunks combine with merge_trace_stats.
+    """
+    finite = np.isfinite(data)
+    masked_low = np.where(finite, data, np.inf)
+    masked_high = np.where(finite, data, -np.inf)
+    low, high = masked_low.min(axis=0, initial=np.inf), masked_high.max(axis=0, initial=-np.inf)
+    return {
+            "n_rows": len(data),
+            "n_bad": np.count_nonzero(~finite, axis=0),
+            "low": low,
+            "high": high,
+            "n_low": np.count_nonzero(masked_low == low, axis=0),
+            "n_high": np.count_nonzero(masked_high == high, axis=0),
+    }
+
+
+def _merge_extreme(value_a, count_a, value_b, count_b, better):
+    value = np.where(better(value_a, value_b), value_a, value_b)
+    count = np.where(value_a == value, count_a, 0) + np.where(value_b == value, count_b, 0)
+    return value, count
+
+
+def merge_trace_stats(a: dict, b: dict) -> dict:
+    """Combines the trace_stats of two consecutive chunks of the same record."""
+    low, n_low = _merge_extreme(a["low"], a["n_low"], b["low"], b["n_low"], np.less)
+    high, n_high = _merge_extreme(a["high"], a["n_high"], b["high"], b["n_high"], np.greater)
+    return {"n_rows": a["n_rows"] + b["n_rows"], "n_bad": a["n_bad"] + b["n_bad"],
+            "low": low, "high": high, "n_low": n_low, "n_high": n_high}
+
+
+def combine_trace_stats(chunk_stats: list) -> dict:
+    """trace_stats of a whole record from the trace_stats of its consecutive chunks."""
+    return reduce(merge_trace_stats, chunk_stats)
+
+
+def _per_channel(header, key) -> list:
+    """[CH1, CH2] values of a header field given once or per channel, None if missing or non-numeric."""
+    value = header.get(key) if header else None
+    values = value if isinstance(value, list) else [value] * len(CHANNELS)
+    if len(values) < len(CHANNELS):
+        return None
+    try:
+        return [float(v) for v in values[:len(CHANNELS)]]
+    except (TypeError, ValueError):
+        return None
+
+
+def channel_rails(header) -> list:
+    """
+    Full-scale (low, high) values of CH1 and CH2 from the record header, or None when the header
+    does not give them: the int code limits scaled by YMULT/YOFF/YZERO for .isf records, or the
+    screen edges, vertical offset -/+ SCREEN_DIVISIONS / 2 vertical scales, for CSV exports.
+    """
+    ymult, yoff, yzero, n_bytes = (_per_channel(header, key) for key in ("ymult", "yoff", "yzero", "byt_nr"))
+    if ymult is not None and n_bytes is not None:
+        yoff, yzero = yoff or [0.0] * len(CHANNELS), yzero or [0.0] * len(CHANNELS)
+        formats = header.get("bn_fmt", "RI")
+        formats = formats if isinstance(formats, list) else [formats] * len(CHANNELS)
+        rails = []
+        for mult, off, zero, width, fmt in zip(ymult, yoff, yzero, n_bytes, formats):
+            bits = 8 * int(width)
+            codes = (0, 2 ** bits - 1) if str(fmt).upper() == "RP" else (-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+            rails.append(tuple(sorted((code - off) * mult + zero for code in codes)))
+        return rails
+
+    scale, offset = _per_channel(header, "vertical_scale"), _per_channel(header, "vertical_offset")
+    if scale is None:
+        return None
+    offset = offset or [0.0] * len(CHANNELS)
+    return [(center - SCREEN_DIVISIONS / 2 * abs(div), center + SCREEN_DIVISIONS / 2 * abs(div))
+            for center, div in zip(offset, scale)]
+
+
+def clipped_fractions(stats: dict, header) -> np.ndarray:
+    """
+    Fraction of CH1 and CH2 samples saturated at the full-scale rails (channel_rails): the samples
+    at a channel's extreme value, counted only where that extreme reaches the rail.
+    Zeros when the header does not give the rails.
+    """
+    rails = channel_rails(header)
+    if rails is None:
+        return np.zeros(len(CHANNELS))
+    low_rail, high_rail = np.array(rails, dtype=np.float64).T
+    tolerance = 1e-6 * (high_rail - low_rail)
+    low, high = stats["low"][1:], stats["high"][1:]
+    n_clipped = (np.where(low <= low_rail + tolerance, stats["n_low"][1:], 0)
+                 + np.where(high >= high_rail - tolerance, stats["n_high"][1:], 0))
+    return n_clipped / max(stats["n_rows"], 1)
+
+
+def quality_reasons(stats: dict, header, config) -> list:
+    """
+    Applies the config.quality thresholds to trace_stats and returns the failed checks as
+    machine-readable 'check:column' codes (empty list for a good trace):
+    nan (non-finite fraction), clipped (samples saturated at the channel's full-scale rails, only
+    checked when the header gives them, see channel_rails),
+    flat (channel range below min_channel_range) and truncated (fewer rows than the header's
+    record length, only checked when the header gives it).
+    """
+    quality = config.quality
+    reasons = []
+    n_rows = max(stats["n_rows"], 1)
+
+    bad_fraction = stats["n_bad"] / n_rows
+    reasons += [f"nan:{name}" for name, fraction in zip(("TIME",) + CHANNELS, bad_fraction)
+                if fraction > quality.max_nan_fraction]
+
+    low, high = stats["low"][1:], stats["high"][1:]
+    flat = ~(high - low > quality.min_channel_range)
+    reasons += [f"flat:{name}" for name, is_flat in zip(CHANNELS, flat) if is_flat]
+    reasons += [f"clipped:{name}" for name, fraction, is_flat in zip(CHANNELS, clipped_fractions(stats, header), flat)
+                if fraction > quality.max_clipped_fraction and not is_flat]
+
+    record_length = header.get("record_length") if header else None
+    if isinstance(record_length, list):
+        record_length = record_length[0]
+    if record_length and stats["n_rows"] < float(record_length):
+        reasons.append("truncated")
+    return reasons
+
+
+def quarantine_attrs(reasons: list, stats=None) -> dict:
+    """Attributes stored with a quarantined dataset: reason codes and the measured fractions."""
+    attrs = {"quarantine_reasons": np.array(reasons, dtype=h5py.string_dtype())}
+    if stats is not None:
+        n_rows = max(stats["n_rows"], 1)
+        attrs["quality_nan_fraction"] = stats["n_bad"] / n_rows
+        attrs["quality_pinned_fraction"] = np.maximum(stats["n_low"], stats["n_high"]) / n_rows
+        attrs["quality_range"] = stats["high"] - stats["low"]
+        attrs["quality_n_rows"] = stats["n_rows"]
+    return attrs
+
+
+def quarantine_report(raw_hdf_filename) -> list:
+    """
+    Lists (dataset key, reasons, source path) for everything in the quarantine group.
+    """
+    report = []
+    with h5py.File(raw_hdf_filename, 'r') as hdf:
+        if QUARANTINE_GROUP not in hdf:
+            return report
+
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                reasons = [str(r) for r in obj.attrs.get("quarantine_reasons", [])]
+                report.append((name, reasons, str(obj.attrs.get("source_path", ""))))
+
+        hdf[QUARANTINE_GROUP].visititems(visit)
+    return sorted(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the traces quarantined at ingestion.")
+    parser.add_argument("--raw", default=None, help="Raw database (default: <database>/experiment_data_pulses.h5)")
+    args = parser.parse_args()
+
+    config = get_experiment_config()
+    raw_hdf_filename = args.raw if args.raw else os.path.join(config.base_dirs.database,
+                                                              "experiment_data_pulses.h5")
+    for key, reasons, source_path in quarantine_report(raw_hdf_filename):
+        print(f"{key}\t{','.join(reasons)}\t{source_path}")
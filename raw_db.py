@@ -0,0 +1,373 @@
+import hashlib
+import mmap
+import os
+
+import h5py
+import numpy as np
+
+from oscilloscope import (STREAM_CHUNK_ROWS, iter_oscilloscope_csv_chunks, read_oscilloscope_csv_header,
+                          record_files, uniform_time_axis)
+
+HASH_BLOCK_SIZE = 1 << 20
+
+ADC_NAN_CODE = np.iinfo(np.int16).min  # reserved for missing samples
+ADC_MIN_CODE = ADC_NAN_CODE + 1
+ADC_MAX_LEVEL = np.iinfo(np.int16).max - ADC_MIN_CODE
+MAX_DECIMALS = 12
+
+
+def record_stat(file_path: str) -> tuple:
+    """
+    (size, mtime_ns) of a raw record: summed size and latest mtime over all of its files.
+    """
+    stats = [os.stat(path) for path in record_files(file_path)]
+    return sum(stat.st_size for stat in stats), max(stat.st_mtime_ns for stat in stats)
+
+
+def source_fingerprint(file_path: str) -> dict:
+    """
+    Returns the manifest entry of a raw record: path, size, mtime and content hash
+    (over both channel files for .isf records).
+    """
+    size, mtime_ns = record_stat(file_path)
+    digest = hashlib.sha1()
+    for path in record_files(file_path):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+
+    return {
+            "source_path": os.path.abspath(file_path),
+            "source_size": size,
+            "source_mtime_ns": mtime_ns,
+            "source_sha1": digest.hexdigest(),
+    }
+
+
+def stat_matches(dset: h5py.Dataset, file_path: str) -> bool:
+    """
+    Cheap up-to-date check: the stored size and mtime equal the record's current ones.
+    """
+    if "source_size" not in dset.attrs or "source_mtime_ns" not in dset.attrs:
+        return False
+    size, mtime_ns = record_stat(file_path)
+    return dset.attrs["source_size"] == size and dset.attrs["source_mtime_ns"] == mtime_ns
+
+
+def stored_hash(group: h5py.Group, dset_name: str):
+    """
+    Returns the content hash recorded for a raw dataset, or None if it is absent.
+    """
+    if dset_name not in group:
+        return None
+    value = group[dset_name].attrs.get("source_sha1")
+    return None if value is None else str(value)
+
+
+def layout_kwargs(layout, shape: tuple, dtype=None) -> dict:
+    """
+    Translates a RawLayoutConfig into h5py create_dataset keyword arguments.
+    Integer (ADC code) arrays keep their own dtype instead of layout.dtype.
+    """
+    if layout is None:
+        return {}
+
+    integer = dtype is not None and np.issubdtype(dtype, np.integer)
+    kwargs = {"dtype": np.dtype(dtype if integer else layout.dtype)}
+    filtered = layout.shuffle or layout.compression is not None
+    if layout.chunk_rows is not None or filtered:
+        chunk_rows = layout.chunk_rows if layout.chunk_rows is not None else shape[0]
+        kwargs["chunks"] = (max(1, min(chunk_rows, shape[0])),) + tuple(shape[1:])
+    if layout.shuffle:
+        kwargs["shuffle"] = True
+    if layout.compression is not None:
+        kwargs["compression"] = layout.compression
+        if layout.compression == "gzip" and layout.compression_opts is not None:
+            kwargs["compression_opts"] = layout.compression_opts
+    return kwargs
+
+
+def _attr_value(value):
+    """Header values as HDF5-storable attributes (string lists need an explicit string dtype)."""
+    if isinstance(value, list) and any(isinstance(v, str) for v in value):
+        return np.array([str(v) for v in value], dtype=h5py.string_dtype())
+    return value
+
+
+def _decimal_places(values: np.ndarray):
+    """
+    Smallest k for which every value is exactly round(v * 10**k) / 10**k, or None.
+    """
+    for k in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** k
+        if np.max(np.abs(values), initial=0.0) * scale >= 2 ** 53:
+            return None
+        if np.array_equal(np.round(values * scale) / scale, values):
+            return k
+    return None
+
+
+def decode_adc_codes(codes: np.ndarray, attrs) -> np.ndarray:
+    """
+    Turns int16 ADC codes back into float64 channel values:
+    (code * adc_scale + adc_offset) / 10**adc_decimals, NaN for the sentinel code.
+    """
+    scale = np.asarray(attrs["adc_scale"], dtype=np.float64)
+    offset = np.asarray(attrs["adc_offset"], dtype=np.float64)
+    divisor = 10.0 ** np.asarray(attrs["adc_decimals"], dtype=np.float64)
+
+    values = (codes.astype(np.float64) * scale + offset) / divisor
+    values[codes == ADC_NAN_CODE] = np.nan
+    return values
+
+
+def encode_adc_codes(channels: np.ndarray):
+    """
+    Encodes (N, n_channels) quantised channel values as int16 codes.
+    Each channel is written as decimal integers m / 10**k, and the quantisation step is
+    the gcd of the level differences. Returns (codes, attrs), or None when a channel
+    does not fit into int16 or the round trip is not bit-exact.
+    """
+    codes = np.full(channels.shape, ADC_NAN_CODE, dtype=np.int16)
+    attrs = {"adc_scale": [], "adc_offset": [], "adc_decimals": []}
+
+    for j in range(channels.shape[1]):
+        column = channels[:, j]
+        finite = np.isfinite(column)
+        if np.any(np.isinf(column)):
+            return None
+        values = column[finite]
+        decimals = _decimal_places(values)
+        if decimals is None:
+            return None
+
+        units = np.round(values * 10.0 ** decimals).astype(np.int64)
+        low = int(units.min(initial=0))
+        step = int(np.gcd.reduce(units - low)) if len(units) else 1
+        step = step if step > 0 else 1
+        levels = (units - low) // step
+        if len(levels) and levels.max() > ADC_MAX_LEVEL:
+            return None
+
+        codes[finite, j] = levels + ADC_MIN_CODE
+        attrs["adc_scale"].append(step)
+        attrs["adc_offset"].append(low - ADC_MIN_CODE * step)
+        attrs["adc_decimals"].append(decimals)
+
+    attrs = {key: np.array(value, dtype=np.int64) for key, value in attrs.items()}
+    if not np.array_equal(decode_adc_codes(codes, attrs), channels, equal_nan=True):
+        return None
+    return codes, attrs
+
+
+def encode_raw_trace(data: np.ndarray, header=None, adc_codes=False) -> tuple:
+    """
+    Splits a parsed (N, 3) trace into the array to store and its attributes.
+    Uniformly sampled traces keep only CH1, CH2 and store time as time_start/time_step.
+    With adc_codes=True the channels of such traces are stored as lossless int16 codes
+    when possible, otherwise as floats.
+    """
+    header = header if header else {}
+    attrs = {f"scope_{key}": _attr_value(value) for key, value in header.items()}
+
+    sample_interval = header.get("sample_interval")
+    if isinstance(sample_interval, list):
+        sample_interval = sample_interval[0]
+    axis = uniform_time_axis(data[:, 0], sample_interval if isinstance(sample_interval, float) else None)
+    if axis is None:
+        return data, attrs
+
+    attrs["time_start"], attrs["time_step"] = axis
+    channels = data[:, 1:]
+    encoded = encode_adc_codes(channels) if adc_codes else None
+    if encoded is None:
+        return channels, attrs
+
+    codes, adc_attrs = encoded
+    attrs.update(adc_attrs)
+    return codes, attrs
+
+
+def write_raw_trace(group: h5py.Group, dset_name: str, data: np.ndarray, source: dict,
+                    layout=None, header=None) -> h5py.Dataset:
+    """
+    Writes (or replaces) one raw trace with the given RawLayoutConfig.
+    The source manifest entry and the oscilloscope header are stored as attributes.
+    """
+    if dset_name in group:
+        del group[dset_name]
+    stored, attrs = encode_raw_trace(data, header, adc_codes=layout is not None and layout.adc_codes)
+    dset = group.create_dataset(dset_name, data=stored, **layout_kwargs(layout, stored.shape, stored.dtype))
+    dset.attrs.update(attrs)
+    dset.attrs.update(source)
+    return dset
+
+
+def _stream_kwargs(layout, n_columns: int, chunk_rows: int) -> dict:
+    """
+    create_dataset arguments of a resizable (None, n_columns) dataset: the layout's filters and dtype,
+    chunked by layout.chunk_rows (or the parser chunk size when the layout is contiguous).
+    """
+    kwargs = layout_kwargs(layout, (chunk_rows, n_columns))
+    rows = layout.chunk_rows if layout is not None and layout.chunk_rows is not None else chunk_rows
+    kwargs.update(shape=(0, n_columns), maxshape=(None, n_columns), chunks=(rows, n_columns))
+    kwargs.setdefault("dtype", np.float64)
+    return kwargs
+
+
+def _append_rows(dset: h5py.Dataset, rows: np.ndarray) -> None:
+    n_rows = dset.shape[0]
+    dset.resize(n_rows + len(rows), axis=0)
+    dset[n_rows:] = rows
+
+
+def _expand_time_column(group: h5py.Group, dset_name: str, chunk_rows: int) -> h5py.Dataset:
+    """
+    Rewrites a streamed (N, 2) channel dataset as (N, 3) with an explicit time column,
+    chunk by chunk, once a later chunk turns out not to be uniformly sampled.
+    """
+    dset = group[dset_name]
+    t0, dt = dset.attrs["time_start"], dset.attrs["time_step"]
+    kwargs = dict(dtype=dset.dtype, shape=(dset.shape[0], 3), maxshape=(None, 3),
+                  chunks=(dset.chunks[0], 3), compression=dset.compression,
+                  compression_opts=dset.compression_opts, shuffle=dset.shuffle)
+    expanded = group.create_dataset(f"{dset_name}.expanding", **kwargs)
+    for start in range(0, dset.shape[0], chunk_rows):
+        channels = dset[start:start + chunk_rows]
+        time = t0 + dt * np.arange(start, start + len(channels))
+        expanded[start:start + len(channels)] = np.column_stack((time, channels))
+    del group[dset_name]
+    group.move(f"{dset_name}.expanding", dset_name)
+    return group[dset_name]
+
+
+def stream_raw_trace(group: h5py.Group, dset_name: str, file_path: str, source: dict,
+                     layout=None, chunk_rows=STREAM_CHUNK_ROWS, chunk_callback=None) -> h5py.Dataset:
+    """
+    Writes (or replaces) one raw trace by streaming a Tektronix CSV in chunk_rows pieces
+    into a resizable chunked dataset, so peak memory stays at a few chunks for any record length.
+    Uniformly sampled traces are stored as channels + time_start/time_step like write_raw_trace;
+    ADC code encoding needs the whole record and is not applied.
+    chunk_callback, if given, is called with every parsed (n, 3) chunk (e.g. to collect quality stats).
+    """
+    if dset_name in group:
+        del group[dset_name]
+    header = read_oscilloscope_csv_header(file_path)
+    attrs = {f"scope_{key}": _attr_value(value) for key, value in header.items()}
+    sample_interval = header.get("sample_interval")
+    if isinstance(sample_interval, list):
+        sample_interval = sample_interval[0]
+    sample_interval = sample_interval if isinstance(sample_interval, float) else None
+
+    dset, axis = None, None
+    for chunk in iter_oscilloscope_csv_chunks(file_path, chunk_rows):
+        if chunk_callback is not None:
+            chunk_callback(chunk)
+        if dset is None:
+            axis = uniform_time_axis(chunk[:, 0], sample_interval)
+            n_columns = 3 if axis is None else 2
+            dset = group.create_dataset(dset_name, **_stream_kwargs(layout, n_columns, chunk_rows))
+            if axis is not None:
+                dset.attrs["time_start"], dset.attrs["time_step"] = axis
+        elif axis is not None:
+            expected = axis[0] + axis[1] * np.arange(dset.shape[0], dset.shape[0] + len(chunk))
+            if not np.all(np.abs(chunk[:, 0] - expected) <= 0.01 * axis[1]):
+                dset = _expand_time_column(group, dset_name, chunk_rows)
+                axis = None
+        _append_rows(dset, chunk if axis is None else chunk[:, 1:])
+
+    if dset is None:
+        raise ValueError(f"No data rows in {file_path}")
+    dset.attrs.update(attrs)
+    dset.attrs.update(source)
+    return dset
+
+
+def raw_time_step(dset: h5py.Dataset):
+    """
+    Returns the stored sample interval of a raw trace, or None if time is stored as a column.
+    """
+    value = dset.attrs.get("time_step")
+    return None if value is None else float(value)
+
+
+def raw_channel_step(dset: h5py.Dataset, channel: int):
+    """
+    Returns the quantisation step of a channel (0: CH1, 1: CH2) of an ADC-coded trace, else None.
+    """
+    if "adc_scale" not in dset.attrs:
+        return None
+    return float(dset.attrs["adc_scale"][channel]) / 10.0 ** int(dset.attrs["adc_decimals"][channel])
+
+
+def read_raw_trace(dset: h5py.Dataset, stop=None) -> np.ndarray:
+    """
+    Reads the first `stop` rows of a raw trace as a float64 (N, 3) TIME, CH1, CH2 array.
+    For uniformly sampled traces the time column is rebuilt from time_start/time_step.
+    """
+    n_rows = dset.shape[0] if stop is None else min(stop, dset.shape[0])
+    if "adc_scale" in dset.attrs:
+        values = decode_adc_codes(dset[:n_rows], dset.attrs)
+    else:
+        values = np.asarray(dset[:n_rows], dtype=np.float64)
+    if "time_step" not in dset.attrs:
+        return values
+
+    time = dset.attrs["time_start"] + dset.attrs["time_step"] * np.arange(n_rows)
+    return np.column_stack((time, values))
+
+
+def mappable(dset: h5py.Dataset) -> bool:
+    """
+    True when a raw trace is one contiguous, unfiltered block of native float64 in the file,
+    so that map_raw_trace can view it without reading.
+    """
+    return (dset.chunks is None and dset.dtype == np.dtype(np.float64) and "adc_scale" not in dset.attrs
+            and dset.id.get_offset() is not None)
+
+
+def map_raw_file(hdf: h5py.File) -> mmap.mmap:
+    """Read-only memory map of a whole raw database file (for map_raw_trace)."""
+    with open(hdf.filename, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def map_raw_trace(dset: h5py.Dataset, file_map: mmap.mmap, stop=None) -> tuple:
+    """
+    Returns the first `stop` rows of a mappable raw trace as (TIME, CH1, CH2) columns that are
+    read-only views into the memory-mapped file: nothing is copied and pages are only loaded
+    when touched. For uniformly sampled traces the time column is rebuilt from time_start/time_step.
+    """
+    values = np.frombuffer(file_map, dtype=np.float64, count=int(np.prod(dset.shape)),
+                           offset=dset.id.get_offset()).reshape(dset.shape)
+    values = values[:stop]
+    if "time_step" not in dset.attrs:
+        return tuple(values.T)
+
+    time = dset.attrs["time_start"] + dset.attrs["time_step"] * np.arange(len(values))
+    return (time,) + tuple(values.T)
+
+
+def update_manifest(dset: h5py.Dataset, source: dict) -> None:
+    """
+    Refreshes the manifest attributes of a dataset whose content did not change.
+    """
+    dset.attrs.update(source)
+
+
+def read_manifest(hdf: h5py.File, group_paths) -> dict:
+    """
+    Maps '<group>/<dataset>' to its recorded source path for the given groups.
+    """
+    manifest = {}
+    for group_path in group_paths:
+        if group_path not in hdf:
+            continue
+        for dset_name, dset in hdf[group_path].items():
+            source_path = dset.attrs.get("source_path")
+            manifest[f"{group_path}/{dset_name}"] = None if source_path is None else str(source_path)
+    return manifest
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,175 @@
+import argparse
+import os
+import subprocess
+import time
+
+import h5py
+import numpy as np
+
+from configuration import get_experiment_config
+from fit_cache import config_fingerprint, config_json
+from live_db import open_processed
+from scalar_table import SCALARS_GROUP
+
+RUNS_DIRNAME = "runs"
+PROCESSED_FILENAME = "processed_experiment_data.h5"
+DIFF_COLUMNS = ("Rise_D", "Fall_D", "Rise_c1", "Fall_c1", "dn_infinity", "e_square")
+
+
+def code_version() -> str:
+    """Git commit of the processing code ('-dirty' with uncommitted changes), or 'unknown'."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_provenance(config, label=None) -> dict:
+    """Root attributes of a processed file: what produced it, with which settings, and when."""
+    return {
+            "run_label": label or "",
+            "config_fingerprint": config_fingerprint(config),
+            "code_version": code_version(),
+            "config_json": config_json(config),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "finished": "",
+    }
+
+
+def new_run_path(config, label=None) -> str:
+    """'<database>/runs/<YYYYmmdd-HHMMSS>-<fingerprint>[-label].h5' for a new versioned run."""
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{config_fingerprint(config)[:8]}"
+    if label:
+        run_id = f"{run_id}-{label}"
+    runs_dir = os.path.join(config.base_dirs.database, RUNS_DIRNAME)
+    os.makedirs(runs_dir, exist_ok=True)
+    return os.path.join(runs_dir, f"{run_id}.h5")
+
+
+def finish_run(processed_hdf_filename) -> None:
+    """Stamps the finish time once the run has closed the file (a run without it did not complete)."""
+    with h5py.File(processed_hdf_filename, 'a') as processed_hdf:
+        processed_hdf.attrs["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def list_runs(config) -> list:
+    """
+    (run id, provenance attrs) of every versioned run, oldest first. attrs is None for a run that
+    cannot be opened, typically one still being written without SWMR (its file is locked).
+    """
+    runs_dir = os.path.join(config.base_dirs.database, RUNS_DIRNAME)
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = []
+    for filename in sorted(f for f in os.listdir(runs_dir) if f.endswith(".h5")):
+        try:
+            with open_processed(os.path.join(runs_dir, filename)) as processed_hdf:
+                attrs = {key: str(value) for key, value in processed_hdf.attrs.items()}
+        except OSError:
+            attrs = None
+        runs.append((filename[:-3], attrs))
+    return runs
+
+
+def resolve_run(config, name) -> str:
+    """A run id, unique run-id prefix, 'current' (processed_experiment_data.h5) or a file path -> file path."""
+    if name == "current":
+        return os.path.join(config.base_dirs.database, PROCESSED_FILENAME)
+    if os.path.isfile(name):
+        return name
+    matches = [run_id for run_id, _ in list_runs(config) if run_id.startswith(name)]
+    if len(matches) != 1:
+        raise ValueError(f"Run '{name}' matches {len(matches)} runs")
+    return os.path.join(config.base_dirs.database, RUNS_DIRNAME, f"{matches[0]}.h5")
+
+
+def read_scalar_tables(processed_hdf_filename) -> dict:
+    """Every scalars table of a processed file, {'<conc>/<flow>/<pulse>': structured array}."""
+    tables = {}
+    with open_processed(processed_hdf_filename) as processed_hdf:
+        if SCALARS_GROUP in processed_hdf:
+            processed_hdf[SCALARS_GROUP].visititems(
+                    lambda name, obj: tables.__setitem__(name, obj[()]) if isinstance(obj, h5py.Dataset) else None)
+    return tables
+
+
+def kerr_slope(table: np.ndarray) -> float:
+    """Slope of dn_infinity against e_square over the traces of one pulse group (NaN if undefined)."""
+    if table is None or len(table) < 2 or not {"e_square", "dn_infinity"} <= set(table.dtype.names):
+        return np.nan
+    finite = np.isfinite(table["e_square"]) & np.isfinite(table["dn_infinity"])
+    if np.count_nonzero(finite) < 2 or np.ptp(table["e_square"][finite]) == 0:
+        return np.nan
+    return float(np.polyfit(table["e_square"][finite], table["dn_infinity"][finite], 1)[0])
+
+
+def diff_runs(path_a, path_b, columns=DIFF_COLUMNS, rtol=1e-9) -> dict:
+    """
+    Compares the scalar results of two processed files group by group, using only their scalars
+    tables. Traces are matched by name; per column it reports how many matched traces differ
+    beyond rtol and the largest relative change, plus each group's Kerr slope in both runs.
+    Returns {group: {"only_a", "only_b", "n_matched", "columns": {column: (n_changed, max_rel)},
+    "kerr_slope": (a, b)}}.
+    """
+    tables_a, tables_b = read_scalar_tables(path_a), read_scalar_tables(path_b)
+    report = {}
+    for group in sorted(set(tables_a) | set(tables_b)):
+        table_a, table_b = tables_a.get(group), tables_b.get(group)
+        traces_a = table_a["trace"] if table_a is not None else np.array([], dtype="S32")
+        traces_b = table_b["trace"] if table_b is not None else np.array([], dtype="S32")
+        common, index_a, index_b = np.intersect1d(traces_a, traces_b, return_indices=True)
+        entry = {"only_a": len(traces_a) - len(common), "only_b": len(traces_b) - len(common),
+                 "n_matched": len(common), "columns": {},
+                 "kerr_slope": (kerr_slope(table_a), kerr_slope(table_b))}
+        for column in columns:
+            if table_a is None or table_b is None or column not in table_a.dtype.names \
+                    or column not in table_b.dtype.names:
+                continue
+            a, b = table_a[column][index_a], table_b[column][index_b]
+            changed = ~np.isclose(a, b, rtol=rtol, atol=0.0, equal_nan=True)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                relative = np.abs(b - a) / np.abs(a)
+            max_rel = float(np.nanmax(relative[changed])) if np.any(changed & np.isfinite(relative)) else 0.0
+            entry["columns"][column] = (int(np.count_nonzero(changed)), max_rel)
+        report[group] = entry
+    return report
+
+
+def print_diff(report: dict) -> None:
+    n_changed = sum(1 for entry in report.values() if any(n for n, _ in entry["columns"].values()))
+    print(f"{len(report)} groups, {n_changed} with changed scalars")
+    for group, entry in report.items():
+        slope_a, slope_b = entry["kerr_slope"]
+        changes = ", ".join(f"{column} {n}/{entry['n_matched']} (max rel {max_rel:.2e})"
+                            for column, (n, max_rel) in entry["columns"].items() if n)
+        extra = "".join(f", {entry[key]} {key.replace('_', ' ')}" for key in ("only_a", "only_b") if entry[key])
+        slope = "" if slope_a == slope_b or (np.isnan(slope_a) and np.isnan(slope_b)) \
+            else f" | Kerr slope {slope_a:.4g} -> {slope_b:.4g}"
+        print(f"{group:>14}: {changes or 'unchanged'}{extra}{slope}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versioned processing runs: list them and diff their scalar results.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List versioned runs with their provenance")
+    diff = subparsers.add_parser("diff", help="Compare the scalar results of two runs")
+    diff.add_argument("a", help="Run id (or unique prefix), 'current' or a file path")
+    diff.add_argument("b", help="Run id (or unique prefix), 'current' or a file path")
+    diff.add_argument("--rtol", type=float, default=1e-9, help="Relative tolerance below which values are equal")
+    args = parser.parse_args()
+
+    config = get_experiment_config()
+    if args.command == "list":
+        for run_id, attrs in list_runs(config):
+            if attrs is None:
+                print(f"{run_id}\tin progress/unreadable")
+                continue
+            status = f"finished {attrs['finished']}" if attrs.get("finished") else "incomplete"
+            print(f"{run_id}\tcode {attrs.get('code_version', '?')}\tstarted {attrs.get('started', '?')}\t{status}")
+    else:
+        print_diff(diff_runs(resolve_run(config, args.a), resolve_run(config, args.b), rtol=args.rtol))
@@ -0,0 +1,67 @@
+import h5py
+import numpy as np
+
+SCALARS_GROUP = "scalars"
+TRACE_NAME = "S32"
+
+
+def scalar_results(results: dict) -> dict:
+    """The scalar entries of an interpret_dataset result (the ones store_results writes as 0-d datasets)."""
+    return {key: float(value) for key, value in results.items() if isinstance(value, (int, float, np.generic))}
+
+
+def table_path(group_path: str) -> str:
+    """'<conc>/<flow>/<pulse>' -> 'scalars/<conc>/<flow>/<pulse>'."""
+    return f"{SCALARS_GROUP}/{group_path.strip('/')}"
+
+
+def build_scalar_table(rows: dict) -> np.ndarray:
+    """
+    Turns {trace: {scalar: value}} into a structured array with a 'trace' column and one
+    float64 column per scalar (NaN where a trace lacks it), sorted by trace name.
+    """
+    columns = list(dict.fromkeys(key for row in rows.values() for key in row))
+    table = np.empty(len(rows), dtype=[("trace", TRACE_NAME)] + [(column, np.float64) for column in columns])
+    for i, trace in enumerate(sorted(rows)):
+        table[i]["trace"] = trace.encode()
+        for column in columns:
+            table[i][column] = rows[trace].get(column, np.nan)
+    return table
+
+
+def store_scalar_table(processed_hdf: h5py.File, group_path: str, rows: dict) -> None:
+    """
+    Writes (or replaces) the compound scalars table of one pulse group.
+    """
+    path = table_path(group_path)
+    if path in processed_hdf:
+        del processed_hdf[path]
+    if rows:
+        processed_hdf.create_dataset(path, data=build_scalar_table(rows))
+
+
+def read_scalar_table(group: h5py.Group):
+    """
+    Reads the scalars table belonging to a processed pulse group in one call, or None if absent.
+    """
+    path = table_path(group.name)
+    return group.file[path][()] if path in group.file else None
+
+
+def load_group_scalars(group: h5py.Group, names) -> dict:
+    """
+    Maps each requested scalar to a 1-D array over the traces of a processed pulse group.
+    Uses the scalars table when present, otherwise reads the 0-d datasets trace by trace
+    (databases written before the table existed).
+    """
+    table = read_scalar_table(group)
+    if table is not None:
+        return {name: table[name] if name in table.dtype.names else np.array([]) for name in names}
+
+    values = {name: [] for name in names}
+    for filename in group:
+        dataset = group[filename]
+        for name in names:
+            if name in dataset:
+                values[name].append(np.array(dataset[name]))
+    return {name: np.array(value).flatten() for name, value in values.items()}
@@ -0,0 +1,156 @@
+import argparse
+import os
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+
+from configuration import get_experiment_config
+from raw_db import layout_kwargs, raw_channel_step, raw_time_step, read_raw_trace
+
+STACKED_FILENAME = "experiment_data_stacked.h5"
+TRACES = "traces"
+SHOTS = "shots"
+SHOT_CHUNK = 4  # 4 x 4096 x 2 float64 = 256 KiB, well inside the default 1 MiB chunk cache
+SAMPLE_CHUNK = 4096
+
+
+def pulse_group_paths(config) -> list:
+    """All configured '<conc>/<flow>/<pulse>' group paths."""
+    return [f"{conc}/{flow}/{pulse}" for conc in config.potentials.concentrations
+            for flow in config.potentials.flows for pulse in config.potentials.pulse_width]
+
+
+def stacked_kwargs(layout, shape: tuple) -> dict:
+    """
+    create_dataset arguments of a (n_shots, n_samples, n_columns) stack: the RawLayoutConfig filters
+    and dtype, chunked by a few shots times a block of samples so that both whole-group reads and
+    sample slices across all shots touch few chunks.
+    """
+    kwargs = layout_kwargs(layout, shape)
+    kwargs.setdefault("dtype", np.float64)
+    kwargs["chunks"] = (min(shape[0], SHOT_CHUNK), max(1, min(shape[1], SAMPLE_CHUNK)), shape[2])
+    kwargs.update(shape=shape, fillvalue=np.nan)
+    return kwargs
+
+
+def stack_group(raw_group: h5py.Group, stacked_group: h5py.Group, layout=None) -> int:
+    """
+    Writes every trace of one raw <conc>/<flow>/<pulse> group into a single chunked
+    (n_shots, n_samples, n_columns) 'traces' array plus a 'shots' name index.
+    Shorter traces are NaN-padded, their length is kept in 'n_samples'. When all shots are
+    uniformly sampled only CH1, CH2 are stacked and the time axes go to 'time_start'/'time_step';
+    'channel_step' holds the ADC quantisation step per shot and channel (NaN if unknown).
+    Returns the number of stacked shots.
+    """
+    names = sorted(name for name, obj in raw_group.items() if isinstance(obj, h5py.Dataset))
+    if not names:
+        return 0
+    dsets = [raw_group[name] for name in names]
+    uniform = all(raw_time_step(dset) is not None for dset in dsets)
+    n_columns = 2 if uniform else 3
+    lengths = np.array([dset.shape[0] for dset in dsets], dtype=np.int64)
+
+    traces = stacked_group.create_dataset(TRACES, **stacked_kwargs(layout, (len(dsets), int(lengths.max()),
+                                                                            n_columns)))
+    for i, dset in enumerate(dsets):
+        traces[i, :lengths[i]] = read_raw_trace(dset)[:, 3 - n_columns:]
+
+    stacked_group.create_dataset(SHOTS, data=np.array(names, dtype=h5py.string_dtype()))
+    stacked_group.create_dataset("n_samples", data=lengths)
+    stacked_group.create_dataset("channel_step", data=np.array(
+            [[np.nan if step is None else step for step in (raw_channel_step(dset, 0), raw_channel_step(dset, 1))]
+             for dset in dsets]))
+    if uniform:
+        stacked_group.create_dataset("time_start", data=np.array([dset.attrs["time_start"] for dset in dsets]))
+        stacked_group.create_dataset("time_step", data=np.array([raw_time_step(dset) for dset in dsets]))
+    return len(dsets)
+
+
+def build_stacked_database(raw_hdf_filename, stacked_hdf_filename, group_paths, layout=None) -> None:
+    """
+    Converts the given groups of the per-file raw database into the stacked layout.
+    """
+    with h5py.File(raw_hdf_filename, 'r') as raw_hdf, h5py.File(stacked_hdf_filename, 'w') as stacked_hdf:
+        pbar = tqdm([gp for gp in group_paths if gp in raw_hdf], desc="Stacking", leave=True, dynamic_ncols=True)
+        for group_path in pbar:
+            pbar.set_description(f"Stacking: {group_path:>14}")
+            n_shots = stack_group(raw_hdf[group_path], stacked_hdf.create_group(group_path), layout)
+            if not n_shots:
+                del stacked_hdf[group_path]
+        pbar.close()
+    print(f"✅ Stacked database written to {stacked_hdf_filename}")
+
+
+def stacked_shots(group: h5py.Group) -> list:
+    """Shot (TEK) names of a stacked group, in stack order."""
+    return [name.decode() if isinstance(name, bytes) else str(name) for name in group[SHOTS][()]]
+
+
+def _with_time(group: h5py.Group, values: np.ndarray, start: int) -> np.ndarray:
+    """Prepends the rebuilt time column to channels-only stacked values, NaN beyond each shot's length."""
+    if "time_step" not in group:
+        return values
+    index = np.arange(start, start + values.shape[1])
+    time = group["time_start"][()][:, None] + group["time_step"][()][:, None] * index
+    time[index >= group["n_samples"][()][:, None]] = np.nan
+    return np.concatenate((time[:, :, None], values), axis=2)
+
+
+def read_stacked_group(group: h5py.Group, stop=None) -> tuple:
+    """
+    Reads a whole stacked group (the first `stop` samples of every shot) in one I/O call.
+    Returns (shot names, float64 (n_shots, n_samples, 3) TIME, CH1, CH2 array).
+    """
+    traces = group[TRACES]
+    selection = np.s_[()] if stop is None or stop >= traces.shape[1] else np.s_[:, :stop]
+    values = np.asarray(traces[selection], dtype=np.float64)
+    return stacked_shots(group), _with_time(group, values, 0)
+
+
+def read_stacked_samples(group: h5py.Group, start: int, stop: int) -> np.ndarray:
+    """
+    Reads samples [start, stop) of every shot of a stacked group as one hyperslab:
+    a float64 (n_shots, stop - start, 3) TIME, CH1, CH2 array.
+    """
+    values = np.asarray(group[TRACES][:, start:stop], dtype=np.float64)
+    return _with_time(group, values, start)
+
+
+def read_stacked_shot(group: h5py.Group, index: int, stop=None) -> np.ndarray:
+    """
+    Reads one shot of a stacked group (its first `stop` samples, at most its own length)
+    as a float64 (N, 3) TIME, CH1, CH2 array.
+    """
+    n_samples = int(group["n_samples"][index])
+    stop = n_samples if stop is None else min(stop, n_samples)
+    values = np.asarray(group[TRACES][index, :stop], dtype=np.float64)
+    if "time_step" not in group:
+        return values
+    time = group["time_start"][index] + group["time_step"][index] * np.arange(stop)
+    return np.column_stack((time, values))
+
+
+def stacked_time_steps(group: h5py.Group) -> list:
+    """Per-shot sample interval, None for shots stored with a time column."""
+    if "time_step" not in group:
+        return [None] * group[TRACES].shape[0]
+    return [float(step) for step in group["time_step"][()]]
+
+
+def stacked_channel_steps(group: h5py.Group, channel: int) -> list:
+    """Per-shot ADC quantisation step of a channel (0: CH1, 1: CH2), None where unknown."""
+    return [None if np.isnan(step) else float(step) for step in group["channel_step"][:, channel]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the stacked (n_shots x n_samples x channel) raw database.")
+    parser.add_argument("--raw", default=None, help="Raw database (default: <database>/experiment_data_pulses.h5)")
+    parser.add_argument("--out", default=None, help=f"Stacked database (default: <database>/{STACKED_FILENAME})")
+    args = parser.parse_args()
+
+    config = get_experiment_config()
+    build_stacked_database(args.raw if args.raw else os.path.join(config.base_dirs.database,
+                                                                  "experiment_data_pulses.h5"),
+                           args.out if args.out else os.path.join(config.base_dirs.database, STACKED_FILENAME),
+                           pulse_group_paths(config), config.raw_layout)
@@ -0,0 +1,65 @@
+import numpy as np
+
+import analizer
+from batched import batch_bg_sub, preprocess_group
+from configuration import DirBoundary, get_experiment_config
+from process_database import preprocess_trace
+
+GROUP = "00000/0/100"
+SAMPLE_INTERVAL = 4e-6
+
+
+def synthetic_trace(rng, n_points, intensity_step):
+    """A pulse response with CH2 quantised to intensity_step (None: not quantised)."""
+    time = -0.1 * n_points * SAMPLE_INTERVAL + np.arange(n_points) * SAMPLE_INTERVAL
+    field = np.where((np.arange(n_points) > n_points // 30) & (np.arange(n_points) < n_points // 2), 10.0, 0.0)
+    intensity = 0.02 + 0.01 * (1 - np.exp(-np.arange(n_points) / (n_points / 10))) + rng.normal(0, 1e-3, n_points)
+    if intensity_step is not None:
+        intensity = np.round(intensity / intensity_step) * intensity_step
+    return np.column_stack((time, field + rng.normal(0, 0.08, n_points), intensity))
+
+
+def test_preprocess_group_matches_preprocess_trace():
+    config = get_experiment_config()
+    rng = np.random.default_rng(0)
+    # mixed lengths (shorter and longer than setup.cut), mixed quantisation steps and time steps
+    shots = [(config.setup.cut + 3_000, 2e-4, SAMPLE_INTERVAL), (12_000, 2e-4, None),
+             (config.setup.cut - 1, 5e-4, SAMPLE_INTERVAL), (9_000, None, None), (15_000, 5e-4, None)]
+    entries = []
+    for i, (n_points, intensity_step, time_step) in enumerate(shots):
+        dataset = f"TEK{i:05d}"
+        data = synthetic_trace(rng, n_points, intensity_step)
+        n_rows = min(n_points, config.setup.cut)
+        config.directories.boundaries[f"{GROUP}/{dataset}"] = DirBoundary(st=n_rows // 30, end=n_rows // 2,
+                                                                          tr1=None, tr2=None, accept=1)
+        entries.append((dataset, data if i % 2 else tuple(data.T), time_step, intensity_step))
+
+    batched = preprocess_group(entries, config, GROUP)
+    assert len(batched) == len(entries)
+    for (dataset, data, time_step, intensity_step), pre in zip(entries, batched):
+        expected = preprocess_trace(data, config, GROUP, dataset, time_step, intensity_step)
+        assert pre.keys() == expected.keys()
+        for key, value in expected.items():
+            if value is None:
+                assert pre[key] is None, key
+                continue
+            value, other = np.asarray(value, dtype=float), np.asarray(pre[key], dtype=float)
+            assert other.shape == value.shape, key
+            np.testing.assert_allclose(other, value, rtol=1e-9, atol=1e-12 * np.nanmax(np.abs(value), initial=0.0),
+                                       equal_nan=True, err_msg=key)
+
+
+def test_padded_rows_stay_on_the_lookup_table(monkeypatch):
+    config = get_experiment_config()
+    step = 2e-4
+    values = np.full((3, 1_000), np.nan)
+    for i, n_points in enumerate((1_000, 700, 400)):
+        values[i, :n_points] = np.arange(n_points) % 100 * step
+    analizer.i2delta_n_table(config, step, 100)  # built from exact values once, then cached
+
+    def exact(*args):
+        raise AssertionError("off-grid path taken")
+
+    monkeypatch.setattr(analizer, "_i2delta_n_exact", exact)
+    dn = batch_bg_sub(values, config, [step] * 3)
+    assert np.array_equal(np.isnan(dn), np.isnan(values))
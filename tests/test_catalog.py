@@ -0,0 +1,24 @@
+import os
+
+import catalog
+from catalog import build_catalog, group_files
+
+
+def write_tree(raw_root, names):
+    group = raw_root / "00156" / "0" / "300"
+    group.mkdir(parents=True)
+    for name in names:
+        (group / name).write_text("TIME,CH1,CH2\n")
+    return group
+
+
+def test_files_vanishing_after_the_scan_are_skipped(tmp_path, monkeypatch):
+    raw_root = tmp_path / "raw"
+    group = write_tree(raw_root, ["TEK00000.CSV", "TEK00001.CSV"])
+    scan_tree = catalog.scan_tree
+    monkeypatch.setattr(catalog, "scan_tree", lambda root: scan_tree(root) + [str(group / "TEK00002.CSV")])
+
+    counts = build_catalog(str(raw_root), str(tmp_path / "catalog.sqlite"), workers=2)
+    assert (counts["files"], counts["new"], counts["vanished"]) == (2, 2, 1)
+    paths = group_files(str(tmp_path / "catalog.sqlite"), "00156", 0, 300)
+    assert [os.path.basename(path) for path in paths] == ["TEK00000.CSV", "TEK00001.CSV"]
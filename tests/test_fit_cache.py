@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from configuration import DirBoundary, get_experiment_config
+from fit_cache import config_fingerprint, trace_key
+
+TRACE = "00000/0/100/TEK00000"
+
+
+def test_fingerprint_ignores_settings_the_fits_do_not_read():
+    config = get_experiment_config()
+    fingerprint = config_fingerprint(config)
+    config.setup.rotation += 1
+    config.setup.sigma += 1
+    config.fit.time_threshold += 1
+    config.fit.dn_stability_index += 1
+    config.material.eps_par += 1.0
+    config.output.packed = not config.output.packed
+    assert config_fingerprint(config) == fingerprint
+
+
+def test_fingerprint_follows_settings_the_fits_read():
+    config = get_experiment_config()
+    fingerprint = config_fingerprint(config)
+    config.fit.sgf_window += 2
+    assert config_fingerprint(config) != fingerprint
+    config = get_experiment_config()
+    config.setup.cut -= 1
+    assert config_fingerprint(config) != fingerprint
+
+
+def pulse_trace(n_points=20_000, st=640, end=9_600):
+    rng = np.random.default_rng(0)
+    field = np.where((np.arange(n_points) >= st) & (np.arange(n_points) < end), 40.0, 0.0)
+    return np.column_stack((np.arange(n_points) * 3.2e-5, field + rng.normal(0, 0.5, n_points),
+                            rng.normal(0.05, 2e-3, n_points)))
+
+
+def test_key_without_boundary_matches_the_derived_boundary():
+    config = get_experiment_config()
+    config.directories.boundaries.pop(TRACE, None)
+    data = pulse_trace()
+    derived = trace_key(data, config, TRACE)
+    config.directories.boundaries[TRACE] = DirBoundary(st=640, end=9_600, tr1=None, tr2=None, accept=1)
+    assert trace_key(data, config, TRACE) == derived
+
+
+def test_key_without_boundary_or_pulse_is_an_error():
+    config = get_experiment_config()
+    config.directories.boundaries.pop(TRACE, None)
+    data = pulse_trace()
+    data[:, 1] = 0.0
+    with pytest.raises(ValueError, match="no DirBoundary"):
+        trace_key(data, config, TRACE)
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import h5py
+import numpy as np
+import pytest
+
+import lossy
+from lossy import create_result_dataset, stored_values
+from packed_results import append_packed_results, packed_traces, read_packed, write_packed_group
+
+ABS_ERROR = 5e-3
+OUTPUT = SimpleNamespace(lossy_abs_error=ABS_ERROR, lossy_keys=["dn"])
+
+
+def values(seed, n=5_000):
+    return np.random.default_rng(seed).uniform(0.0, 1.0, n)
+
+
+def without_quantising(monkeypatch):
+    """Writes the raw values, as a digits mismatch would: the filter then truncates by up to 10**-digits."""
+    monkeypatch.setattr(lossy, "quantise", lambda values, digits: np.asarray(values, dtype=np.float64))
+
+
+def test_stored_values_bypass_the_chunk_cache(tmp_path):
+    original = values(0)
+    with h5py.File(tmp_path / "a.h5", "w") as f:
+        dset = f.create_dataset("x", data=original, scaleoffset=2, chunks=(1_000,))
+        assert np.array_equal(dset[()], original)  # answered from the unfiltered chunk cache
+        stored = stored_values(dset)
+        assert np.array_equal(stored_values(dset, 2_500), stored[2_500:])
+    with h5py.File(tmp_path / "a.h5", "r") as f:
+        np.testing.assert_array_equal(stored, f["x"][()])
+    assert not np.array_equal(stored, original)
+
+
+def test_lossy_dataset_reads_back_within_the_bound(tmp_path):
+    original = values(1)
+    with h5py.File(tmp_path / "a.h5", "w") as f:
+        dset = create_result_dataset(f, "dn", original, OUTPUT, chunks=(1_000,))
+        assert dset.scaleoffset is not None
+    with h5py.File(tmp_path / "a.h5", "r") as f:
+        assert np.max(np.abs(f["dn"][()] - original)) <= ABS_ERROR
+
+
+def test_create_rejects_values_stored_beyond_the_bound(tmp_path, monkeypatch):
+    without_quantising(monkeypatch)
+    with h5py.File(tmp_path / "a.h5", "w") as f, pytest.raises(ValueError, match="exceeds the bound"):
+        create_result_dataset(f, "dn", values(2), OUTPUT, chunks=(1_000,))
+
+
+def test_append_reads_back_and_drops_a_trace_stored_beyond_the_bound(tmp_path, monkeypatch):
+    with h5py.File(tmp_path / "a.h5", "w") as f:
+        group = f.create_group("pulse")
+        write_packed_group(group, {"TEK00000": {"dn": values(3)}}, OUTPUT)
+        append_packed_results(group, "TEK00001", {"dn": values(4)})
+        without_quantising(monkeypatch)
+        with pytest.raises(ValueError, match="exceeds the bound"):
+            append_packed_results(group, "TEK00002", {"dn": values(5)})
+        assert packed_traces(group) == ["TEK00000", "TEK00001"]
+        stored = read_packed(group, "dn")
+    assert np.max(np.abs(stored["TEK00001"] - values(4))) <= ABS_ERROR
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from oscilloscope import parse_isf, read_oscilloscope_csv_with_header, read_waveform_with_header
+
+N_POINTS = 2_000
+
+
+def write_isf(path, codes, byte_order="MSB", n_bytes=2, bn_fmt="RI", x_incr=4e-6, x_zero=-4e-3, pt_off=0.0,
+              y_mult=1.5625e-4, y_zero=0.0, y_off=0.0, channel="CH1"):
+    """Writes integer codes as a Tektronix .isf file with the given preamble."""
+    kind = "u" if bn_fmt == "RP" else "i"
+    payload = np.asarray(codes).astype(f"{'>' if byte_order == 'MSB' else '<'}{kind}{n_bytes}").tobytes()
+    length = str(len(payload))
+    preamble = (f":WFMPRE:BYT_NR {n_bytes};BIT_NR {8 * n_bytes};ENCDG BIN;BN_FMT {bn_fmt};BYT_OR {byte_order};"
+                f'NR_PT {len(codes)};WFID "{channel}, DC coupling";PT_FMT Y;XINCR {x_incr!r};PT_OFF {pt_off!r};'
+                f'XZERO {x_zero!r};XUNIT "s";YMULT {y_mult!r};YZERO {y_zero!r};YOFF {y_off!r};YUNIT "V";'
+                f":CURVE #{len(length)}{length}")
+    with open(path, "wb") as f:
+        f.write(preamble.encode("latin1") + payload + b"\n")
+
+
+def write_csv(path, data):
+    """Writes a (N, 3) TIME, CH1, CH2 block as a Tektronix CSV, floats in round-trip precision."""
+    with open(path, "w") as f:
+        f.write(f"Model,MDO3024\nRecord Length,{len(data)},{len(data)}\nTIME,CH1,CH2\n")
+        np.savetxt(f, data, fmt="%.17g", delimiter=",")
+
+
+def random_codes(rng, n_bytes, bn_fmt):
+    bits = 8 * n_bytes
+    low, high = (0, 2 ** bits) if bn_fmt == "RP" else (-2 ** (bits - 1), 2 ** (bits - 1))
+    return rng.integers(low, high, N_POINTS)
+
+
+@pytest.mark.parametrize("byte_order", ["MSB", "LSB"])
+@pytest.mark.parametrize("n_bytes, bn_fmt", [(1, "RI"), (2, "RI"), (1, "RP"), (2, "RP")])
+def test_isf_record_matches_csv(tmp_path, byte_order, n_bytes, bn_fmt):
+    rng = np.random.default_rng(n_bytes)
+    codes1, codes2 = random_codes(rng, n_bytes, bn_fmt), random_codes(rng, n_bytes, bn_fmt)
+    scaling1 = dict(y_mult=8e-2, y_zero=0.5, y_off=3.0)
+    scaling2 = dict(y_mult=4e-4, y_zero=-1e-3, y_off=-100.0)
+    for codes, channel, scaling in ((codes1, "CH1", scaling1), (codes2, "CH2", scaling2)):
+        write_isf(tmp_path / f"TEK00000{channel}.ISF", codes, byte_order, n_bytes, bn_fmt, pt_off=10.0,
+                  channel=channel, **scaling)
+
+    time = -4e-3 + 4e-6 * (np.arange(N_POINTS) - 10.0)
+    ch1 = (codes1 - scaling1["y_off"]) * scaling1["y_mult"] + scaling1["y_zero"]
+    ch2 = (codes2 - scaling2["y_off"]) * scaling2["y_mult"] + scaling2["y_zero"]
+    write_csv(tmp_path / "TEK00000.CSV", np.column_stack((time, ch1, ch2)))
+
+    data, header = read_waveform_with_header(str(tmp_path / "TEK00000CH1.ISF"))
+    csv_data, _ = read_oscilloscope_csv_with_header(str(tmp_path / "TEK00000.CSV"))
+    np.testing.assert_array_equal(data, csv_data)
+    assert header["record_length"] == N_POINTS
+    assert header["sample_interval"] == 4e-6
+    assert header["ymult"] == [8e-2, 4e-4]
+
+
+def test_isf_reads_from_either_channel_file(tmp_path):
+    codes = np.arange(-50, 50)
+    write_isf(tmp_path / "TEK00001CH1.ISF", codes, channel="CH1")
+    write_isf(tmp_path / "TEK00001CH2.ISF", -codes, channel="CH2")
+    from_ch1, _ = read_waveform_with_header(str(tmp_path / "TEK00001CH1.ISF"))
+    from_ch2, _ = read_waveform_with_header(str(tmp_path / "TEK00001CH2.ISF"))
+    np.testing.assert_array_equal(from_ch1, from_ch2)
+    np.testing.assert_array_equal(from_ch1[:, 2], -from_ch1[:, 1])
+
+
+def test_isf_abbreviated_preamble_keywords():
+    codes = np.array([-2, -1, 0, 1, 2], dtype=">i2")
+    blob = (b":WFMP:BYT_N 2;BN_F RI;BYT_O MSB;NR_P 5;XIN 1.0E-3;XZE 0.0;PT_O 0;YMU 2.0E-1;YZE 1.0;YOF 0.0;"
+            b":CURV #210" + codes.tobytes())
+    time, values, preamble = parse_isf(blob)
+    np.testing.assert_array_equal(values, codes * 0.2 + 1.0)
+    np.testing.assert_allclose(time, np.arange(5) * 1e-3)
+    assert preamble["NR_PT"] == 5
+
+
+def test_isf_rejects_ascii_curves():
+    with pytest.raises(ValueError, match="encoding"):
+        parse_isf(b":WFMPRE:ENCDG ASC;BYT_NR 2;:CURVE #13" + b"1,2")
+
+
+def test_isf_channels_of_different_length(tmp_path):
+    write_isf(tmp_path / "TEK00002CH1.ISF", np.zeros(10), channel="CH1")
+    write_isf(tmp_path / "TEK00002CH2.ISF", np.zeros(12), channel="CH2")
+    with pytest.raises(ValueError, match="record lengths differ"):
+        read_waveform_with_header(str(tmp_path / "TEK00002CH1.ISF"))
@@ -0,0 +1,31 @@
+import numpy as np
+
+from configuration import get_experiment_config
+from quality import quality_reasons, trace_stats
+
+
+def record(n_rows):
+    """A clean (N, 3) TIME, CH1, CH2 block well inside a +/-5 V screen."""
+    time = np.arange(n_rows) * 4e-6
+    return np.column_stack((time, np.sin(time * 1e3), 0.5 * np.cos(time * 1e3)))
+
+
+def csv_header(record_length):
+    return {"record_length": record_length, "vertical_scale": [1.0, 1.0], "vertical_offset": [0.0, 0.0]}
+
+
+def test_complete_short_record_is_not_quarantined():
+    config = get_experiment_config()
+    n_rows = config.setup.cut // 4
+    assert quality_reasons(trace_stats(record(n_rows)), csv_header(n_rows), config) == []
+
+
+def test_record_shorter_than_its_header_is_truncated():
+    config = get_experiment_config()
+    assert quality_reasons(trace_stats(record(1_000)), csv_header(2_000), config) == ["truncated"]
+
+
+def test_truncation_is_not_checked_without_a_header_length():
+    config = get_experiment_config()
+    assert quality_reasons(trace_stats(record(1_000)), {}, config) == []
+    assert quality_reasons(trace_stats(record(1_000)), None, config) == []
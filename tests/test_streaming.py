@@ -0,0 +1,31 @@
+import tracemalloc
+
+import h5py
+import numpy as np
+
+from benchmarks import write_synthetic_tek_csv
+from oscilloscope import read_oscilloscope_csv
+from raw_db import read_raw_trace, stream_raw_trace
+
+N_POINTS = 1_000_000
+CEILING_MB = 16.0  # the parsed (N, 3) float64 record alone is 23 MB, so a whole-file read cannot pass
+
+
+def test_streamed_ingest_stays_under_the_memory_ceiling(tmp_path):
+    csv_path = str(tmp_path / "TEK00000.CSV")
+    write_synthetic_tek_csv(csv_path, n_points=N_POINTS, sample_interval=1e-6)  # uniform in %.6e below 10 s
+
+    with h5py.File(tmp_path / "raw.h5", "w") as hdf:
+        tracemalloc.start()
+        try:
+            stream_raw_trace(hdf, "TEK00000", csv_path, {})
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+        streamed = read_raw_trace(hdf["TEK00000"])
+    assert peak_mb < CEILING_MB
+
+    data = read_oscilloscope_csv(csv_path)
+    assert streamed.shape == (N_POINTS, 3)
+    np.testing.assert_array_equal(streamed[:, 1:], data[:, 1:])
+    np.testing.assert_allclose(streamed[:, 0], data[:, 0], rtol=0, atol=0.01 * (data[1, 0] - data[0, 0]))
@@ -2,11 +2,11 @@ import os
 import sys
 from pathlib import Path
 
-import h5py
 import numpy as np
 import plotly.graph_objects as go
 from configuration import get_experiment_config
-from scipy.signal import savgol_filter as sgf
+from live_db import open_processed
+from lod import load_plot_results, smoothed_points
 
 from dataclasses import dataclass, field
 import plotly.io as pio
@@ -105,7 +105,7 @@ def plot_dn_values(hdf_filename, conc_selection=None, pulse_selection=None):
     color_scale = px.colors.qualitative.D3
 
 
-    with h5py.File(hdf_filename, 'r') as processed_hdf:
+    with open_processed(hdf_filename) as processed_hdf:
         for conc in conc_selection:
             for pulse in pulse_selection:
                 for flow in processed_hdf.get(conc, {}):
@@ -113,13 +113,14 @@ def plot_dn_values(hdf_filename, conc_selection=None, pulse_selection=None):
                     if group_path not in processed_hdf:
                         continue
 
-                    for dataset_name in processed_hdf[group_path]:
-                        dataset = processed_hdf[group_path][dataset_name]
+                    group_results = load_plot_results(processed_hdf[group_path], "dn", ("e_square", "time"))
+                    for dataset_name, dataset in group_results.items():
                         voltage = np.sqrt(np.array(dataset["e_square"]))
-                        dn_values = dataset['dn'][:]*1e6
+                        time_values, dn_values = smoothed_points(dataset, "dn", "time",
+                                                                    plot_config.get_layout()["width"], 501)
+                        dn_values = dn_values*1e6
                         # dn_values/=np.max(dn_values)
-                        dn_values = sgf(dn_values, 501, 1)
-                        time_values = dataset['time'][:] - np.min(dataset['time'][:])
+                        time_values = time_values - np.min(time_values)
                         data_list.append((voltage, time_values, dn_values, group_path))
 
     data_list.sort(key=lambda x: x[0], reverse=True)
@@ -0,0 +1,231 @@
+import argparse
+import os
+import tempfile
+import time
+
+import h5py
+from tqdm import tqdm
+
+from configuration import get_experiment_config
+from create_db import dataset_name, is_streamed, quarantine_unreadable, stream_checked_trace, write_checked_trace
+from derived_columns import persisted_results
+from fit_cache import trace_key
+from incremental import update_group
+from lod import lod_pyramid
+from oscilloscope import WAVEFORM_FORMATS, is_record_file, read_waveform_with_header
+from packed_results import append_packed_results
+from process_database import interpret_dataset, store_results
+from raw_db import raw_channel_step, raw_time_step, read_raw_trace, record_stat, source_fingerprint
+from scalar_table import scalar_results
+
+
+def scan_raw_tree(config, raw_root):
+    """
+    Lists (group_path, raw_file, size, mtime_ns) for every raw record under the configured
+    <conc>/<flow>/<pulse> folders of raw_root, in the folder's format (config.ingest).
+    Records whose files are not all present yet are left out.
+    """
+    found = []
+    for conc in config.potentials.concentrations:
+        for flow in config.potentials.flows:
+            for pulse in config.potentials.pulse_width:
+                group_path = f"{conc}/{flow}/{pulse}"
+                fmt = config.ingest.formats.get(group_path, config.ingest.default_format)
+                dir_path = os.path.join(raw_root, conc, str(flow), str(pulse))
+                try:
+                    entries = list(os.scandir(dir_path))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    if is_record_file(entry.name, fmt) and entry.is_file():
+                        try:
+                            size, mtime_ns = record_stat(entry.path)
+                        except FileNotFoundError:
+                            continue
+                        found.append((group_path, entry.path, size, mtime_ns))
+    return sorted(found)
+
+
+def load_ingested(raw_hdf_filename) -> dict:
+    """
+    Maps source path to (size, mtime_ns) for every trace already in the raw database.
+    """
+    ingested = {}
+    if not os.path.exists(raw_hdf_filename):
+        return ingested
+
+    def visit(_, obj):
+        if isinstance(obj, h5py.Dataset) and "source_path" in obj.attrs:
+            ingested[str(obj.attrs["source_path"])] = (int(obj.attrs["source_size"]),
+                                                       int(obj.attrs["source_mtime_ns"]))
+
+    with h5py.File(raw_hdf_filename, 'r') as hdf:
+        hdf.visititems(visit)
+    return ingested
+
+
+def ingest_trace(raw_hdf_filename, group_path, raw_file, config) -> list:
+    """
+    Parses one completed raw record and appends it to the raw database through the quality gate.
+    Returns the quarantine reasons (empty if the trace was accepted).
+    """
+    source = source_fingerprint(raw_file)
+    dset_name = dataset_name(raw_file)
+    if is_streamed(raw_file, config):
+        with h5py.File(raw_hdf_filename, 'a') as raw_hdf:
+            return stream_checked_trace(raw_hdf, group_path, dset_name, raw_file, source, config)
+
+    try:
+        data, header = read_waveform_with_header(raw_file)
+    except Exception as e:
+        with h5py.File(raw_hdf_filename, 'a') as raw_hdf:
+            quarantine_unreadable(raw_hdf, group_path, dset_name, source, str(e))
+        raise
+    with h5py.File(raw_hdf_filename, 'a') as raw_hdf:
+        return write_checked_trace(raw_hdf, group_path, dset_name, data, header, source, config)
+
+
+def process_trace(raw_hdf_filename, processed_hdf_filename, config, group_path, dset_name) -> bool:
+    """
+    Runs interpret_dataset on a single raw trace and stores the result in the processed database,
+    with its fingerprint (see incremental.py). Traces without a DirBoundary entry are processed
+    with st/end at the edges of the field pulse on CH1 (analizer.trace_boundary), the same way
+    process_database does, so an incremental run finds them unchanged. Raises ValueError if no
+    pulse is found, so the trace needs a DirBoundary.
+    """
+    key = f"{group_path}/{dset_name}"
+    boundary = config.directories.boundaries.get(key, None)
+    if boundary is not None and boundary.accept == 0:
+        return False
+
+    with h5py.File(raw_hdf_filename, 'r') as raw_hdf:
+        dset = raw_hdf[key]
+        data, time_step = read_raw_trace(dset, config.setup.cut), raw_time_step(dset)
+        intensity_step = raw_channel_step(dset, 1)
+    fingerprint = trace_key(data, config, key, time_step, intensity_step)
+    results = interpret_dataset(data, config, group_path, dset_name, time_step, intensity_step)
+    results.update(lod_pyramid(results, config.output.lod_factors))
+    stored = persisted_results(results) if config.output.derived_columns else results
+    with h5py.File(processed_hdf_filename, 'a') as processed_hdf:
+        processed_group = processed_hdf.require_group(group_path)
+        if config.output.packed:
+            append_packed_results(processed_group, dset_name, stored)
+        else:
+            store_results(processed_group, dset_name, stored, config.output)
+        update_group(processed_hdf, group_path, {dset_name: scalar_results(results)},
+                     {dset_name: fingerprint})
+    return True
+
+
+def watch(raw_root=None,
+          poll_interval=1.0,
+          settle_polls=2,
+          process=True,
+          max_polls=None) -> None:
+    """
+    Polls the raw tree and ingests (and optionally processes) every new or changed record.
+    A file is considered complete once its size and mtime are unchanged for settle_polls polls.
+    """
+    config = get_experiment_config()
+    raw_root = raw_root if raw_root else config.base_dirs.raw_folder
+    raw_hdf_filename = os.path.join(config.base_dirs.database, "experiment_data_pulses.h5")
+    processed_hdf_filename = os.path.join(config.base_dirs.database, "processed_experiment_data.h5")
+
+    ingested = load_ingested(raw_hdf_filename)
+    pending = {}
+    n_polls = 0
+    print(f"👀 Watching {raw_root} ({len(ingested)} traces already ingested)")
+
+    while max_polls is None or n_polls < max_polls:
+        n_polls += 1
+        for group_path, raw_file, size, mtime_ns in scan_raw_tree(config, raw_root):
+            source_path = os.path.abspath(raw_file)
+            if ingested.get(source_path) == (size, mtime_ns):
+                continue
+
+            last_size, last_mtime_ns, n_stable = pending.get(source_path, (None, None, 0))
+            n_stable = n_stable + 1 if (size, mtime_ns) == (last_size, last_mtime_ns) else 0
+            pending[source_path] = (size, mtime_ns, n_stable)
+            if n_stable < settle_polls:
+                continue
+
+            del pending[source_path]
+            dset_name = dataset_name(raw_file)
+            start = time.perf_counter()
+            ingested[source_path] = (size, mtime_ns)
+            try:
+                reasons = ingest_trace(raw_hdf_filename, group_path, raw_file, config)
+            except Exception as e:
+                tqdm.write(f"❌ Skipping {raw_file} due to error: {e}")
+                continue
+            if reasons:
+                tqdm.write(f"🚫 Quarantined {group_path}/{dset_name}: {', '.join(reasons)}")
+                continue
+
+            processed = False
+            if process:
+                try:
+                    processed = process_trace(raw_hdf_filename, processed_hdf_filename, config, group_path, dset_name)
+                except Exception as e:
+                    tqdm.write(f"❌ Processing {group_path}/{dset_name} failed: {e}")
+
+            status = "ingested + processed" if processed else "ingested"
+            tqdm.write(f"✅ {group_path}/{dset_name} {status} in {time.perf_counter() - start:.2f} s")
+
+        time.sleep(poll_interval)
+
+
+def replay_folder(src_root,
+                  dst_root,
+                  interval=5.0,
+                  write_chunks=4) -> None:
+    """
+    Copies an archived raw tree into dst_root one TEK file at a time, every `interval` seconds,
+    writing each file in several chunks the way the oscilloscope does.
+    """
+    sources = []
+    for root, _, files in os.walk(src_root):
+        for filename in files:
+            if filename.lower().endswith(tuple(WAVEFORM_FORMATS.values())):
+                sources.append(os.path.join(root, filename))
+
+    for src in sorted(sources, key=lambda p: (os.path.getmtime(p), p)):
+        dst = os.path.join(dst_root, os.path.relpath(src, src_root))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+        with open(src, 'rb') as f:
+            payload = f.read()
+        chunk = max(1, len(payload) // write_chunks)
+        with open(dst, 'wb') as f:
+            for i in range(0, len(payload), chunk):
+                f.write(payload[i:i + chunk])
+                f.flush()
+                time.sleep(interval / (2 * write_chunks))
+        print(f"📤 Replayed {os.path.relpath(src, src_root)}")
+        time.sleep(interval / 2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest and process TEK files as they are written.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    watch_parser = subparsers.add_parser("watch", help="Watch the raw folder and ingest new shots")
+    watch_parser.add_argument("--raw-root", default=None, help="Raw folder to watch (default: config raw_folder)")
+    watch_parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between scans")
+    watch_parser.add_argument("--settle-polls", type=int, default=2,
+                              help="Unchanged scans required before a file is considered complete")
+    watch_parser.add_argument("--no-process", action="store_true", help="Only ingest, do not run interpret_dataset")
+
+    replay_parser = subparsers.add_parser("replay", help="Replay an archived raw tree into a directory")
+    replay_parser.add_argument("src", help="Archived raw tree (<conc>/<flow>/<pulse>/TEK*.CSV)")
+    replay_parser.add_argument("--dst", default=None, help="Target directory (default: new temp directory)")
+    replay_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between shots")
+
+    args = parser.parse_args()
+
+    if args.command == "watch":
+        watch(args.raw_root, args.poll_interval, args.settle_polls, process=not args.no_process)
+    elif args.command == "replay":
+        dst = args.dst if args.dst else tempfile.mkdtemp(prefix="replay_")
+        print(f"Replaying {args.src} into {dst}")
+        replay_folder(args.src, dst, args.interval)